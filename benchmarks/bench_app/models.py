@@ -0,0 +1,12 @@
+from django.db import models
+
+from media_sdk import GenericFileField, Media
+
+
+class BenchItem(Media):
+    title = models.CharField(max_length=20, default='')
+    local_file = GenericFileField(tag='bench_local', null=True, blank=True)
+    s3_file = GenericFileField(tag='bench_s3', null=True, blank=True)
+
+    class Meta:
+        app_label = 'bench_app'
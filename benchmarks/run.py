@@ -0,0 +1,442 @@
+"""
+    Benchmarks of media_sdk hot paths, every backend is a local stand-in
+    (SQLite, moto for S3, tus_stub for tus), so results of two checkouts are comparable:
+
+        python benchmarks/run.py --output before.json
+        git checkout <change> && python benchmarks/run.py --output after.json --compare before.json
+
+    Suites:
+        compress - DriverUtils.compress_content and compress_stream per codec, time, peak memory and
+                   compressed size per content size
+        digest   - single pass content digests of in-memory and on-disk content per content size
+        drivers  - save / url / exists / open / delete of local, s3 and tus drivers per content size
+        listing  - get_all_media in every mode and stream_media for growing amount of rows
+        views    - latency of retrieve, download, media url, listing and batch endpoints
+
+    S3 suites are skipped if moto is not installed ('pip install moto').
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+BENCH_ROOT = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_ROOT)
+
+KB = 1024
+MB = 1024 * KB
+
+SUITES = ('compress', 'digest', 'drivers', 'listing', 'views')
+UNITS = {'B': 1, 'KB': KB, 'MB': MB, 'GB': 1024 * MB}
+
+
+def parse_size(value: str) -> int:
+    """'64KB' -> 65536"""
+    value = value.strip().upper()
+    for unit in sorted(UNITS, key=len, reverse=True):
+        if value.endswith(unit):
+            return int(float(value[:-len(unit)]) * UNITS[unit])
+    return int(value)
+
+
+def format_size(size: int) -> str:
+    for unit in ('GB', 'MB', 'KB'):
+        if size >= UNITS[unit] and size % UNITS[unit] == 0:
+            return '%d%s' % (size // UNITS[unit], unit)
+    return '%dB' % size
+
+
+def parse_list(value: str, convert: Callable = str) -> list:
+    return [convert(item) for item in value.split(',') if item.strip()]
+
+
+def make_payload(size: int) -> bytes:
+    """Hex text of random bytes, compresses about twice, like typical text documents."""
+    return os.urandom(size // 2 + 1).hex().encode('ascii')[:size]
+
+
+def timed(func: Callable, repeat: int, warmup: int = 1) -> Dict[str, float]:
+    """Runs func `warmup` + `repeat` times, ::returns timing stats of measured runs in milliseconds."""
+    for _ in range(warmup):
+        func()
+    durations = []
+    gc.collect()
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - started) * 1000)
+    durations.sort()
+    return {
+        'runs': repeat,
+        'mean_ms': statistics.mean(durations),
+        'median_ms': statistics.median(durations),
+        'p95_ms': durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+        'min_ms': durations[0],
+        'max_ms': durations[-1],
+    }
+
+
+def peak_memory(func: Callable) -> int:
+    """Peak of memory allocated by Python while func runs, in bytes."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class Results:
+    def __init__(self, meta: dict):
+        self.meta = meta
+        self.records = []
+
+    def add(self, suite: str, name: str, params: dict, stats: dict, **extra):
+        record = dict(suite=suite, name=name, params=params, **stats, **extra)
+        self.records.append(record)
+        line = '%-9s %-28s %-28s median %10.3f ms  p95 %10.3f ms' % (
+            suite, name, format_params(params), stats['median_ms'], stats['p95_ms']
+        )
+        if extra.get('peak_memory') is not None:
+            line += '  peak %10.1f KB' % (extra['peak_memory'] / KB)
+        print(line, flush=True)
+
+    def dump(self, path: str):
+        with open(path, 'w') as file:
+            json.dump({'meta': self.meta, 'results': self.records}, file, indent=2)
+
+
+def format_params(params: dict) -> str:
+    return ' '.join('%s=%s' % (key, format_size(value) if key == 'size' else value)
+                    for key, value in sorted(params.items()))
+
+
+def record_key(record: dict) -> str:
+    return '%s/%s/%s' % (record['suite'], record['name'], json.dumps(record['params'], sort_keys=True))
+
+
+def compare(results: Results, baseline_path: str):
+    """Prints median time and peak memory of every result against the same result of the baseline file."""
+    with open(baseline_path) as file:
+        baseline = {record_key(record): record for record in json.load(file)['results']}
+    print('\n%-9s %-28s %-28s %12s %12s %8s %8s' % ('suite', 'name', 'params', 'base ms', 'ms', 'time', 'memory'))
+    for record in results.records:
+        base = baseline.get(record_key(record))
+        if base is None:
+            continue
+        time_ratio = record['median_ms'] / base['median_ms'] if base['median_ms'] else float('nan')
+        memory_ratio = '-'
+        if record.get('peak_memory') and base.get('peak_memory'):
+            memory_ratio = 'x%.2f' % (record['peak_memory'] / base['peak_memory'])
+        print('%-9s %-28s %-28s %12.3f %12.3f %8s %8s' % (
+            record['suite'], record['name'], format_params(record['params']),
+            base['median_ms'], record['median_ms'], 'x%.2f' % time_ratio, memory_ratio
+        ))
+
+
+def get_meta(args) -> dict:
+    import django
+
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        'revision': revision,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'platform': platform.platform(),
+        'args': vars(args),
+    }
+
+
+def setup_django(bench_dir: str, tus_url: str):
+    os.environ['BENCH_DIR'] = bench_dir
+    os.environ['BENCH_TUS_URL'] = tus_url
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'settings'
+    # moto accepts any credentials, real ones must never be used
+    for variable, value in (('AWS_ACCESS_KEY_ID', 'bench'), ('AWS_SECRET_ACCESS_KEY', 'bench'),
+                            ('AWS_DEFAULT_REGION', 'us-east-1')):
+        os.environ[variable] = value
+    sys.path[:0] = [BENCH_ROOT, REPO_ROOT]
+
+    import django
+    from django.core.management import call_command
+
+    django.setup()
+    call_command('migrate', run_syncdb=True, verbosity=0)
+
+
+def start_s3():
+    """::returns started moto mock with the benchmark bucket, None if moto is not installed"""
+    try:
+        from moto import mock_aws
+    except ImportError:
+        try:
+            from moto import mock_s3 as mock_aws
+        except ImportError:
+            print('moto is not installed, S3 benchmarks are skipped', file=sys.stderr)
+            return None
+    import boto3
+    from django.conf import settings
+
+    mock = mock_aws()
+    mock.start()
+    configs = settings.STORAGE_OPTIONS['bench_s3']['configs']
+    boto3.client('s3', region_name=configs['region_name']).create_bucket(Bucket=configs['bucket'])
+    return mock
+
+
+def get_storages(s3: bool) -> dict:
+    from media_sdk.services.media_storage import CustomStorage
+
+    storages = {'local': CustomStorage('bench_local'), 'tus': CustomStorage('bench_tus')}
+    if s3:
+        storages['s3'] = CustomStorage('bench_s3')
+    return storages
+
+
+def drain(stream, chunk_size: int = 8 * MB):
+    while stream.read(chunk_size):
+        pass
+
+
+def get_codecs() -> List[str]:
+    """Codecs whose optional packages are installed."""
+    from django.core.exceptions import ImproperlyConfigured
+
+    from media_sdk.services.compression import CODECS
+
+    codecs = []
+    for name, codec in CODECS.items():
+        try:
+            codec.check()
+        except ImproperlyConfigured:
+            print("'%s' is not installed, its compression benchmarks are skipped" % name, file=sys.stderr)
+            continue
+        codecs.append(name)
+    return codecs
+
+
+def bench_compress(results: Results, args):
+    from media_sdk.services.media_storage import DriverUtils
+
+    codecs = get_codecs()
+    for size in args.sizes:
+        content = io.BytesIO(make_payload(size))
+        repeat = args.repeat if size < 64 * MB else max(1, args.repeat // 4)
+        for codec in codecs:
+            params = {'size': size, 'codec': codec}
+            compressed_size = len(DriverUtils.compress_content(content, codec=codec).getvalue())
+
+            def compress_content():
+                drain(DriverUtils.compress_content(content, codec=codec))
+
+            def compress_stream():
+                drain(DriverUtils.compress_stream(content, chunk_size=8 * MB, codec=codec))
+
+            for name, func in (('compress_content', compress_content), ('compress_stream', compress_stream)):
+                results.add('compress', name, params, timed(func, repeat), peak_memory=peak_memory(func),
+                            compressed_size=compressed_size)
+
+
+def bench_digest(results: Results, args):
+    from django.core.files.base import ContentFile, File
+
+    from media_sdk.services.content_digest import compute_digests
+
+    for size in args.sizes:
+        payload = make_payload(size)
+        repeat = args.repeat if size < 64 * MB else max(1, args.repeat // 4)
+        with tempfile.NamedTemporaryFile() as file:
+            file.write(payload)
+            file.flush()
+            with open(file.name, 'rb') as disk_file:
+                for source, content in (('memory', ContentFile(payload)), ('disk', File(disk_file))):
+                    for algorithms in (('sha256',), ('md5', 'sha256', 'crc32')):
+                        params = {'size': size, 'source': source, 'algorithms': '+'.join(algorithms)}
+
+                        def digest():
+                            compute_digests(content, algorithms)
+
+                        results.add('digest', 'compute_digests', params, timed(digest, repeat),
+                                    peak_memory=peak_memory(digest))
+
+
+def bench_drivers(results: Results, args, storages: dict):
+    from django.core.files.base import ContentFile
+
+    for driver, storage in storages.items():
+        for size in args.sizes:
+            payload = make_payload(size)
+            params = {'driver': driver, 'size': size}
+            repeat = args.repeat if size < 64 * MB else max(1, args.repeat // 4)
+            names = []
+
+            def save():
+                names.append(storage.save('bench/file.txt', ContentFile(payload, name='file.txt')))
+
+            results.add('drivers', 'save', params, timed(save, repeat))
+            name = names[-1]
+            if driver == 'tus':
+                continue
+            results.add('drivers', 'url', params, timed(lambda: storage.url(name), args.repeat))
+            results.add('drivers', 'exists', params, timed(lambda: storage.exists(name), args.repeat))
+
+            def read():
+                with storage.open(name) as file:
+                    drain(file)
+
+            results.add('drivers', 'open', params, timed(read, repeat))
+            results.add('drivers', 'delete', params, timed(lambda: storage.delete(names.pop()), len(names) - 1))
+
+
+def fill_rows(model, rows: int):
+    """Adds rows up to `rows`, file columns reference names only, nothing is stored."""
+    existing = model.objects.count()
+    batch_size = 10000
+    for start in range(existing, rows, batch_size):
+        model.objects.bulk_create([
+            model(title=str(index), local_file='bench/%d.txt' % index, s3_file='Public/bench/%d.txt' % index)
+            for index in range(start, min(start + batch_size, rows))
+        ], batch_size=batch_size)
+
+
+def bench_listing(results: Results, args):
+    from bench_app.models import BenchItem
+    from media_sdk.utils import get_all_media, get_media_models, stream_media
+
+    origin = 'http://testserver/media-url/'
+    for rows in sorted(args.rows):
+        fill_rows(BenchItem, rows)
+        params = {'rows': rows}
+        repeat = args.listing_repeat
+
+        def stream():
+            for _ in stream_media(origin, get_media_models()):
+                pass
+
+        cases = (
+            ('get_all_media', lambda: get_all_media(origin)),
+            ('stream_media', stream),
+            ('get_all_media_page', lambda: get_all_media(origin, limit=1000, after=rows // 2)),
+            ('get_all_media_count', lambda: get_all_media(origin, mode='count')),
+            ('get_all_media_ranges', lambda: get_all_media(origin, mode='ranges')),
+        )
+        for name, func in cases:
+            results.add('listing', name, params, timed(func, repeat), peak_memory=peak_memory(func))
+
+
+def bench_views(results: Results, args, s3: bool):
+    from django.core.files.base import ContentFile
+    from django.test import Client
+
+    from bench_app.models import BenchItem
+    from media_sdk import save_multy_files
+
+    client = Client()
+    payload = make_payload(args.view_size)
+    fields_data = {'bench_local': {'name': 'view.txt', 'content': ContentFile(payload, name='view.txt')}}
+    if s3:
+        fields_data['bench_s3'] = {'name': 'view.txt', 'content': ContentFile(payload, name='view.txt')}
+    item = save_multy_files(BenchItem, fields_data)
+    params = {'size': args.view_size}
+
+    def get(path, **headers):
+        def request():
+            response = client.get(path, **headers)
+            assert response.status_code < 400, (path, response.status_code)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            response.close()
+        return request
+
+    cases = [
+        ('retrieve_local', get('/retrieve/bench/bench_local/%d/' % item.pk)),
+        ('retrieve_local_range', get('/retrieve/bench/bench_local/%d/' % item.pk, HTTP_RANGE='bytes=0-1023')),
+        ('download_local', get('/download/bench/bench_local/%d/' % item.pk)),
+        ('media_url_local', get('/media-url/bench/bench_local/%d/' % item.pk)),
+        ('media_url_page', get('/media-url/?limit=1000')),
+        ('media_url_count', get('/media-url/?mode=count')),
+    ]
+    if s3:
+        cases += [
+            ('retrieve_s3', get('/retrieve/bench/bench_s3/%d/' % item.pk)),
+            ('media_url_s3', get('/media-url/bench/bench_s3/%d/' % item.pk)),
+        ]
+    pks = list(BenchItem.objects.order_by('pk').values_list('pk', flat=True)[:args.batch_items])
+    body = json.dumps({'items': [{'model': 'bench', 'tag': 'bench_local', 'pk': pk} for pk in pks]})
+
+    def batch():
+        response = client.post('/media-url-batch/', body, content_type='application/json')
+        assert response.status_code == 200, response.status_code
+
+    cases.append(('media_url_batch', batch))
+    for name, func in cases:
+        results.add('views', name, params, timed(func, args.requests))
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='media_sdk benchmarks')
+    parser.add_argument('--suites', type=lambda value: parse_list(value), default=list(SUITES),
+                        help='comma separated suites: %s (all by default)' % ', '.join(SUITES))
+    parser.add_argument('--sizes', type=lambda value: parse_list(value, parse_size),
+                        default=[64 * KB, MB, 16 * MB, 64 * MB], help='content sizes, e.g. 64KB,1MB,16MB')
+    parser.add_argument('--rows', type=lambda value: parse_list(value, int), default=[10000, 100000],
+                        help='listing table sizes, e.g. 10000,100000,1000000')
+    parser.add_argument('--repeat', type=int, default=10, help='runs of compress and driver operations')
+    parser.add_argument('--listing-repeat', type=int, default=3, help='runs of listing operations')
+    parser.add_argument('--requests', type=int, default=200, help='requests per view')
+    parser.add_argument('--view-size', type=parse_size, default=MB, help='size of the file served by views')
+    parser.add_argument('--batch-items', type=int, default=100, help='items of a batch request')
+    parser.add_argument('--output', help='write results as json to this file')
+    parser.add_argument('--compare', help='json file of an earlier run to compare with')
+    args = parser.parse_args(argv)
+    unknown = set(args.suites) - set(SUITES)
+    if unknown:
+        parser.error('unknown suites: %s' % ', '.join(sorted(unknown)))
+
+    from tus_stub import start_tus_stub
+
+    with tempfile.TemporaryDirectory(prefix='media-sdk-bench-') as bench_dir:
+        tus_server = start_tus_stub()
+        setup_django(bench_dir, 'http://127.0.0.1:%d/files/' % tus_server.server_port)
+        s3_mock = start_s3()
+        results = Results(get_meta(args))
+        try:
+            if 'compress' in args.suites:
+                bench_compress(results, args)
+            if 'digest' in args.suites:
+                bench_digest(results, args)
+            if 'drivers' in args.suites:
+                bench_drivers(results, args, get_storages(s3_mock is not None))
+            if 'listing' in args.suites:
+                bench_listing(results, args)
+            if 'views' in args.suites:
+                bench_views(results, args, s3_mock is not None)
+        finally:
+            if s3_mock is not None:
+                s3_mock.stop()
+            tus_server.shutdown()
+
+    if args.output:
+        results.dump(args.output)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
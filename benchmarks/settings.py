@@ -0,0 +1,53 @@
+"""
+    Settings of the benchmark project, every backend is a local stand-in:
+    SQLite database, moto for S3, tus_stub for the tus server.
+    BENCH_DIR (temporary directory made by run.py) holds database and MEDIA_ROOT,
+    BENCH_TUS_URL is the address of the running tus stub.
+"""
+import os
+
+BENCH_DIR = os.environ['BENCH_DIR']
+
+SECRET_KEY = 'benchmarks'
+DEBUG = False
+ALLOWED_HOSTS = ['*']
+INSTALLED_APPS = ['django.contrib.contenttypes', 'media_sdk', 'bench_app']
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BENCH_DIR, 'db.sqlite3'),
+    }
+}
+ROOT_URLCONF = 'urls'
+MEDIA_ROOT = os.path.join(BENCH_DIR, 'media')
+MEDIA_URL = '/media/'
+USE_TZ = True
+DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+
+STORAGE_OPTIONS = {
+    'bench_local': {
+        'driver': 'local',
+        'configs': {},
+    },
+    'bench_s3': {
+        'driver': 's3',
+        'configs': {
+            'bucket': 'media-sdk-bench',
+            'region_name': 'us-east-1',
+        },
+    },
+    'bench_tus': {
+        'driver': 'tus',
+        'configs': {
+            'url': os.environ.get('BENCH_TUS_URL', 'http://127.0.0.1:1080/files/'),
+            'storing_file': None,
+            'parallel_threshold': 32 * 1024 * 1024,
+        },
+    },
+}
+
+DOWNLOADS = {
+    'bench': 'bench_app.models.BenchItem',
+}
+
+MEDIA_URL_MAX_LIMIT = 1000
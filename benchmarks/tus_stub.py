@@ -0,0 +1,66 @@
+"""
+    In-memory tus server (core protocol, creation and concatenation extensions),
+    just enough for measuring TusStorage locally. Uploads are kept until the process exits.
+"""
+import itertools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class TusStubHandler(BaseHTTPRequestHandler):
+    uploads = {}
+    counter = itertools.count(1)
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, status, headers=None):
+        self.send_response(status)
+        self.send_header('Tus-Resumable', '1.0.0')
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def get_upload(self):
+        return self.uploads.get(self.path.rstrip('/').rsplit('/', 1)[-1])
+
+    def do_OPTIONS(self):
+        self.respond(204, {'Tus-Version': '1.0.0', 'Tus-Extension': 'creation,concatenation'})
+
+    def do_POST(self):
+        concat = self.headers.get('Upload-Concat', '')
+        with self.lock:
+            upload_id = str(next(self.counter))
+            if concat.startswith('final;'):
+                parts = [self.uploads[url.rstrip('/').rsplit('/', 1)[-1]] for url in concat[6:].split()]
+                data = bytearray().join(part['data'] for part in parts)
+                self.uploads[upload_id] = {'data': data, 'length': len(data)}
+            else:
+                self.uploads[upload_id] = {'data': bytearray(), 'length': int(self.headers['Upload-Length'])}
+        self.respond(201, {'Location': '%s/%s' % (self.path.rstrip('/'), upload_id)})
+
+    def do_HEAD(self):
+        upload = self.get_upload()
+        if upload is None:
+            return self.respond(404)
+        self.respond(200, {'Upload-Offset': str(len(upload['data'])), 'Upload-Length': str(upload['length'])})
+
+    def do_PATCH(self):
+        upload = self.get_upload()
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if upload is None:
+            return self.respond(404)
+        if int(self.headers['Upload-Offset']) != len(upload['data']):
+            return self.respond(409)
+        upload['data'] += body
+        self.respond(204, {'Upload-Offset': str(len(upload['data']))})
+
+
+def start_tus_stub(host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+    """Serves the stub in a daemon thread, its url is http://<host>:<server.server_port>/files/."""
+    server = ThreadingHTTPServer((host, port), TusStubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -1,4 +1,22 @@
-from .fields import GenericFileField
-from .models import Media
-from .services.media_service import save_file, save_multy_files
-from .services.media_storage import CustomStorage
+from importlib import import_module
+
+# Exports are imported lazily, so 'media_sdk' may be added to INSTALLED_APPS
+# (models can not be defined while Django populates the apps registry).
+__all__ = ['GenericFileField', 'Media', 'save_bulk', 'save_file', 'save_multy_files', 'CustomStorage']
+
+_exports = {
+    'GenericFileField': '.fields',
+    'Media': '.models',
+    'save_bulk': '.services.media_service',
+    'save_file': '.services.media_service',
+    'save_multy_files': '.services.media_service',
+    'CustomStorage': '.services.media_storage',
+}
+
+
+def __getattr__(name):
+    try:
+        module = _exports[name]
+    except KeyError:
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+    return getattr(import_module(module, __name__), name)
@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class MediaSdkConfig(AppConfig):
+    name = 'media_sdk'
+    verbose_name = 'Media SDK'
+    default_auto_field = 'django.db.models.AutoField'
+
+    def ready(self):
+        from .utils import get_media_registry
+
+        get_media_registry()
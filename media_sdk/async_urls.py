@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.conf.urls.static import static
+from django.urls import path
+
+from .views import (acomplete_media_upload, adownload_media_file,
+                    aretrieve_all_media_urls, aretrieve_media_file,
+                    aretrieve_media_urls_batch,
+                    aretrieve_model_field_media_urls,
+                    aretrieve_model_media_urls, aretrieve_specific_media_url,
+                    astart_media_upload)
+
+urlpatterns = [
+    path("media-url/", aretrieve_all_media_urls),
+    path("media-url-batch/", aretrieve_media_urls_batch),
+    path("media-url/<str:model_name>/", aretrieve_model_media_urls),
+    path("media-url/<str:model_name>/<str:ff_tag>/", aretrieve_model_field_media_urls),
+    path("media-url/<str:model_name>/<str:ff_tag>/<int:pk>/", aretrieve_specific_media_url),
+    path("retrieve/<str:model_name>/<str:ff_tag>/<int:pk>/", aretrieve_media_file),
+    path("download/<str:model_name>/<str:ff_tag>/<int:pk>/", adownload_media_file),
+    path("upload/<str:model_name>/<str:ff_tag>/<int:pk>/", astart_media_upload),
+    path("upload/<str:model_name>/<str:ff_tag>/<int:pk>/complete/", acomplete_media_upload),
+]
+
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
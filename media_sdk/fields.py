@@ -3,10 +3,13 @@ import posixpath
 from typing import Union
 
 from django.conf import settings
+from django.core.files.base import File
 from django.db import models
 from django.db.models.fields.files import FieldFile
 
-from .services.media_storage import CustomStorage
+from .services.content_digest import content_digests
+from .services.media_storage import CustomStorage, DriverUtils
+from .services.renditions import schedule_renditions
 
 
 def get_default_image(tag):
@@ -24,12 +27,49 @@ class GenericFile(FieldFile):
             name = self.generate_filename(self.instance, name, upload_to)
 
         if content:
-            self.name = self.storage.save(
-                name, content, max_length=self.field.max_length
-            )
+            if not hasattr(content, 'chunks'):
+                # wrapped once here, so digests kept on it reach the driver
+                content = File(content, name)
+            self.prepare_digests(name, content)
+            if self.storage.sets.get('dedup', False):
+                self.name = self.save_deduplicated(name, content)
+                # the row may already reference this very file, Media.save drops the previous reference then
+                self.instance.__dict__.setdefault('_referenced_file_names', {})[self.field.attname] = self.name
+            else:
+                self.name = self.storage.save(
+                    name, content, max_length=self.field.max_length
+                )
+            if self.name and self.storage.sets.get('renditions') and self.storage.sets.get('renditions_eager', False):
+                schedule_renditions(self.storage, self.name)
         setattr(self.instance, self.field.name, self.name)
         self._committed = True
 
+    def prepare_digests(self, name, content):
+        """
+            Computes every digest of the save in one pass over the content: sha256 for 'dedup'
+            and the ones the driver sends with the file ('checksum' of S3, tus 'storing_file' key).
+        """
+        algorithms = ['sha256'] if self.storage.sets.get('dedup', False) else []
+        upload_digests = getattr(self.storage, 'upload_digests', None)
+        if upload_digests is not None:
+            algorithms += upload_digests(name, content.size)
+        if algorithms:
+            content_digests(content, algorithms)
+
+    def save_deduplicated(self, name, content):
+        """Stores content once per tag, equal uploads reference the stored file."""
+        from .models import StoredBlob
+
+        digest, size = DriverUtils.hash_content(content)
+        while True:
+            stored_name = StoredBlob.reference(self.field.tag, digest)
+            if stored_name is not None:
+                return stored_name
+            stored_name = self.storage.save(name, content, max_length=self.field.max_length)
+            if stored_name is None or StoredBlob.register(self.field.tag, digest, stored_name, size):
+                return stored_name
+            self.storage.delete(stored_name)
+
     def generate_filename(
         self, instance, filename, upload_to: Union[str, callable] = ""
     ):
@@ -45,14 +85,16 @@ class GenericFileField(models.FileField):
 
     def __init__(self, tag='', **kwargs):
         self.tag = tag
-        self.storage = CustomStorage(tag=self.tag)
         self.default_img_path = get_default_image(tag=self.tag)
         if self.default_img_path:
             kwargs['default'] = self.default_img_path
-        kwargs['storage'] = self.storage
+        kwargs.pop('storage', None)
         super(GenericFileField, self).__init__(**kwargs)
+        # assigned after FileField.__init__, whose `storage or default_storage` would build the driver
+        self.storage = CustomStorage(tag=self.tag)
 
     def deconstruct(self):
         name, path, args, kwargs = super(GenericFileField, self).deconstruct()
         kwargs['tag'] = self.tag
+        kwargs.pop('storage', None)
         return name, path, args, kwargs
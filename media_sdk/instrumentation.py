@@ -0,0 +1,145 @@
+import logging
+import time
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import Signal, receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Sent after every measured operation, sender is the operation name (e.g. 's3.url'),
+# kwargs: operation, duration (seconds), size (bytes or None), error (exception or None)
+media_operation = Signal()
+
+_timings = ContextVar('media_sdk_timings', default=None)
+_NOT_LOADED = object()
+_callback = _NOT_LOADED
+
+
+def get_callback() -> Optional[Callable]:
+    """MEDIA_INSTRUMENTATION setting: callable or its dotted path, called as callback(operation, duration, size, error)."""
+    global _callback
+    if _callback is _NOT_LOADED:
+        callback = getattr(settings, 'MEDIA_INSTRUMENTATION', None)
+        _callback = import_string(callback) if isinstance(callback, str) else callback
+    return _callback
+
+
+@receiver(setting_changed)
+def reset_callback(setting, **kwargs):
+    global _callback
+    if setting == 'MEDIA_INSTRUMENTATION':
+        _callback = _NOT_LOADED
+
+
+def is_enabled() -> bool:
+    return get_callback() is not None or bool(media_operation.receivers) or _timings.get() is not None
+
+
+def record(operation: str, duration: float, size: Optional[int] = None, error: Optional[Exception] = None):
+    timings = _timings.get()
+    if timings is not None:
+        timings[operation] = timings.get(operation, 0.0) + duration
+    callback = get_callback()
+    if callback is not None:
+        try:
+            callback(operation, duration, size, error)
+        except Exception:
+            logger.exception('MEDIA_INSTRUMENTATION callback failed')
+    if media_operation.receivers:
+        media_operation.send_robust(sender=operation, operation=operation, duration=duration, size=size, error=error)
+
+
+def content_size(args, kwargs, result) -> Optional[int]:
+    """Size of `content` argument of save-like methods (self, name, content)."""
+    content = kwargs['content'] if 'content' in kwargs else args[2] if len(args) > 2 else None
+    try:
+        return content.size
+    except (AttributeError, OSError, TypeError):
+        return None
+
+
+def instrument(operation: str, size: Optional[Callable] = None):
+    """
+        Measures the decorated function, `size(args, kwargs, result)` tells bytes it processed.
+        Nothing is measured while nobody listens: no MEDIA_INSTRUMENTATION callback,
+        no media_operation receivers and no Server-Timing collected for the current request.
+    """
+    def decorator(func):
+        @wraps(func)
+        def inner(*args, **kwargs):
+            if not is_enabled():
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as error:
+                record(operation, time.perf_counter() - started, error=error)
+                raise
+            record(operation, time.perf_counter() - started, size(args, kwargs, result) if size else None)
+            return result
+        return inner
+    return decorator
+
+
+class measure:
+    """Context manager measuring a block, same as `instrument` does for functions."""
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.started = None
+
+    def __enter__(self):
+        if is_enabled():
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.started is not None:
+            record(self.operation, time.perf_counter() - self.started, error=exc_value)
+
+
+def format_server_timing(timings: Dict[str, float]) -> str:
+    return ', '.join('{};dur={:.3f}'.format(operation, duration * 1000) for operation, duration in timings.items())
+
+
+def server_timing(view):
+    """Adds Server-Timing header with time of every measured operation, if MEDIA_SERVER_TIMING setting is True."""
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        if not getattr(settings, 'MEDIA_SERVER_TIMING', False):
+            return view(request, *args, **kwargs)
+        timings = {}
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = view(request, *args, **kwargs)
+        finally:
+            _timings.reset(token)
+        timings['total'] = time.perf_counter() - started
+        response['Server-Timing'] = format_server_timing(timings)
+        return response
+    return inner
+
+
+def aserver_timing(view):
+    """server_timing for coroutine views."""
+    @wraps(view)
+    async def inner(request, *args, **kwargs):
+        if not getattr(settings, 'MEDIA_SERVER_TIMING', False):
+            return await view(request, *args, **kwargs)
+        timings = {}
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await view(request, *args, **kwargs)
+        finally:
+            _timings.reset(token)
+        timings['total'] = time.perf_counter() - started
+        response['Server-Timing'] = format_server_timing(timings)
+        return response
+    return inner
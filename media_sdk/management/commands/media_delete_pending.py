@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...models import MEDIA_DELETE_BATCH
+from ...services.media_cleaner import (MEDIA_DELETE_MAX_ATTEMPTS,
+                                       process_pending_deletions)
+
+
+class Command(BaseCommand):
+    help = 'Removes stored files queued for deletion (MEDIA_DEFERRED_DELETE setting) in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=MEDIA_DELETE_BATCH,
+                            help='Amount of files removed per batch.')
+        parser.add_argument('--max-attempts', type=int, default=MEDIA_DELETE_MAX_ATTEMPTS,
+                            help='Files failed this many times are left in the queue untouched.')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running as a background worker.')
+        parser.add_argument('--interval', type=float, default=10,
+                            help='Seconds to sleep between passes with --loop.')
+
+    def handle(self, *args, **options):
+        while True:
+            removed_total = failed_total = 0
+            after = None
+            while True:
+                removed, failed, after = process_pending_deletions(
+                    batch_size=options['batch_size'], max_attempts=options['max_attempts'], after=after
+                )
+                removed_total += removed
+                failed_total += failed
+                if after is None:
+                    break
+            if options['verbosity'] and (removed_total or failed_total or not options['loop']):
+                self.stdout.write(f'Removed: {removed_total}, failed: {failed_total}')
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,77 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import MEDIA_DELETE_BATCH
+from ...services.media_reconciler import (MEDIA_RECONCILE_CHUNK,
+                                          delete_orphans, find_orphans,
+                                          get_storage_groups, supports_merge)
+
+
+class Command(BaseCommand):
+    help = ('Finds stored files no GenericFileField references (orphans of failed saves and deletes) '
+            'in MEDIA_ROOT and S3 buckets of STORAGE_OPTIONS, optionally removes them.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tags', default='',
+                            help='Comma separated tags, only their storages are reconciled (all by default). '
+                                 'Files of other tags sharing the storage are still recognised.')
+        parser.add_argument('--prefix', default='',
+                            help='Reconcile only names starting with it (directory under MEDIA_ROOT for local), '
+                                 'required to --delete local files.')
+        parser.add_argument('--min-age', type=float, default=24 * 3600,
+                            help='Seconds, younger files are skipped as their rows may be not saved yet (1 day).')
+        parser.add_argument('--strategy', choices=('merge', 'set'), default='merge',
+                            help="'merge' - sorted-merge join, constant memory (default); "
+                                 "'set' - referenced names in memory, for databases without binary collation.")
+        parser.add_argument('--delete', action='store_true',
+                            help='Remove found orphans (with renditions and precompressed copies), only report them otherwise.')
+        parser.add_argument('--batch-size', type=int, default=MEDIA_DELETE_BATCH,
+                            help='Amount of orphans removed per delete_many call.')
+        parser.add_argument('--chunk-size', type=int, default=MEDIA_RECONCILE_CHUNK,
+                            help='Rows fetched per database round trip.')
+
+    def handle(self, *args, **options):
+        tags = {tag.strip() for tag in options['tags'].split(',') if tag.strip()}
+        groups = [group for group in get_storage_groups() if not tags or tags.intersection(group.tags)]
+        if not groups:
+            raise CommandError('No local or S3 storage to reconcile.')
+        if options['delete'] and not options['prefix'].strip('/') and any(group.kind == 'local' for group in groups):
+            raise CommandError('MEDIA_ROOT may keep files of other apps, --delete of local storages requires '
+                               '--prefix (directory of your uploads) or --tags of S3 storages only.')
+        now = time.time()
+        for group in groups:
+            strategy = options['strategy']
+            if strategy == 'merge' and not supports_merge(group):
+                self.stderr.write(f"{group}: database can not order names by code points, using 'set' strategy")
+                strategy = 'set'
+            found = size = removed = failed = 0
+            batch = []
+            try:
+                for orphan in find_orphans(group, strategy=strategy, min_age=options['min_age'], now=now,
+                                           prefix=options['prefix'], chunk_size=options['chunk_size']):
+                    found += 1
+                    size += orphan.size
+                    if options['verbosity'] >= 1:
+                        self.stdout.write(f'{group}\t{orphan.name}\t{orphan.size}')
+                    if options['delete']:
+                        batch.append(orphan.name)
+                        if len(batch) >= options['batch_size']:
+                            removed, failed = self.delete(group, batch, removed, failed)
+                            batch = []
+                if batch:
+                    removed, failed = self.delete(group, batch, removed, failed)
+            except ValueError as error:
+                raise CommandError(f'{group}: {error}. Nothing else is removed, run with --strategy set.')
+            summary = f'{group} (tags: {", ".join(group.tags)}): orphans: {found}, bytes: {size}'
+            if options['delete']:
+                summary += f', removed: {removed}, failed: {failed}'
+            self.stdout.write(summary)
+
+    def delete(self, group, names, removed, failed):
+        errors = delete_orphans(group, names)
+        for name in names:
+            if name in errors:
+                self.stderr.write(f'{group}: failed to remove "{name}": {errors[name]}')
+        failed_names = sum(name in errors for name in names)
+        return removed + len(names) - failed_names, failed + failed_names
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_sdk', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag', models.CharField(max_length=255)),
+                ('digest', models.CharField(max_length=64)),
+                ('name', models.CharField(max_length=1024)),
+                ('size', models.BigIntegerField()),
+                ('references', models.PositiveIntegerField(default=1)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='storedblob',
+            index=models.Index(fields=['tag', 'name'], name='media_sdk_s_tag_cd7540_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='storedblob',
+            unique_together={('tag', 'digest')},
+        ),
+    ]
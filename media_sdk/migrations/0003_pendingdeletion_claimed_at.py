@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_sdk', '0002_storedblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pendingdeletion',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,8 +1,136 @@
-from typing import Optional
+from contextlib import nullcontext
+from typing import Dict, List, Optional, Tuple
 
-from django.db import models
+from django.conf import settings
+from django.db import IntegrityError, models, router, transaction
+from django.db.models.fields.files import FieldFile
+from django.db.models.signals import class_prepared
 
 from .fields import GenericFileField
+from .services.renditions import rendition_names
+
+
+MEDIA_DELETE_BATCH = 1000
+
+
+class PendingDeletion(models.Model):
+    """
+        Stored file waiting to be removed by "media_delete_pending" command,
+        see MEDIA_DEFERRED_DELETE setting.
+    """
+    tag = models.CharField(max_length=255)
+    name = models.CharField(max_length=1024)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        app_label = 'media_sdk'
+
+    def __str__(self):
+        return f"{self.tag}: {self.name}"
+
+
+class StoredBlob(models.Model):
+    """
+        Stored file shared by all equal uploads of a tag with 'dedup' config.
+        It is removed from storage only when its last reference is gone.
+    """
+    tag = models.CharField(max_length=255)
+    digest = models.CharField(max_length=64)
+    name = models.CharField(max_length=1024)
+    size = models.BigIntegerField()
+    references = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        app_label = 'media_sdk'
+        unique_together = [('tag', 'digest')]
+        indexes = [models.Index(fields=['tag', 'name'])]
+
+    def __str__(self):
+        return f"{self.tag}: {self.name} x{self.references}"
+
+    @classmethod
+    def reference(cls, tag: str, digest: str) -> Optional[str]:
+        """
+            Adds reference to already stored content.
+            ::returns
+                stored name or None, if content is not stored yet
+        """
+        using = router.db_for_write(cls)
+        with transaction.atomic(using=using):
+            blobs = cls.objects.using(using).filter(tag=tag, digest=digest)
+            if not blobs.update(references=models.F('references') + 1):
+                return None
+            return blobs.values_list('name', flat=True).first()
+
+    @classmethod
+    def register(cls, tag: str, digest: str, name: str, size: int) -> bool:
+        """
+            ::returns
+                False if equal content was stored concurrently, uploaded file should be dropped
+        """
+        using = router.db_for_write(cls)
+        try:
+            with transaction.atomic(using=using):
+                cls.objects.using(using).create(tag=tag, digest=digest, name=name, size=size)
+        except IntegrityError:
+            return False
+        return True
+
+    @classmethod
+    def release(cls, tag: str, name: str) -> bool:
+        """
+            Drops one reference of stored file.
+            ::returns
+                True if file is not referenced anymore and should be removed from storage
+        """
+        using = router.db_for_write(cls)
+        with transaction.atomic(using=using):
+            blob = cls.objects.using(using).select_for_update().filter(tag=tag, name=name).first()
+            if blob is None:
+                return True
+            if blob.references > 1:
+                cls.objects.using(using).filter(pk=blob.pk).update(references=models.F('references') - 1)
+                return False
+            blob.delete()
+            return True
+
+
+def release_stored_file(field: GenericFileField, name: str) -> bool:
+    """
+        ::returns
+            True if stored file may be removed (it is not shared with other rows)
+    """
+    if not field.storage.sets.get('dedup', False):
+        return True
+    return StoredBlob.release(field.tag, name)
+
+
+def delete_stored_files(files: List[Tuple[GenericFileField, str]], using: Optional[str] = None):
+    """
+        Removes (field, stored name) files once the current transaction commits.
+        With MEDIA_DEFERRED_DELETE setting files are queued in PendingDeletion instead,
+        inside the current transaction, so the queue always matches committed rows.
+        Deduplicated files are removed only with their last reference, renditions go with their original.
+    """
+    files = [(field, name) for field, name in files if release_stored_file(field, name)]
+    if not files:
+        return
+    files += [(field, stored_name) for field, name in files for stored_name in rendition_names(field.storage, name)]
+    if getattr(settings, 'MEDIA_DEFERRED_DELETE', False):
+        PendingDeletion.objects.using(using).bulk_create(
+            [PendingDeletion(tag=field.tag, name=name) for field, name in files]
+        )
+        return
+
+    def delete():
+        for field, name in files:
+            field.storage.delete(name)
+
+    transaction.on_commit(delete, using=using)
 
 
 class MediaQuerySet(models.QuerySet):
@@ -12,6 +140,27 @@ class MediaQuerySet(models.QuerySet):
         except Media.DoesNotExist:
             return None
 
+    def delete(self):
+        """Deletes rows and their stored files (non default ones)."""
+        file_fields = self.model.get_generic_file_fields()
+        if not file_fields:
+            return super(MediaQuerySet, self).delete()
+        with transaction.atomic(using=self.db, savepoint=False):
+            files = []
+            rows = self.values_list(*[field.attname for field in file_fields])
+            for row in rows.iterator(chunk_size=MEDIA_DELETE_BATCH):
+                for field, name in zip(file_fields, row):
+                    if name and name != field.default:
+                        files.append((field, name))
+                if len(files) >= MEDIA_DELETE_BATCH:
+                    delete_stored_files(files, self.db)
+                    files = []
+            delete_stored_files(files, self.db)
+            return super(MediaQuerySet, self).delete()
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
 
 class MediaManager(models.Manager):
     def get_queryset(self):
@@ -25,35 +174,112 @@ class Media(models.Model):
     objects = MediaManager.from_queryset(MediaQuerySet)()
 
     def get_generic_file_field_by_tag(self, tag: str):
-        for field in self._meta.fields:
-            if isinstance(field, GenericFileField):
-                if field.tag == tag:
-                    return getattr(self, field.name)
-        return None
-
-    def get_generic_file_fields(self):
-        generic_file_fields = []
-        for field in self._meta.fields:
-            if isinstance(field, GenericFileField):
-                generic_file_fields.append(field)
+        field = self.get_generic_file_fields_by_tag().get(tag)
+        if field is None:
+            return None
+        return getattr(self, field.name)
+
+    @classmethod
+    def get_generic_file_fields(cls) -> List[GenericFileField]:
+        generic_file_fields = cls.__dict__.get('_generic_file_fields')
+        if generic_file_fields is None:
+            generic_file_fields = []
+            for field in cls._meta.fields:
+                if isinstance(field, GenericFileField):
+                    generic_file_fields.append(field)
+            cls._generic_file_fields = generic_file_fields
         return generic_file_fields
 
+    @classmethod
+    def get_generic_file_fields_by_tag(cls) -> Dict[str, GenericFileField]:
+        fields_by_tag = cls.__dict__.get('_generic_file_fields_by_tag')
+        if fields_by_tag is None:
+            fields_by_tag = {}
+            for field in cls.get_generic_file_fields():
+                fields_by_tag.setdefault(field.tag, field)
+            cls._generic_file_fields_by_tag = fields_by_tag
+        return fields_by_tag
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Media, cls).from_db(db, field_names, values)
+        instance.remember_file_names()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super(Media, self).refresh_from_db(*args, **kwargs)
+        self.remember_file_names()
+
+    def remember_file_names(self, fields: Optional[List[GenericFileField]] = None):
+        """
+            Stores names of loaded (not deferred) file fields to detect replaced files without a query.
+            ::params
+                fields - file fields the row holds the current names of (written or loaded), all by default
+        """
+        fields = self.get_generic_file_fields() if fields is None else fields
+        referenced_file_names = self.__dict__.get('_referenced_file_names', {})
+        original_file_names = self.__dict__.setdefault('_original_file_names', {})
+        for field in fields:
+            referenced_file_names.pop(field.attname, None)
+            if field.attname in self.__dict__:
+                value = self.__dict__[field.attname]
+                original_file_names[field.attname] = value.name if isinstance(value, FieldFile) else value
+
+    def get_original_file_names(self, fields: List[GenericFileField], using=None) -> Dict[str, Optional[str]]:
+        original_file_names = dict(self.__dict__.get('_original_file_names', {}))
+        missing = [field.attname for field in fields if field.attname not in original_file_names]
+        if missing:
+            stored = self.__class__._base_manager.using(using or self._state.db).filter(
+                pk=self.pk
+            ).values_list(*missing).first()
+            original_file_names.update(zip(missing, stored or [None] * len(missing)))
+        return original_file_names
+
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        replaced = []
+        file_fields = self.get_generic_file_fields()
+        if update_fields is not None:
+            file_fields = [field for field in file_fields
+                           if field.name in update_fields or field.attname in update_fields]
         if self.pk is not None:
-            old_self = self.__class__.objects.get(pk=self.pk)
-            for field in self.get_generic_file_fields():
-                old_stored_file = getattr(old_self, field.name)
-                new_storing_file = getattr(self, field.name)
-                if old_stored_file and new_storing_file != old_stored_file and old_stored_file != field.default:
-                    old_stored_file.delete(False)
-        return super(Media, self).save(force_insert=False, force_update=False, using=None, update_fields=None)
+            if file_fields:
+                original_file_names = self.get_original_file_names(file_fields, using)
+                referenced_file_names = self.__dict__.get('_referenced_file_names', {})
+                for field in file_fields:
+                    old_name = original_file_names.get(field.attname)
+                    new_storing_file = getattr(self, field.name)
+                    if not old_name or old_name == field.default:
+                        continue
+                    # equal content saved again to a 'dedup' tag got the same name and one more reference
+                    if new_storing_file.name != old_name or referenced_file_names.get(field.attname) == old_name:
+                        replaced.append((field, old_name))
+        using = using or router.db_for_write(self.__class__, instance=self)
+        with transaction.atomic(using=using, savepoint=False) if replaced else nullcontext():
+            result = super(Media, self).save(force_insert=force_insert, force_update=force_update,
+                                             using=using, update_fields=update_fields)
+            delete_stored_files(replaced, using)
+        # file fields left out of update_fields keep their old names in the row
+        self.remember_file_names(file_fields)
+        return result
 
     def delete(self, using=None, keep_parents=False):
+        using = using or router.db_for_write(self.__class__, instance=self)
+        files = []
         for file_field in self.get_generic_file_fields():
             field = getattr(self, file_field.name)
-            if field.name != file_field.default:
-                field.delete(save=False)
-        super(Media, self).delete(using=None, keep_parents=False)
+            if field and field.name != file_field.default:
+                files.append((file_field, field.name))
+        with transaction.atomic(using=using, savepoint=False) if files else nullcontext():
+            delete_stored_files(files, using)
+            return super(Media, self).delete(using=using, keep_parents=keep_parents)
 
     def __str__(self):
         return f"Media #{self.pk}"
+
+
+def index_generic_file_fields(sender, **kwargs):
+    if issubclass(sender, Media):
+        sender.get_generic_file_fields_by_tag()
+
+
+class_prepared.connect(index_generic_file_fields)
@@ -0,0 +1,335 @@
+import os
+import posixpath
+import re
+import uuid
+from mimetypes import guess_type
+from typing import AsyncIterator, Iterable, List, Optional, Tuple
+from urllib.parse import quote
+
+import django
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.asgi import ASGIRequest
+from django.core.handlers.wsgi import WSGIRequest
+from django.http import (FileResponse, HttpResponse, JsonResponse,
+                         StreamingHttpResponse)
+from django.http.response import HttpResponseBase
+from django.shortcuts import redirect
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, parse_http_date_safe
+
+MEDIA_MAX_RANGES = 16
+MEDIA_BLOCK_SIZE = 64 * 1024
+
+OFFLOAD_HEADERS = {
+    'nginx': 'X-Accel-Redirect',
+    'apache': 'X-Sendfile',
+    'lighttpd': 'X-Sendfile',
+}
+
+# StreamingHttpResponse takes async iterators since Django 4.2
+ASYNC_STREAMING = django.VERSION >= (4, 2)
+
+RANGE_RE = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
+
+def parse_range_header(header: Optional[str], size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+        Parses "Range: bytes=..." header.
+        ::returns
+            None - header is absent, malformed or asks too many ranges, whole file should be sent
+            [] - no range is satisfiable (416), always for an empty file
+            [(first byte, last byte), ...] - otherwise
+    """
+    if not header:
+        return None
+    unit, _, ranges_spec = header.partition('=')
+    if unit.strip().lower() != 'bytes':
+        return None
+    specs = ranges_spec.split(',')
+    if len(specs) > getattr(settings, 'MEDIA_MAX_RANGES', MEDIA_MAX_RANGES):
+        return None
+    ranges = []
+    for spec in specs:
+        match = RANGE_RE.match(spec)
+        if not match:
+            return None
+        first, last = match.groups()
+        if not first and not last:
+            return None
+        if not first:
+            suffix = int(last)
+            if suffix == 0 or not size:
+                continue
+            ranges.append((max(size - suffix, 0), size - 1))
+            continue
+        first = int(first)
+        last = int(last) if last else None
+        if last is not None and last < first:
+            return None
+        if first >= size:
+            continue
+        ranges.append((first, size - 1 if last is None else min(last, size - 1)))
+    return ranges
+
+
+def if_range_matches(request: WSGIRequest, etag: Optional[str], last_modified: Optional[int]) -> bool:
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return etag is not None and if_range == etag
+    return last_modified is not None and parse_http_date_safe(if_range) == last_modified
+
+
+def content_disposition(filename: str, as_attachment: bool) -> str:
+    disposition = 'attachment' if as_attachment else 'inline'
+    try:
+        filename.encode('ascii')
+        file_expr = 'filename="{}"'.format(filename.replace('\\', '\\\\').replace('"', r'\"'))
+    except UnicodeEncodeError:
+        file_expr = "filename*=utf-8''{}".format(quote(filename))
+    return '{}; {}'.format(disposition, file_expr)
+
+
+class RangeFile:
+    """
+        File-like object limited to one byte range of `file`.
+        With `sendfile` it exposes fileno(), so a WSGI server's file_wrapper may
+        send the range with os.sendfile (it must respect Content-Length, as gunicorn does).
+    """
+
+    def __init__(self, file, first, last, sendfile=False):
+        self.file = file
+        self.file.seek(first)
+        self.remaining = last - first + 1
+        if sendfile and hasattr(file, 'fileno'):
+            self.fileno = file.fileno
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+class MultiRangeContent:
+    """Iterates multipart/byteranges body in `block_size` chunks."""
+
+    def __init__(self, file, ranges, size, content_type, boundary, block_size):
+        self.file = file
+        self.ranges = ranges
+        self.size = size
+        self.content_type = content_type
+        self.boundary = boundary
+        self.block_size = block_size
+
+    def part_header(self, first, last):
+        return (
+            '\r\n--{}\r\nContent-Type: {}\r\nContent-Range: bytes {}-{}/{}\r\n\r\n'.format(
+                self.boundary, self.content_type, first, last, self.size
+            ).encode('ascii')
+        )
+
+    def closing(self):
+        return '\r\n--{}--\r\n'.format(self.boundary).encode('ascii')
+
+    def __len__(self):
+        length = len(self.closing())
+        for first, last in self.ranges:
+            length += len(self.part_header(first, last)) + last - first + 1
+        return length
+
+    def __iter__(self):
+        for first, last in self.ranges:
+            yield self.part_header(first, last)
+            part = RangeFile(self.file, first, last)
+            for chunk in iter(lambda: part.read(self.block_size), b''):
+                yield chunk
+        yield self.closing()
+
+    def close(self):
+        self.file.close()
+
+
+def ranged_file_response(request: WSGIRequest, file, filename: str, content_type: Optional[str] = None,
+                         as_attachment: bool = False, etag: Optional[str] = None,
+                         block_size: Optional[int] = None, sendfile: bool = False) -> HttpResponseBase:
+    """
+        FileResponse honouring Range and If-Range headers.
+        Bytes are read in `block_size` chunks, never the whole range at once.
+    """
+    block_size = block_size or getattr(settings, 'MEDIA_BLOCK_SIZE', MEDIA_BLOCK_SIZE)
+    content_type = content_type or 'application/octet-stream'
+    stat = os.fstat(file.fileno())
+    size = stat.st_size
+    last_modified = int(stat.st_mtime)
+
+    ranges = None
+    if if_range_matches(request, etag, last_modified):
+        ranges = parse_range_header(request.META.get('HTTP_RANGE'), size)
+
+    if ranges is None:
+        response = FileResponse(file, filename=filename, content_type=content_type, as_attachment=as_attachment)
+        response['Content-Length'] = size
+    elif not ranges:
+        file.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */{}'.format(size)
+    elif len(ranges) == 1:
+        first, last = ranges[0]
+        response = FileResponse(RangeFile(file, first, last, sendfile=sendfile), filename=filename,
+                                content_type=content_type, as_attachment=as_attachment, status=206)
+        response['Content-Range'] = 'bytes {}-{}/{}'.format(first, last, size)
+        response['Content-Length'] = last - first + 1
+    else:
+        boundary = uuid.uuid4().hex
+        content = MultiRangeContent(file, ranges, size, content_type, boundary, block_size)
+        response = StreamingHttpResponse(content, status=206,
+                                         content_type='multipart/byteranges; boundary={}'.format(boundary))
+        response['Content-Length'] = len(content)
+        response['Content-Disposition'] = content_disposition(filename, as_attachment)
+
+    response.block_size = block_size
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def offload_response(storage, name: str, filename: str, content_type: Optional[str] = None,
+                     as_attachment: bool = False) -> HttpResponse:
+    """
+        Empty response asking front-end server to send the file itself.
+        ::params
+            storage - SaveLocal with 'offload' config: 'nginx', 'apache' or 'lighttpd'
+            name - stored name of the file
+    """
+    server = storage.sets['offload']
+    try:
+        header = OFFLOAD_HEADERS[server]
+    except KeyError:
+        raise ImproperlyConfigured("Unknown 'offload' server '%s', use one of: %s" %
+                                   (server, ', '.join(OFFLOAD_HEADERS)))
+    response = HttpResponse(content_type=content_type or 'application/octet-stream')
+    if server == 'nginx':
+        location = storage.sets.get('offload_location', '/protected/')
+        response[header] = posixpath.join(location, quote(name))
+    else:
+        response[header] = storage.path(name)
+    response['Content-Disposition'] = content_disposition(filename, as_attachment)
+    return response
+
+
+def local_file_response(request: WSGIRequest, storage, name: str, as_attachment: bool = False,
+                        etag: Optional[str] = None, encoding: Optional[str] = None) -> HttpResponseBase:
+    """
+        ::params
+            encoding - serve precompressed copy of the file with this content-coding (see SaveLocal.select_encoding)
+    """
+    if storage.sets.get('offload'):
+        filename = posixpath.basename(name)
+        return offload_response(storage, name, filename, guess_type(filename)[0], as_attachment)
+    stored_name = storage.precompressed_name(name, encoding) if encoding else name
+    if as_attachment:
+        file, _ = storage.download(stored_name)
+    else:
+        file, _ = storage.retrieve(stored_name)
+    filename = posixpath.basename(name)
+    response = ranged_file_response(request, file, filename, content_type=guess_type(filename)[0],
+                                    as_attachment=as_attachment, etag=etag,
+                                    block_size=storage.sets.get('block_size'),
+                                    sendfile=storage.sets.get('sendfile', False))
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
+
+
+def cached_file_response(request: WSGIRequest, storage, name: str, as_attachment: bool = False,
+                         etag: Optional[str] = None) -> HttpResponseBase:
+    """
+        Cached copy of CachedStorage file is served like a local one (ranges, 'sendfile'),
+        misses are answered by its backend, unless 'fill_on_retrieve' config fills the cache first.
+    """
+    file = storage.open_cached(name, fill=storage.sets.get('fill_on_retrieve', False))
+    if file is None:
+        backend = storage.backend
+        if backend.__class__.__name__ == 'SaveLocal':
+            return local_file_response(request, backend, name, as_attachment, etag)
+        return redirect(backend.download(name) if as_attachment else backend.retrieve(name))
+    filename = posixpath.basename(name)
+    return ranged_file_response(request, file, filename, content_type=guess_type(filename)[0],
+                                as_attachment=as_attachment, etag=etag, block_size=storage.sets.get('block_size'),
+                                sendfile=storage.sets.get('sendfile', False))
+
+
+def media_file_response(request: WSGIRequest, file_field, as_attachment: bool = False) -> HttpResponseBase:
+    """
+        Response for retrieve/download views.
+        Answers 304/412 from cached validators without touching the file,
+        adds ETag, Last-Modified and 'cache_control' of the field tag.
+    """
+    storage = file_field.storage
+    storage_name = storage.__class__.__name__
+    if storage_name not in ('SaveLocal', 'SaveS3', 'CachedStorage'):
+        return JsonResponse({'status': 'Retrieving not allowed'}, status=401)
+
+    encoding = None
+    if storage_name == 'SaveLocal':
+        encoding = storage.select_encoding(file_field.name, request.META.get('HTTP_ACCEPT_ENCODING'))
+    stored_name = storage.precompressed_name(file_field.name, encoding) if encoding else file_field.name
+    etag, last_modified = storage.validators(stored_name) or (None, None)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if storage_name == 'SaveLocal':
+            response = local_file_response(request, storage, file_field.name, as_attachment, etag, encoding)
+        elif storage_name == 'CachedStorage':
+            response = cached_file_response(request, storage, file_field.name, as_attachment, etag)
+        elif as_attachment:
+            response = redirect(storage.download(file_field.name))
+        else:
+            response = redirect(storage.retrieve(file_field.name))
+
+    if etag is not None:
+        response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    if storage_name == 'SaveLocal' and storage.compression.precompressed:
+        patch_vary_headers(response, ('Accept-Encoding',))
+    cache_control = storage.sets.get('cache_control')
+    if cache_control:
+        patch_cache_control(response, **cache_control)
+    return response
+
+
+async def aiter_chunks(chunks: Iterable[bytes], thread_sensitive: bool = False) -> AsyncIterator[bytes]:
+    """
+        Pulls every chunk of a blocking iterator in a thread.
+        Iterators running ORM queries need `thread_sensitive`, so their cursor stays in one thread.
+    """
+    chunks = iter(chunks)
+    next_chunk = sync_to_async(next, thread_sensitive=thread_sensitive)
+    while True:
+        chunk = await next_chunk(chunks, None)
+        if chunk is None:
+            break
+        yield chunk
+
+
+async def amedia_file_response(request: ASGIRequest, file_field, as_attachment: bool = False) -> HttpResponseBase:
+    """
+        media_file_response for async views.
+        Stat, open and S3 calls run in a thread, local file is read
+        by 'block_size' chunks in threads as well (Django 4.2+).
+    """
+    response = await sync_to_async(media_file_response, thread_sensitive=False)(request, file_field, as_attachment)
+    if ASYNC_STREAMING and response.streaming:
+        response.streaming_content = aiter_chunks(response.streaming_content)
+    return response
@@ -0,0 +1,76 @@
+import logging
+import threading
+import time
+from typing import Optional
+
+import boto3
+from botocore.config import Config
+from botocore.credentials import RefreshableCredentials
+from tusclient import client as tus_client
+
+logger = logging.getLogger(__name__)
+
+CREDENTIALS_FALLBACK_TTL = 900
+
+_clients = {}
+_sessions = {}
+_clients_lock = threading.Lock()
+_unknown_expiry_logged = set()
+
+
+def get_s3_key(configs: dict) -> tuple:
+    return 's3', configs.get('region_name'), configs.get('endpoint_url'), configs.get('max_pool_connections', 10)
+
+
+def get_s3_client(configs: dict):
+    """
+        One boto3 S3 client per ('region_name', 'endpoint_url', 'max_pool_connections') configs,
+        shared by all SaveS3 drivers. boto3 clients are thread-safe and keep connections alive.
+    """
+    key = get_s3_key(configs)
+    with _clients_lock:
+        s3_client = _clients.get(key)
+        if s3_client is None:
+            # Default boto3 session is not thread-safe, every client gets its own session
+            session = boto3.session.Session()
+            s3_client = session.client(
+                's3', region_name=key[1], endpoint_url=key[2], config=Config(max_pool_connections=key[3])
+            )
+            _clients[key] = s3_client
+            _sessions[key] = session
+        return s3_client
+
+
+def get_credentials_expiry(configs: dict) -> Optional[float]:
+    """
+        Timestamp the credentials of the S3 client of `configs` expire at: temporary ones
+        (assumed role, instance profile, SSO) are refreshed by botocore, urls signed before
+        stop working then. None for long-term keys.
+        botocore has no public getter for the expiry; when its private attribute is missing,
+        refreshable credentials are assumed to expire 'credentials_fallback_ttl' seconds from now.
+    """
+    key = get_s3_key(configs)
+    session = _sessions.get(key)
+    credentials = session.get_credentials() if session is not None else None
+    if not isinstance(credentials, RefreshableCredentials):
+        return None
+    expiry_time = getattr(credentials, '_expiry_time', None)
+    if expiry_time is not None:
+        return expiry_time.timestamp()
+    fallback_ttl = configs.get('credentials_fallback_ttl', CREDENTIALS_FALLBACK_TTL)
+    if key not in _unknown_expiry_logged:
+        _unknown_expiry_logged.add(key)
+        logger.warning('Expiry of temporary S3 credentials is unknown, signed urls are cached for %s seconds at most',
+                       fallback_ttl)
+    return time.time() + fallback_ttl
+
+
+def get_tus_client(url: str, headers: dict):
+    """One TusClient per (url, headers) shared by all TusStorage drivers."""
+    key = ('tus', url, tuple(sorted(headers.items())))
+    with _clients_lock:
+        shared_client = _clients.get(key)
+        if shared_client is None:
+            shared_client = tus_client.TusClient(url=url, headers=dict(headers))
+            _clients[key] = shared_client
+        return shared_client
@@ -0,0 +1,275 @@
+import io
+import time
+import zlib
+from fnmatch import fnmatch
+from typing import Dict, List, Optional, Tuple
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.encoding import force_bytes
+
+from ..instrumentation import is_enabled, record
+
+MB = 1024 * 1024
+
+COMPRESSED_TYPES = (
+    'video/*', 'audio/*', 'image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/avif',
+    'application/zip', 'application/gzip', 'application/x-gzip', 'application/x-bzip2',
+    'application/x-7z-compressed', 'application/x-rar-compressed', 'application/x-xz',
+    'application/zstd',
+)
+
+
+class Codec:
+    """
+        Content-coding: `encoding` is its HTTP name (Content-Encoding), `extension` - suffix of precompressed files.
+        compressor() and decompressor() objects have compress/decompress(bytes) and flush() methods.
+    """
+    name = None
+    encoding = None
+    extension = None
+    default_level = None
+
+    def check(self):
+        """Raises ImproperlyConfigured if the codec can not be used."""
+
+    def compressor(self, level: int):
+        raise NotImplementedError
+
+    def decompressor(self):
+        raise NotImplementedError
+
+
+class GzipCodec(Codec):
+    name = 'gzip'
+    encoding = 'gzip'
+    extension = '.gz'
+    default_level = 9
+
+    def compressor(self, level: int):
+        return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def decompressor(self):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+
+class BrotliCodec(Codec):
+    """Requires Brotli package, quality 0-11, 11 is very slow for uploads."""
+    name = 'br'
+    encoding = 'br'
+    extension = '.br'
+    default_level = 5
+
+    class Adapter:
+        def __init__(self, process, finish):
+            self.process = process
+            self.finish = finish
+
+        def compress(self, data):
+            return self.process(data)
+
+        def decompress(self, data):
+            return self.process(data)
+
+        def flush(self):
+            return self.finish() if self.finish else b''
+
+    @staticmethod
+    def module():
+        try:
+            import brotli
+        except ImportError:
+            raise ImproperlyConfigured("'br' compression requires Brotli, install it with 'pip install Brotli'")
+        return brotli
+
+    def check(self):
+        self.module()
+
+    def compressor(self, level: int):
+        compressor = self.module().Compressor(quality=level)
+        return self.Adapter(compressor.process, compressor.finish)
+
+    def decompressor(self):
+        decompressor = self.module().Decompressor()
+        return self.Adapter(decompressor.process, None)
+
+
+class ZstdCodec(Codec):
+    """Requires zstandard package, levels 1-22."""
+    name = 'zstd'
+    encoding = 'zstd'
+    extension = '.zst'
+    default_level = 3
+
+    @staticmethod
+    def module():
+        try:
+            import zstandard
+        except ImportError:
+            raise ImproperlyConfigured("'zstd' compression requires zstandard, install it with 'pip install zstandard'")
+        return zstandard
+
+    def check(self):
+        self.module()
+
+    def compressor(self, level: int):
+        return self.module().ZstdCompressor(level=level).compressobj()
+
+    def decompressor(self):
+        return self.module().ZstdDecompressor().decompressobj()
+
+
+CODECS = {codec.name: codec for codec in (GzipCodec(), BrotliCodec(), ZstdCodec())}
+
+
+def get_codec(name: Optional[str]) -> Optional[Codec]:
+    """Codec by its config name: 'gzip', 'br' or 'zstd'; None or 'none' - no compression."""
+    if not name or name == 'none':
+        return None
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ImproperlyConfigured("Unknown compression '%s', use one of: none, %s" % (name, ', '.join(CODECS)))
+
+
+def get_codec_by_encoding(encoding: Optional[str]) -> Optional[Codec]:
+    for codec in CODECS.values():
+        if codec.encoding == encoding:
+            return codec
+    return None
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """'br;q=1.0, gzip;q=0.8, *;q=0' -> {'br': 1.0, 'gzip': 0.8, '*': 0.0}"""
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+
+class CompressionPolicy:
+    """
+        Compression configs of a tag:
+            'compression' - codec of stored files ('gzip', 'br', 'zstd' or 'none'),
+            'compression_level' - its level ('gzip_level' for gzip, codec default otherwise),
+            'compression_types' - mime patterns to compress (allowlist); without it everything
+                                  but 'gzip_skip_types' (COMPRESSED_TYPES by default) is compressed,
+            'compression_min_size' - bytes, smaller files are stored as is,
+            'precompressed' - codecs of compressed copies stored next to the file: ['br', 'gzip']
+                              or with levels {'br': 9, 'gzip': 9}.
+    """
+
+    def __init__(self, configs: dict, default_codec: Optional[str] = None):
+        self.codec = get_codec(configs.get('compression', default_codec))
+        level = configs.get('compression_level')
+        if level is None and self.codec is not None:
+            level = configs.get('gzip_level') if self.codec.name == 'gzip' else None
+        self.level = self.codec.default_level if level is None and self.codec else level
+        self.types = configs.get('compression_types')
+        self.skip_types = configs.get('gzip_skip_types', COMPRESSED_TYPES)
+        self.min_size = configs.get('compression_min_size', 0)
+        precompressed = configs.get('precompressed') or ()
+        if not isinstance(precompressed, dict):
+            precompressed = dict.fromkeys(precompressed)
+        self.precompressed = []  # [(codec, level)] in server preference order
+        for name, level in precompressed.items():
+            if name not in CODECS:
+                # 'none' copy would be the file itself
+                raise ImproperlyConfigured(
+                    "Unknown precompressed codec '%s', use some of: %s" % (name, ', '.join(CODECS))
+                )
+            codec = CODECS[name]
+            self.precompressed.append((codec, codec.default_level if level is None else level))
+        # missing optional packages fail when the driver is built, not in the middle of a save
+        for codec in [self.codec] + [codec for codec, _ in self.precompressed]:
+            if codec is not None:
+                codec.check()
+
+    def applies(self, content_type: Optional[str], size: Optional[int] = None) -> bool:
+        if size is not None and size < self.min_size:
+            return False
+        if self.types is not None:
+            return bool(content_type) and any(fnmatch(content_type, pattern) for pattern in self.types)
+        return not content_type or not any(fnmatch(content_type, pattern) for pattern in self.skip_types)
+
+    def codec_for(self, content_type: Optional[str], size: Optional[int] = None) -> Optional[Codec]:
+        """Codec to store the file with, None - stored as is."""
+        if self.codec is None or not self.applies(content_type, size):
+            return None
+        return self.codec
+
+    def precompressed_for(self, content_type: Optional[str], size: Optional[int] = None) -> List[Tuple[Codec, int]]:
+        if not self.precompressed or not self.applies(content_type, size):
+            return []
+        return self.precompressed
+
+
+class CompressedStream(io.RawIOBase):
+    """
+        Readable file-like object, compresses `content` chunk by chunk while it is read.
+        Time spent compressing and bytes read are reported as the codec name operation ('gzip', 'br', 'zstd').
+    """
+
+    def __init__(self, content, codec: Codec, level: Optional[int] = None, chunk_size: int = MB):
+        self.content = content
+        self.codec = codec
+        self.chunk_size = chunk_size
+        self.compressor = codec.compressor(codec.default_level if level is None else level)
+        self.buffer = bytearray()
+        self.finished = False
+        self.measured = is_enabled()
+        self.duration = 0.0
+        self.size = 0
+
+    def readable(self):
+        return True
+
+    def _fill(self):
+        chunk = self.content.read(self.chunk_size)
+        started = time.perf_counter() if self.measured else None
+        if chunk:
+            self.size += len(chunk)
+            self.buffer += self.compressor.compress(chunk if isinstance(chunk, bytes) else force_bytes(chunk))
+        else:
+            self.buffer += self.compressor.flush()
+            self.finished = True
+        if started is not None:
+            self.duration += time.perf_counter() - started
+            if self.finished:
+                record(self.codec.name, self.duration, self.size)
+
+    def read(self, size=-1):
+        while not self.finished and (size is None or size < 0 or len(self.buffer) < size):
+            self._fill()
+        if size is None or size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+def decompress_into(source, file, codec: Codec, chunk_size: int = MB):
+    """Writes decompressed content of readable `source` into `file`."""
+    decompressor = codec.decompressor()
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        file.write(decompressor.decompress(chunk))
+    file.write(decompressor.flush())
@@ -0,0 +1,181 @@
+import base64
+import hashlib
+import io
+import mmap
+import os
+import stat
+import zlib
+from typing import Dict, Iterable, Iterator, Optional
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.encoding import force_bytes
+
+from ..instrumentation import instrument
+
+MB = 1024 * 1024
+
+
+class Crc32:
+    """hashlib-like CRC32 (zlib), digest is 4 big-endian bytes as S3 expects it."""
+
+    def __init__(self):
+        self.value = 0
+
+    def update(self, data):
+        self.value = zlib.crc32(data, self.value)
+
+    def digest(self) -> bytes:
+        return self.value.to_bytes(4, 'big')
+
+
+class Crc32c(Crc32):
+    """CRC32C (Castagnoli), requires crc32c package."""
+
+    def __init__(self):
+        super(Crc32c, self).__init__()
+        self.crc32c = self.module().crc32c
+
+    @staticmethod
+    def module():
+        try:
+            import crc32c
+        except ImportError:
+            raise ImproperlyConfigured("'crc32c' digest requires crc32c, install it with 'pip install crc32c'")
+        return crc32c
+
+    def update(self, data):
+        self.value = self.crc32c(data, self.value)
+
+
+DIGESTS = {
+    'md5': hashlib.md5,
+    'sha1': hashlib.sha1,
+    'sha256': hashlib.sha256,
+    'crc32': Crc32,
+    'crc32c': Crc32c,
+}
+
+
+def check_digest(algorithm: str):
+    """Raises ImproperlyConfigured for unknown algorithm or missing optional package."""
+    if algorithm not in DIGESTS:
+        raise ImproperlyConfigured("Unknown digest '%s', use one of: %s" % (algorithm, ', '.join(DIGESTS)))
+    if algorithm == 'crc32c':
+        Crc32c.module()
+
+
+class ContentDigests:
+    """Digests (raw bytes by algorithm name) and size of a content."""
+
+    def __init__(self, digests: Dict[str, bytes], size: int):
+        self.digests = digests
+        self.size = size
+
+    def __contains__(self, algorithm: str):
+        return algorithm in self.digests
+
+    def hex(self, algorithm: str) -> str:
+        return self.digests[algorithm].hex()
+
+    def base64(self, algorithm: str) -> str:
+        """Form of Content-MD5 and x-amz-checksum-* headers."""
+        return base64.b64encode(self.digests[algorithm]).decode('ascii')
+
+
+def iter_slices(view: memoryview, chunk_size: int) -> Iterator[memoryview]:
+    """Slices are released once consumed, so the mapping can be closed and BytesIO written again."""
+    for start in range(0, len(view), chunk_size):
+        chunk = view[start:start + chunk_size]
+        yield chunk
+        chunk.release()
+
+
+def get_stream(content):
+    while not isinstance(content, io.IOBase) and hasattr(content, 'file'):
+        content = content.file
+    return content
+
+
+def get_disk_file(content) -> Optional[io.IOBase]:
+    """Binary file on disk under Django File / UploadedFile wrappers, None for anything else."""
+    file = get_stream(content)
+    if not isinstance(file, (io.FileIO, io.BufferedReader, io.BufferedRandom)):
+        return None
+    try:
+        if not stat.S_ISREG(os.fstat(file.fileno()).st_mode):
+            return None
+    except (OSError, ValueError):
+        return None
+    return file
+
+
+def iter_views(content, chunk_size: int = MB) -> Iterator:
+    """
+        Chunks of the content from its start for hashing without copies where possible:
+        memoryview slices of mmap for files on disk (pages come from the page cache, nothing is
+        copied into Python), of BytesIO buffer for in-memory content, readinto one reused buffer
+        for other binary streams, read() for the rest (e.g. text).
+    """
+    disk_file = get_disk_file(content)
+    if disk_file is not None and os.fstat(disk_file.fileno()).st_size:
+        with mmap.mmap(disk_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                yield from iter_slices(view, chunk_size)
+        return
+
+    stream = get_stream(content)
+    if isinstance(stream, io.BytesIO):
+        with stream.getbuffer() as view:
+            yield from iter_slices(view, chunk_size)
+        return
+
+    content.seek(0)
+    if isinstance(stream, (io.BufferedIOBase, io.RawIOBase)):
+        with memoryview(bytearray(chunk_size)) as view:
+            while True:
+                read = stream.readinto(view)
+                if not read:
+                    break
+                with view[:read] as chunk:
+                    yield chunk
+        return
+
+    while True:
+        chunk = content.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk if isinstance(chunk, bytes) else force_bytes(chunk)
+
+
+@instrument('hash', size=lambda args, kwargs, result: result.size)
+def compute_digests(content, algorithms: Iterable[str], chunk_size: int = MB) -> ContentDigests:
+    """Reads the content once, feeding every chunk to all `algorithms`."""
+    hashers = {algorithm: DIGESTS[algorithm]() for algorithm in algorithms}
+    size = 0
+    for chunk in iter_views(content, chunk_size):
+        size += len(chunk)
+        for hasher in hashers.values():
+            hasher.update(chunk)
+    content.seek(0)
+    return ContentDigests({algorithm: hasher.digest() for algorithm, hasher in hashers.items()}, size)
+
+
+def content_digests(content, algorithms: Iterable[str], chunk_size: int = MB) -> ContentDigests:
+    """
+        Digests of the content, computed once per content object: they are kept on it,
+        so dedup, driver checksums and tus fingerprint of one save share a single pass.
+        GenericFile.save asks for all of them at once, later calls read nothing.
+    """
+    known = getattr(content, '_media_digests', None)
+    missing = [algorithm for algorithm in dict.fromkeys(algorithms) if known is None or algorithm not in known]
+    if not missing:
+        return known
+    computed = compute_digests(content, missing, chunk_size)
+    if known is not None:
+        computed.digests = dict(known.digests, **computed.digests)
+    try:
+        content._media_digests = computed
+    except AttributeError:
+        pass
+    return computed
+
@@ -0,0 +1,152 @@
+import math
+from typing import List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core import signing
+from django.db.models import Model
+from django.utils.module_loading import import_string
+
+from ..fields import GenericFileField
+from .renditions import schedule_renditions
+
+MB = 1024 * 1024
+
+S3_MIN_PART_SIZE = 5 * MB
+S3_MAX_PARTS = 10000
+
+UPLOAD_TOKEN_SALT = 'media_sdk.direct_upload'
+
+
+class DirectUploadError(Exception):
+    """Upload can not be started or completed, the message is answered as status."""
+
+
+def get_upload_driver(storage):
+    """
+        S3 driver receiving direct uploads of the tag ('direct_upload' config), backend of 'cached' driver.
+        ::returns
+            SaveS3 or None, if the tag does not take direct uploads
+    """
+    if not storage.sets.get('direct_upload', False) or storage.sets.get('dedup', False):
+        return None
+    driver = getattr(storage, 'backend', storage)
+    if driver.__class__.__name__ != 'SaveS3':
+        return None
+    return driver
+
+
+def has_upload_permission(request, instance: Model, field: GenericFileField) -> bool:
+    """
+        MEDIA_UPLOAD_PERMISSION setting: callable or its dotted path, called as check(request, instance, field).
+        Without it only authenticated users may upload.
+    """
+    check = getattr(settings, 'MEDIA_UPLOAD_PERMISSION', None)
+    if check is None:
+        user = getattr(request, 'user', None)
+        return bool(user is not None and user.is_authenticated)
+    if isinstance(check, str):
+        check = import_string(check)
+    return bool(check(request, instance, field))
+
+
+def get_part_size(driver, size: int) -> int:
+    """'multipart_chunksize', raised so the file fits into S3 limit of parts."""
+    return max(driver.transfer_config.multipart_chunksize, S3_MIN_PART_SIZE, math.ceil(size / S3_MAX_PARTS))
+
+
+def get_upload_expires(storage, driver) -> int:
+    return storage.sets.get('upload_expires', driver.url_expires)
+
+
+def start_direct_upload(instance: Model, field: GenericFileField, filename: str, size: int) -> dict:
+    """
+        Reserves a name for the file of `instance` and signs its upload straight to the bucket:
+        presigned POST form, or presigned part urls for files over 'multipart_threshold'.
+        Nothing is stored in the database until finish_direct_upload().
+        ::returns
+            {'name', 'token', 'expires', 'post': {'url', 'fields'}} or
+            {'name', 'token', 'expires', 'part_size', 'parts': [{'part_number', 'url'}]}
+    """
+    storage = field.storage
+    driver = get_upload_driver(storage)
+    if driver is None:
+        raise DirectUploadError('Direct upload is not available')
+    max_size = storage.sets.get('upload_max_size', 1024 * MB)
+    if size > max_size:
+        raise DirectUploadError('File is too big')
+    expires = get_upload_expires(storage, driver)
+    name = storage.get_available_name(field.generate_filename(instance, filename), max_length=field.max_length)
+    upload = {'model': instance._meta.label, 'pk': instance.pk, 'tag': field.tag, 'name': name, 'max_size': max_size}
+    response = {'name': name, 'expires': expires}
+
+    if size <= driver.transfer_config.multipart_threshold:
+        response['post'] = driver.presign_post(name, max_size, expires)
+    else:
+        part_size = get_part_size(driver, size)
+        upload['upload_id'] = driver.create_multipart(name)
+        urls = driver.presign_parts(name, upload['upload_id'], math.ceil(size / part_size), expires)
+        response['part_size'] = part_size
+        response['parts'] = [{'part_number': number, 'url': url} for number, url in enumerate(urls, 1)]
+    response['token'] = signing.dumps(upload, salt=UPLOAD_TOKEN_SALT, compress=True)
+    return response
+
+
+def read_upload_token(token: str, instance: Model, field: GenericFileField, expires: int) -> dict:
+    """Upload signed by start_direct_upload() for this very instance and field."""
+    try:
+        upload = signing.loads(token, salt=UPLOAD_TOKEN_SALT, max_age=expires)
+    except signing.BadSignature:
+        raise DirectUploadError('Wrong token')
+    if (upload['model'], upload['pk'], upload['tag']) != (instance._meta.label, instance.pk, field.tag):
+        raise DirectUploadError('Wrong token')
+    return upload
+
+
+def finish_direct_upload(instance: Model, field: GenericFileField, token: str,
+                         parts: Optional[List[Tuple[int, str]]] = None) -> str:
+    """
+        Assembles multipart upload from `parts` [(part number, ETag)], checks the object with HEAD
+        and stores its name in the field with save(update_fields=...), the file is not downloaded.
+        The replaced file is removed like on any save of Media.
+        A retried call for already completed upload succeeds.
+        A multipart upload failing here is aborted, its parts are dropped from the bucket;
+        uploads never finished are left to the bucket lifecycle rule (see README).
+        ::returns
+            stored name
+    """
+    storage = field.storage
+    driver = get_upload_driver(storage)
+    if driver is None:
+        raise DirectUploadError('Direct upload is not available')
+    upload = read_upload_token(token, instance, field, get_upload_expires(storage, driver))
+    name = upload['name']
+    if getattr(instance, field.attname).name == name:
+        return name
+
+    upload_id = upload.get('upload_id')
+    if upload_id:
+        if not parts:
+            raise DirectUploadError('Parts are required')
+        try:
+            driver.complete_multipart(name, upload_id, parts)
+        except ClientError:
+            # completed by a previous call, that failed to answer
+            if driver.size(name) is None:
+                driver.abort_multipart(name, upload_id)
+                raise DirectUploadError('Upload is not complete')
+
+    size = driver.size(name)
+    if size is None:
+        raise DirectUploadError('Upload not found')
+    if size > upload['max_size']:
+        storage.delete(name)
+        if upload_id:
+            driver.abort_multipart(name, upload_id)
+        raise DirectUploadError('File is too big')
+
+    setattr(instance, field.attname, name)
+    instance.save(update_fields=[field.attname])
+    if storage.sets.get('renditions') and storage.sets.get('renditions_eager', False):
+        schedule_renditions(storage, name)
+    return name
@@ -0,0 +1,226 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+from django.utils._os import safe_join
+
+logger = logging.getLogger(__name__)
+
+FILL_PREFIX = '.fill-'
+# empty marker next to a pinned file, so pins survive restarts
+PIN_PREFIX = '.pin-'
+# temporary files older than this are leftovers of crashed fills
+STALE_FILL_SECONDS = 3600
+
+
+class CacheOverflow(Exception):
+    """Written file got bigger than the whole cache."""
+
+
+class LimitedWriter:
+    """Binary file wrapper raising CacheOverflow once more than `limit` bytes are written."""
+
+    def __init__(self, file, limit: int):
+        self.file = file
+        self.limit = limit
+        self.written = 0
+
+    def write(self, data) -> int:
+        self.written += len(data)
+        if self.written > self.limit:
+            raise CacheOverflow()
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+class DiskCache:
+    """
+        Files in `location` directory taking at most `max_size` bytes, least recently used are evicted.
+        A file is written into a temporary file and renamed, so readers never see a partial one.
+        Pinned files (not written back yet) are never evicted, their markers on disk
+        pin them again after a restart.
+        Index of files lives in process, it is rebuilt from the directory on start.
+    """
+
+    def __init__(self, location: str, max_size: int):
+        self.location = os.path.abspath(location)
+        self.max_size = max_size
+        self._entries = OrderedDict()  # name -> size, least recently used first
+        self._size = 0
+        self._pinned = set()
+        self._lock = threading.Lock()
+        self._fill_locks = [threading.Lock() for _ in range(64)]
+        os.makedirs(self.location, exist_ok=True)
+        self.load()
+
+    def path(self, name: str) -> str:
+        return safe_join(self.location, name)
+
+    def pin_path(self, name: str) -> str:
+        directory, file_name = os.path.split(self.path(name))
+        return os.path.join(directory, PIN_PREFIX + file_name)
+
+    def load(self):
+        """Indexes files left by previous processes, oldest access first, pinned ones are pinned again."""
+        found = []
+        pins = []
+        now = time.time()
+        for root, _, files in os.walk(self.location):
+            for file_name in files:
+                path = os.path.join(root, file_name)
+                if file_name.startswith(PIN_PREFIX):
+                    pins.append(os.path.join(root, file_name[len(PIN_PREFIX):]))
+                    continue
+                try:
+                    stat = os.stat(path)
+                    if file_name.startswith(FILL_PREFIX):
+                        if stat.st_mtime < now - STALE_FILL_SECONDS:
+                            os.remove(path)
+                        continue
+                except OSError:
+                    continue
+                name = os.path.relpath(path, self.location).replace(os.sep, '/')
+                found.append((stat.st_mtime, name, stat.st_size))
+        with self._lock:
+            for _, name, size in sorted(found):
+                self._entries[name] = size
+                self._size += size
+            for path in pins:
+                name = os.path.relpath(path, self.location).replace(os.sep, '/')
+                if name in self._entries:
+                    self._pinned.add(name)
+                else:
+                    # the process died before the pinned file was stored
+                    self._remove_pin(name)
+            self._evict()
+
+    def pinned(self) -> List[str]:
+        """Names of pinned files, e.g. left by a process that died before writing them back."""
+        with self._lock:
+            return list(self._pinned)
+
+    def get(self, name: str) -> Optional[str]:
+        """::returns path of the cached file, None on miss"""
+        with self._lock:
+            if name not in self._entries:
+                return None
+            self._entries.move_to_end(name)
+        path = self.path(name)
+        try:
+            # access time survives restarts, load() orders by it
+            os.utime(path)
+        except FileNotFoundError:
+            # removed by another process sharing the directory
+            self.discard(name)
+            return None
+        except OSError:
+            pass
+        return path
+
+    def open(self, name: str):
+        """::returns cached file opened for reading, None on miss"""
+        path = self.get(name)
+        if path is None:
+            return None
+        try:
+            return open(path, 'rb')
+        except FileNotFoundError:
+            self.discard(name)
+            return None
+
+    def fill(self, name: str, write: Callable, pin: bool = False, size: Optional[int] = None) -> Optional[str]:
+        """
+            Caches the file `write(file)` writes, its expected `size` is checked before writing.
+            ::returns
+                path of the cached file, None if it is bigger than the whole cache
+        """
+        if size is not None and size > self.max_size:
+            return None
+        path = self.path(name)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix=FILL_PREFIX, dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                limited = LimitedWriter(file, self.max_size)
+                write(limited)
+                size = limited.written
+            if pin:
+                # marker goes first, a file is never stored unpinned before it is written back
+                open(self.pin_path(name), 'wb').close()
+            os.replace(temp_path, path)
+        except CacheOverflow:
+            os.remove(temp_path)
+            return None
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            self._size += size - self._entries.pop(name, 0)
+            self._entries[name] = size
+            if pin:
+                self._pinned.add(name)
+            self._evict()
+        return path
+
+    def get_or_fill(self, name: str, write: Callable) -> Optional[str]:
+        """get(), on miss fill() - once, concurrent misses of the same name wait for it."""
+        path = self.get(name)
+        if path is not None:
+            return path
+        with self._fill_locks[hash(name) % len(self._fill_locks)]:
+            return self.get(name) or self.fill(name, write)
+
+    def unpin(self, name: str):
+        with self._lock:
+            self._pinned.discard(name)
+            self._remove_pin(name)
+            self._evict()
+
+    def discard(self, name: str):
+        with self._lock:
+            self._size -= self._entries.pop(name, 0)
+            self._pinned.discard(name)
+            self._remove_pin(name)
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def _remove_pin(self, name: str):
+        try:
+            os.remove(self.pin_path(name))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        """Holds the lock. Open files stay readable after removal."""
+        for name in list(self._entries):
+            if self._size <= self.max_size:
+                break
+            if name in self._pinned:
+                continue
+            self._size -= self._entries.pop(name)
+            try:
+                os.remove(self.path(name))
+            except OSError as error:
+                logger.warning('Failed to evict cached file "%s": %s', name, error)
+
+    def __contains__(self, name: str):
+        return name in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        return self._size
@@ -0,0 +1,94 @@
+from collections import defaultdict
+from datetime import timedelta
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import MEDIA_DELETE_BATCH, PendingDeletion
+from .media_storage import CustomStorage
+
+MEDIA_DELETE_MAX_ATTEMPTS = 5
+MEDIA_DELETE_CLAIM_TIMEOUT = 600
+
+
+@lru_cache(maxsize=None)
+def get_tag_storage(tag: str):
+    return CustomStorage(tag=tag)
+
+
+def claim_pending_deletions(using: str, batch_size: int, max_attempts: int,
+                            after: Optional[int]) -> List[PendingDeletion]:
+    """
+        Marks one batch of queued files as taken by this worker in a short transaction.
+        Entries claimed longer than MEDIA_DELETE_CLAIM_TIMEOUT seconds ago (600 by default)
+        belong to a worker that died, they are taken again.
+    """
+    now = timezone.now()
+    timeout = getattr(settings, 'MEDIA_DELETE_CLAIM_TIMEOUT', MEDIA_DELETE_CLAIM_TIMEOUT)
+    features = connections[using].features
+    with transaction.atomic(using=using):
+        queryset = PendingDeletion.objects.using(using).filter(
+            Q(claimed_at__isnull=True) | Q(claimed_at__lt=now - timedelta(seconds=timeout)),
+            attempts__lt=max_attempts,
+        ).order_by('pk')
+        if after is not None:
+            queryset = queryset.filter(pk__gt=after)
+        if features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        elif features.has_select_for_update:
+            queryset = queryset.select_for_update()
+        batch = list(queryset[:batch_size])
+        if batch:
+            PendingDeletion.objects.using(using).filter(pk__in=[pending.pk for pending in batch]).update(claimed_at=now)
+    return batch
+
+
+def process_pending_deletions(batch_size: int = MEDIA_DELETE_BATCH, max_attempts: int = MEDIA_DELETE_MAX_ATTEMPTS,
+                              after: Optional[int] = None) -> Tuple[int, int, Optional[int]]:
+    """
+        Removes one batch of files queued in PendingDeletion.
+        Files are grouped by tag and removed with driver's delete_many
+        (S3 delete_objects by 1000 keys, parallel unlinks for local files).
+        The batch is claimed in one transaction, files are removed outside of it
+        and the results are stored in another one, so no row lock is held during requests to storages.
+        Failed files stay in the queue with increased attempts.
+        ::params
+            batch_size - amount of queued files to process
+            max_attempts - files failed this many times are skipped
+            after - process only entries with pk greater than this one
+        ::returns
+            (removed amount, failed amount, last processed pk or None if queue is empty)
+    """
+    using = router.db_for_write(PendingDeletion)
+    batch = claim_pending_deletions(using, batch_size, max_attempts, after)
+    if not batch:
+        return 0, 0, None
+
+    by_tag = defaultdict(list)
+    for pending in batch:
+        by_tag[pending.tag].append(pending)
+
+    removed, failed = [], []
+    for tag, pendings in by_tag.items():
+        names = list(dict.fromkeys(pending.name for pending in pendings))
+        try:
+            errors = get_tag_storage(tag).delete_many(names)
+        except Exception as error:
+            errors = {name: str(error) for name in names}
+        for pending in pendings:
+            if pending.name in errors:
+                pending.attempts += 1
+                pending.last_error = errors[pending.name]
+                pending.claimed_at = None
+                failed.append(pending)
+            else:
+                removed.append(pending.pk)
+
+    with transaction.atomic(using=using):
+        PendingDeletion.objects.using(using).filter(pk__in=removed).delete()
+        PendingDeletion.objects.using(using).bulk_update(failed, ['attempts', 'last_error', 'claimed_at'])
+    return len(removed), len(failed), batch[-1].pk
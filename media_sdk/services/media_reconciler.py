@@ -0,0 +1,316 @@
+import heapq
+import os
+import time
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, models, router
+
+from ..fields import GenericFileField
+from ..models import PendingDeletion, StoredBlob
+from .media_cleaner import get_tag_storage
+from .renditions import get_renditions, rendition_names
+
+try:
+    from django.db.models.functions import Collate
+except ImportError:  # Django < 3.2
+    Collate = None
+
+MEDIA_RECONCILE_CHUNK = 2000
+
+# collations ordering text by code points, the same order S3 lists keys and Python compares strings
+BINARY_COLLATIONS = {
+    'postgresql': 'C',
+    'sqlite': 'BINARY',
+    'mysql': 'utf8mb4_bin',
+    'oracle': 'BINARY',
+}
+
+
+class StoredObject(NamedTuple):
+    name: str
+    size: int
+    modified: float
+
+
+class StorageGroup:
+    """
+        Tags storing files in one place (MEDIA_ROOT or S3 bucket).
+        Files of the place are compared with names referenced by all of them,
+        so a tag never takes files of another one for orphans.
+    """
+
+    def __init__(self, kind: str, location: str, storage):
+        self.kind = kind
+        self.location = location
+        # deletes orphans, 'cached' driver drops cached copies as well
+        self.storage = storage
+        self.tags = []
+        self.prefixes = set()
+
+    def __str__(self):
+        return f'{self.kind}:{self.location}'
+
+    def list_prefixes(self) -> List[str]:
+        """Sorted S3 prefixes of the tags, nested ones are dropped, so listings do not overlap."""
+        prefixes = []
+        for prefix in sorted(self.prefixes):
+            if not any(prefix.startswith(listed) for listed in prefixes):
+                prefixes.append(prefix)
+        return prefixes
+
+
+def get_media_tags() -> List[str]:
+    """Tags of STORAGE_OPTIONS and of GenericFileFields of all installed models."""
+    tags = dict.fromkeys(settings.STORAGE_OPTIONS)
+    for model, field in get_file_fields():
+        tags.setdefault(field.tag)
+    return list(tags)
+
+
+def get_file_fields(tags: Optional[Set[str]] = None) -> List[tuple]:
+    """(model, field) of every GenericFileField of concrete installed models."""
+    file_fields = []
+    for model in apps.get_models():
+        if model._meta.proxy:
+            continue
+        for field in model._meta.concrete_fields:
+            if isinstance(field, GenericFileField) and (tags is None or field.tag in tags):
+                file_fields.append((model, field))
+    return file_fields
+
+
+def get_other_file_fields(group: StorageGroup) -> List[tuple]:
+    """
+        (model, field) of plain FileFields (ImageFields, ...) of installed models
+        storing files right in the directory of a local group, e.g. with default_storage.
+    """
+    if group.kind != 'local':
+        return []
+    file_fields = []
+    for model in apps.get_models():
+        if model._meta.proxy:
+            continue
+        for field in model._meta.concrete_fields:
+            if not isinstance(field, models.FileField) or isinstance(field, GenericFileField):
+                continue
+            location = getattr(field.storage, 'location', None)
+            if location and os.path.abspath(location) == group.location:
+                file_fields.append((model, field))
+    return file_fields
+
+
+def get_referencing_fields(group: StorageGroup) -> List[tuple]:
+    return get_file_fields(set(group.tags)) + get_other_file_fields(group)
+
+
+def get_storage_groups() -> List[StorageGroup]:
+    """
+        Groups tags by the place of their files, 'cached' tags by their backend.
+        tus tags are left out, tus server can not list its files.
+    """
+    groups = {}
+    for tag in get_media_tags():
+        storage = get_tag_storage(tag)
+        backend = getattr(storage, 'backend', storage)
+        driver = backend.__class__.__name__
+        if driver == 'SaveLocal':
+            key = ('local', os.path.abspath(settings.MEDIA_ROOT))
+        elif driver == 'SaveS3':
+            key = ('s3', backend.sets.get('endpoint_url') or '', backend.bucket_name)
+        else:
+            continue
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = StorageGroup(key[0], key[-1], storage)
+        group.tags.append(tag)
+        if driver == 'SaveS3':
+            group.prefixes.add((backend.privat or backend.public).strip('/') + '/')
+    return list(groups.values())
+
+
+def get_binary_collation(model) -> Optional[str]:
+    if Collate is None:
+        return None
+    return BINARY_COLLATIONS.get(connections[router.db_for_read(model)].vendor)
+
+
+def supports_merge(group: StorageGroup) -> bool:
+    """Sorted-merge join needs every referencing table ordered by code points."""
+    referencing_models = [model for model, _ in get_referencing_fields(group)]
+    if apps.is_installed('media_sdk'):
+        referencing_models += [StoredBlob, PendingDeletion]
+    return all(get_binary_collation(model) for model in referencing_models)
+
+
+def ensure_sorted(names: Iterable, source: str) -> Iterator:
+    """Passes names through, raises ValueError if one goes before the previous one."""
+    previous = None
+    for item in names:
+        name = item.name if isinstance(item, StoredObject) else item
+        if previous is not None and name < previous:
+            raise ValueError(f'{source} is not sorted by code points: "{name}" after "{previous}"')
+        previous = name
+        yield item
+
+
+def column_names(model, column: str, collation: Optional[str] = None, chunk_size: int = MEDIA_RECONCILE_CHUNK,
+                 **filters) -> Iterator[str]:
+    """Non empty values of the column in chunks, ordered with `collation` if given."""
+    queryset = model._base_manager.using(router.db_for_read(model)).filter(**filters)
+    queryset = queryset.exclude(**{column + '__isnull': True}).exclude(**{column: ''})
+    queryset = queryset.values_list(column, flat=True)
+    if collation:
+        queryset = queryset.order_by(Collate(column, collation))
+    else:
+        queryset = queryset.order_by()
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+def referenced_streams(group: StorageGroup, ordered: bool, chunk_size: int = MEDIA_RECONCILE_CHUNK) -> List[Iterator]:
+    """
+        Name streams of everything that keeps a file: GenericFileFields of the group tags,
+        plain FileFields storing in MEDIA_ROOT (local groups), 'default' configs,
+        StoredBlob (dedup) and PendingDeletion (already queued for removal).
+    """
+    def stream(model, column, source, **filters):
+        if not ordered:
+            return column_names(model, column, None, chunk_size, **filters)
+        return ensure_sorted(column_names(model, column, get_binary_collation(model), chunk_size, **filters), source)
+
+    streams = [stream(model, field.attname, str(field)) for model, field in get_referencing_fields(group)]
+    defaults = sorted({default for default in (
+        (settings.STORAGE_OPTIONS.get(tag) or {}).get('configs', {}).get('default') for tag in group.tags
+    ) if default})
+    streams.append(iter(defaults))
+    if apps.is_installed('media_sdk'):
+        for model in (StoredBlob, PendingDeletion):
+            streams.append(stream(model, 'name', model.__name__, tag__in=group.tags))
+    return streams
+
+
+def list_local(root: str, prefix: str = '') -> Iterator[StoredObject]:
+    """
+        Walks files under root/prefix with os.scandir in code point order of their relative names:
+        a directory sorts as its name with '/', so 'a.txt' goes before 'a/b.txt' like in S3.
+    """
+    def walk(directory, relative):
+        try:
+            with os.scandir(directory) as scan:
+                entries = [(entry.name + '/' if entry.is_dir(follow_symlinks=False) else entry.name, entry)
+                           for entry in scan]
+        except FileNotFoundError:
+            return
+        for sort_name, entry in sorted(entries, key=lambda pair: pair[0]):
+            if sort_name.endswith('/'):
+                yield from walk(entry.path, relative + sort_name)
+            elif entry.is_file(follow_symlinks=False):
+                stat = entry.stat(follow_symlinks=False)
+                yield StoredObject(relative + entry.name, stat.st_size, stat.st_mtime)
+
+    prefix = prefix.strip('/')
+    return walk(os.path.join(root, prefix) if prefix else root, prefix + '/' if prefix else '')
+
+
+def list_s3(storage, prefixes: List[str]) -> Iterator[StoredObject]:
+    """Streams list_objects_v2 pages (1000 keys each) of every prefix."""
+    paginator = storage.s3_client.get_paginator('list_objects_v2')
+    for prefix in prefixes:
+        for page in paginator.paginate(Bucket=storage.bucket_name, Prefix=prefix):
+            for item in page.get('Contents', ()):
+                yield StoredObject(item['Key'], item['Size'], item['LastModified'].timestamp())
+
+
+def list_group(group: StorageGroup, prefix: str = '') -> Iterator[StoredObject]:
+    if group.kind == 'local':
+        return list_local(group.location, prefix)
+    backend = getattr(group.storage, 'backend', group.storage)
+    prefixes = group.list_prefixes()
+    if prefix:
+        # narrow to the prefix, listing only media_sdk prefixes it falls into
+        prefixes = [prefix] if any(prefix.startswith(listed) for listed in prefixes) else [
+            listed for listed in prefixes if listed.startswith(prefix)
+        ]
+    return list_s3(backend, prefixes)
+
+
+def get_rendition_variants(group: StorageGroup) -> Set[str]:
+    variants = set()
+    for tag in group.tags:
+        variants.update(get_renditions(get_tag_storage(tag)))
+    return variants
+
+
+def get_precompressed_extensions(group: StorageGroup) -> Tuple[str, ...]:
+    extensions = set()
+    for tag in group.tags:
+        storage = get_tag_storage(tag)
+        compression = getattr(getattr(storage, 'backend', storage), 'compression', None)
+        if compression is not None:
+            extensions.update(codec.extension for codec, _ in compression.precompressed)
+    return tuple(extensions)
+
+
+def is_derived(name: str, variants: Set[str], extensions: Tuple[str, ...]) -> bool:
+    """
+        Renditions (<dir>/renditions/<variant>/<file>) and precompressed copies (<file>.br, ...)
+        are removed with their original, never on their own.
+    """
+    if extensions and name.endswith(extensions):
+        return True
+    parts = name.split('/')
+    return len(parts) >= 3 and parts[-3] == 'renditions' and parts[-2] in variants
+
+
+def find_orphans(group: StorageGroup, strategy: str = 'merge', min_age: float = 0, now: Optional[float] = None,
+                 prefix: str = '', chunk_size: int = MEDIA_RECONCILE_CHUNK) -> Iterator[StoredObject]:
+    """
+        Stored files of the group no row references.
+        ::params
+            strategy - 'merge': sorted-merge join of the listing with referenced names ordered by the database,
+                           memory stays constant (requires binary collation, see BINARY_COLLATIONS);
+                       'set': referenced names are loaded into a set, the listing order does not matter
+            min_age - seconds, younger files are skipped: they may be uploaded for a row not saved yet
+            prefix - reconcile only names starting with it
+        Raises ValueError if 'merge' finds names out of order.
+    """
+    variants = get_rendition_variants(group)
+    extensions = get_precompressed_extensions(group)
+    cutoff = (time.time() if now is None else now) - min_age
+    listed = (item for item in list_group(group, prefix)
+              if item.modified <= cutoff and not is_derived(item.name, variants, extensions))
+
+    if strategy == 'set':
+        referenced = set()
+        for stream in referenced_streams(group, ordered=False, chunk_size=chunk_size):
+            referenced.update(stream)
+        for item in listed:
+            if item.name not in referenced:
+                yield item
+        return
+
+    referenced = heapq.merge(*referenced_streams(group, ordered=True, chunk_size=chunk_size))
+    current = next(referenced, None)
+    for item in ensure_sorted(listed, str(group)):
+        while current is not None and current < item.name:
+            current = next(referenced, None)
+        if current != item.name:
+            yield item
+
+
+def delete_orphans(group: StorageGroup, names: List[str]) -> dict:
+    """
+        Removes orphans with their renditions and precompressed copies in one delete_many call.
+        ::returns
+            dict {name: error} of files failed to be removed
+    """
+    stored_names = list(names)
+    for tag in group.tags:
+        storage = get_tag_storage(tag)
+        if get_renditions(storage):
+            stored_names += [stored_name for name in names for stored_name in rendition_names(storage, name)]
+        backend = getattr(storage, 'backend', storage)
+        if hasattr(backend, 'precompressed_names'):
+            stored_names += [stored_name for name in names for stored_name in backend.precompressed_names(name)]
+    return group.storage.delete_many(list(dict.fromkeys(stored_names)))
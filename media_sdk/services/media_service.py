@@ -1,4 +1,76 @@
-from ..models import Media
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from django.conf import settings
+from django.db import connections, router, transaction
+
+from ..models import Media, delete_stored_files, release_stored_file
+
+logger = logging.getLogger(__name__)
+
+MEDIA_BULK_MAX_WORKERS = 8
+
+_storage_semaphores = {}
+_storage_semaphores_lock = threading.Lock()
+
+
+def get_storage_key(storage) -> tuple:
+    """Driver class with the place it writes to (endpoint, bucket, tus url), 'cached' driver by its backend."""
+    backend = getattr(storage, 'backend', None)
+    if backend is not None:
+        return (storage.__class__.__name__,) + get_storage_key(backend)
+    sets = storage.sets
+    return storage.__class__.__name__, sets.get('endpoint_url'), sets.get('bucket'), sets.get('url')
+
+
+def get_storage_semaphore(storage) -> threading.BoundedSemaphore:
+    """
+        Limits parallel uploads per driver with its 'save_concurrency' config (4 by default).
+        Every field has its own storage object, so the limit is shared by all tags writing
+        to the same place, the first of them sets it.
+    """
+    key = get_storage_key(storage)
+    with _storage_semaphores_lock:
+        semaphore = _storage_semaphores.get(key)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(storage.sets.get('save_concurrency', 4))
+            _storage_semaphores[key] = semaphore
+        return semaphore
+
+
+def upload_field_file(field_file, data: dict):
+    """
+        Saves content of one GenericFile, holding its driver's semaphore.
+        ::returns
+            stored name or None, if nothing was uploaded (e.g. empty content)
+    """
+    with get_storage_semaphore(field_file.storage):
+        field_file.save(**data)
+    if not data.get('content'):
+        return None
+    if not field_file.name:
+        raise IOError(f"'{field_file.field.tag}' storage did not save '{data.get('name')}'")
+    return field_file.name
+
+
+def upload_in_worker(field_file, data: dict):
+    """upload_field_file for pool threads, closes database connections dedup lookups opened in the thread."""
+    try:
+        return upload_field_file(field_file, data)
+    finally:
+        connections.close_all()
+
+
+def delete_uploaded(uploaded: list):
+    """Removes just uploaded (field, name) files, deduplicated ones lose one reference."""
+    for field, name in uploaded:
+        try:
+            if release_stored_file(field, name):
+                field.storage.delete(name)
+        except Exception:
+            logger.exception('Failed to delete uploaded file "%s"', name)
 
 
 def save_file(model, content, filename: str, tag: str, upload_to=None, save=True):
@@ -31,6 +103,7 @@ def save_file(model, content, filename: str, tag: str, upload_to=None, save=True
 def save_multy_files(model, fields_data: dict, save=True):
     """
         Method for saving files in case of multiple GenericFileField.
+        Files are uploaded in parallel, if one of them fails, already uploaded ones are deleted.
         ::params
             model - your model class for creating or instance for updating
             fields_data - dict with the next structure:
@@ -51,11 +124,127 @@ def save_multy_files(model, fields_data: dict, save=True):
     else:
         model_instance = model()
 
+    tasks = []
+    previous = []
     for field_tag in fields_data:
         result_field = model_instance.get_generic_file_field_by_tag(field_tag)
         if result_field is None:
             continue
-        result_field.save(**fields_data[field_tag])
+        tasks.append((result_field, fields_data[field_tag]))
+        previous.append((result_field.field, result_field.name))
+
+    uploaded, errors = [], []
+    if len(tasks) == 1:
+        try:
+            upload_field_file(*tasks[0])
+        except Exception as error:
+            errors.append(error)
+    elif tasks:
+        max_workers = getattr(settings, 'MEDIA_BULK_MAX_WORKERS', MEDIA_BULK_MAX_WORKERS)
+        with ThreadPoolExecutor(max_workers=min(len(tasks), max_workers)) as executor:
+            futures = [(result_field, executor.submit(upload_in_worker, result_field, data))
+                       for result_field, data in tasks]
+        for result_field, future in futures:
+            try:
+                name = future.result()
+            except Exception as error:
+                errors.append(error)
+            else:
+                if name:
+                    uploaded.append((result_field.field, name))
+    if errors:
+        delete_uploaded(uploaded)
+        for field, old_name in previous:
+            setattr(model_instance, field.attname, old_name)
+        raise errors[0]
     if save:
         model_instance.save()
     return model_instance
+
+
+def save_bulk(model, items: List[dict], batch_size=None) -> List[dict]:
+    """
+        Method for saving files on many instances at once.
+        Files of all items are uploaded in a thread pool (MEDIA_BULK_MAX_WORKERS, 8 by default),
+        each driver runs at most 'save_concurrency' uploads at once.
+        New instances are stored with one bulk_create, updated ones with one bulk_update.
+        If any file of an item fails, the item is not stored and its uploaded files are deleted.
+        Pool threads close their database connections when their uploads are done.
+        ::params
+            model - your model class
+            items - list of dicts with the next structure:
+                {
+                    'instance': <model instance for updating>, [optional, new one is created otherwise]
+                    'fields_data': <dict, see save_multy_files>, [required]
+                }
+            batch_size - batch_size for bulk_create/bulk_update
+        ::returns
+            list of dicts in items order:
+                {
+                    'instance': <model instance>,
+                    'error': <exception or None>
+                }
+            Created instances get their pks only where bulk_create returns them
+            (PostgreSQL, also SQLite 3.35+ and MariaDB 10.5+ since Django 4.0), they stay None otherwise.
+    """
+    results = []
+    tasks = []
+    for item in items:
+        model_instance = item.get('instance') or model()
+        results.append({'instance': model_instance, 'error': None, 'uploaded': [], 'previous': []})
+        for field_tag, data in item['fields_data'].items():
+            result_field = model_instance.get_generic_file_field_by_tag(field_tag)
+            if result_field is None:
+                continue
+            results[-1]['previous'].append((result_field.field, result_field.name, bool(data.get('content'))))
+            tasks.append((results[-1], result_field, data))
+
+    max_workers = getattr(settings, 'MEDIA_BULK_MAX_WORKERS', MEDIA_BULK_MAX_WORKERS)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [(result, result_field, executor.submit(upload_in_worker, result_field, data))
+                   for result, result_field, data in tasks]
+    for result, result_field, future in futures:
+        try:
+            name = future.result()
+        except Exception as error:
+            result['error'] = result['error'] or error
+        else:
+            if name:
+                result['uploaded'].append((result_field.field, name))
+
+    def rollback(result):
+        delete_uploaded(result['uploaded'])
+        for field, old_name, _ in result['previous']:
+            setattr(result['instance'], field.attname, old_name)
+
+    for result in results:
+        if result['error'] is not None:
+            rollback(result)
+    succeeded = [result for result in results if result['error'] is None]
+    created = [result for result in succeeded if result['instance'].pk is None]
+    updated = [result for result in succeeded if result['instance'].pk is not None]
+    file_fields = [field.name for field in model.get_generic_file_fields()]
+
+    replaced = [(field, old_name) for result in updated for field, old_name, has_content in result['previous']
+                if has_content and old_name and old_name != field.default]
+    using = router.db_for_write(model)
+
+    try:
+        with transaction.atomic(using=using):
+            if created:
+                model.objects.bulk_create([result['instance'] for result in created], batch_size=batch_size)
+            if updated:
+                model.objects.bulk_update([result['instance'] for result in updated], file_fields,
+                                          batch_size=batch_size)
+            delete_stored_files(replaced, using)
+    except Exception as error:
+        for result in succeeded:
+            rollback(result)
+            result['error'] = error
+        for result in created:
+            result['instance'].pk = None
+    else:
+        for result in succeeded:
+            result['instance'].remember_file_names()
+
+    return [{'instance': result['instance'], 'error': result['error']} for result in results]
@@ -1,22 +1,64 @@
+import calendar
 import io
+import logging
 import os
 import posixpath
+import shutil
+import tempfile
+import threading
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from gzip import GzipFile
+from fnmatch import fnmatch
+from functools import partial
 from mimetypes import guess_type
 from urllib.parse import parse_qsl, urlsplit
 
-import boto3
+from asgiref.sync import sync_to_async
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError
 from django.conf import settings
-from django.core.exceptions import SuspiciousOperation
+from django.core.exceptions import ImproperlyConfigured, SuspiciousOperation
+from django.core.files.base import File
 from django.core.files.storage import FileSystemStorage, Storage
 from django.utils.deconstruct import deconstructible
 from django.utils.encoding import force_bytes
-from tusclient import client
-from tusclient.exceptions import TusCommunicationError, TusUploadFailed
-from tusclient.storage.filestorage import FileStorage
+from django.utils.functional import LazyObject
+from tusclient.exceptions import TusCommunicationError
+
+from ..instrumentation import content_size, instrument
+from .cache import TTLCache
+from .clients import get_credentials_expiry, get_s3_client, get_tus_client
+from .compression import (COMPRESSED_TYPES, CompressedStream, CompressionPolicy,
+                          decompress_into, get_codec, get_codec_by_encoding,
+                          parse_accept_encoding)
+from .content_digest import check_digest, content_digests
+from .disk_cache import DiskCache
+from .tus_upload import (AdaptiveUploader, StreamPart, create_final_upload,
+                         get_server_extensions, get_url_storage)
+from .url_cache import PresignedUrlCache
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+CROCKFORD_BASE32 = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+# form fields of presigned POST for object_params()
+POST_FIELDS = {'ContentType': 'Content-Type', 'ContentDisposition': 'Content-Disposition', 'ACL': 'acl'}
+
+# 'checksum' config -> (header with precomputed digest, ChecksumAlgorithm S3 computes per part)
+S3_CHECKSUMS = {
+    'md5': ('ContentMD5', None),
+    'sha1': ('ChecksumSHA1', 'SHA1'),
+    'sha256': ('ChecksumSHA256', 'SHA256'),
+    'crc32': ('ChecksumCRC32', 'CRC32'),
+    'crc32c': ('ChecksumCRC32C', 'CRC32C'),
+}
+
+# drivers able to read their files back, so 'cached' driver can wrap them
+CACHEABLE_DRIVERS = ('local', 's3')
 
 
 class DriverUtils:
@@ -33,16 +75,32 @@ class DriverUtils:
         return clean_name
 
     @staticmethod
-    def compress_content(content):
-        """Gzip a given string content."""
+    def compress_content(content, codec='gzip', level=None):
+        """Compresses a given content into memory with 'gzip', 'br' or 'zstd' codec."""
+        content.seek(0)
+        return io.BytesIO(CompressedStream(content, get_codec(codec), level=level).read())
+
+    @staticmethod
+    def compress_stream(content, chunk_size=MB, compresslevel=None, codec='gzip'):
+        """Compresses a given file-like content lazily, without reading it into memory."""
         content.seek(0)
-        zbuf = io.BytesIO()
-        with GzipFile(mode='wb', fileobj=zbuf, mtime=0.0) as zfile:
-            zfile.write(
-                content.read() if isinstance(content, bytearray) else force_bytes(content.read())
-            )
-        zbuf.seek(0)
-        return zbuf
+        return CompressedStream(content, get_codec(codec), level=compresslevel, chunk_size=chunk_size)
+
+    @staticmethod
+    def is_compressible(content_type, skip_types=COMPRESSED_TYPES):
+        if not content_type:
+            return True
+        return not any(fnmatch(content_type, pattern) for pattern in skip_types)
+
+    @staticmethod
+    def hash_content(content, chunk_size=MB):
+        """
+            sha256 of file-like content, read once (see content_digest.content_digests).
+            ::returns
+                (sha256 hex digest, size)
+        """
+        digests = content_digests(content, ('sha256',), chunk_size)
+        return digests.hex('sha256'), digests.size
 
     @staticmethod
     def create_file_name(name, max_length):
@@ -54,14 +112,60 @@ class DriverUtils:
         name = ''.join([str(uuid.uuid4().hex[:max_length]), name])
         return posixpath.join(dirname, name)
 
+    @staticmethod
+    def create_ulid():
+        """26 chars ULID: 48 bit ms timestamp and 80 random bits, sorts by creation time."""
+        value = (int(time.time() * 1000) << 80) | int.from_bytes(os.urandom(10), 'big')
+        chars = []
+        for _ in range(26):
+            chars.append(CROCKFORD_BASE32[value & 31])
+            value >>= 5
+        return ''.join(reversed(chars))
+
+    @staticmethod
+    def create_unique_file_name(name, strategy='ulid'):
+        """
+            Prefixes name with ULID ('ulid') or full uuid4 hex ('uuid'),
+            so the name can not collide and needs no existence check.
+        """
+        dirname, name = posixpath.split(name)
+        prefix = DriverUtils.create_ulid() if strategy == 'ulid' else uuid.uuid4().hex
+        return posixpath.join(dirname, ''.join([prefix, name]))
+
+
+class AsyncDriver:
+    """
+        Async counterparts of the driver methods for ASGI deployments.
+        Blocking calls run in the thread pool of asgiref (not the single thread
+        of sync_to_async's thread_sensitive mode), so many of them go at once.
+    """
+
+    async def asave(self, name, content, max_length=None):
+        return await sync_to_async(self.save, thread_sensitive=False)(name, content, max_length=max_length)
+
+    async def aurl(self, name):
+        return await sync_to_async(self.url, thread_sensitive=False)(name)
+
+    async def adelete(self, name):
+        return await sync_to_async(self.delete, thread_sensitive=False)(name)
+
+    async def aexists(self, name):
+        return await sync_to_async(self.exists, thread_sensitive=False)(name)
+
+    async def avalidators(self, name):
+        return await sync_to_async(self.validators, thread_sensitive=False)(name)
+
 
 @deconstructible
-class SaveLocal(Storage):
+class SaveLocal(AsyncDriver, Storage):
     def __init__(self, configs):
         self.fs = FileSystemStorage()
         self.sets = configs
         self.location = self.sets.get('location', lambda name: name)
         self.name_uuid_len = self.sets.get('name_uuid_len', None)
+        self.stat_cache = TTLCache(ttl=self.sets.get('stat_cache_ttl', 60),
+                                   max_size=self.sets.get('stat_cache_size', 1024))
+        self.compression = CompressionPolicy(self.sets)
 
     def get_alternative_name(self, file_root, file_ext):
         return DriverUtils.create_file_name((file_root, file_ext), self.name_uuid_len)
@@ -74,21 +178,116 @@ class SaveLocal(Storage):
         name = DriverUtils.clean_name(name)
         return self.fs.get_available_name(name)
 
+    @instrument('local.save', size=content_size)
     def _save(self, name, content):
         name = self.fs._save(name, content)
+        self.stat_cache.pop(name)
+        if self.compression.precompressed:
+            self.save_precompressed(name)
         return name
 
+    def precompressed_name(self, name, encoding):
+        return name + get_codec_by_encoding(encoding).extension
+
+    def precompressed_names(self, name):
+        return [name + codec.extension for codec, _ in self.compression.precompressed]
+
+    def save_precompressed(self, name):
+        """
+            Stores 'precompressed' copies next to the file (<name>.br, <name>.gz, ...),
+            a copy not smaller than the file is dropped.
+        """
+        path = self.path(name)
+        size = os.path.getsize(path)
+        for codec, level in self.compression.precompressed_for(guess_type(name)[0], size):
+            fd, temp_path = tempfile.mkstemp(prefix='.precompress-', dir=os.path.dirname(path))
+            try:
+                with open(path, 'rb') as source, os.fdopen(fd, 'wb') as file:
+                    shutil.copyfileobj(CompressedStream(source, codec, level), file, MB)
+                    compressed_size = file.tell()
+                if compressed_size < size:
+                    os.replace(temp_path, path + codec.extension)
+                    self.stat_cache.pop(name + codec.extension)
+                else:
+                    os.remove(temp_path)
+            except OSError:
+                logger.exception('Failed to store "%s" copy of "%s"', codec.name, name)
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+
+    def select_encoding(self, name, accept_encoding):
+        """
+            ::returns
+                content-coding of the precompressed copy to serve for Accept-Encoding header,
+                first of 'precompressed' config accepted by the client; None - the file itself
+        """
+        if not self.compression.precompressed or not accept_encoding or self.sets.get('offload'):
+            return None
+        if not self.compression.applies(guess_type(name)[0]):
+            return None
+        accepted = parse_accept_encoding(accept_encoding)
+        for codec, _ in self.compression.precompressed:
+            if accepted.get(codec.encoding, accepted.get('*', 0)) <= 0:
+                continue
+            if self.validators(name + codec.extension) is not None:
+                return codec.encoding
+        return None
+
+    @instrument('local.open')
+    def _open(self, name, mode='rb'):
+        return self.fs._open(name, mode)
+
+    @instrument('local.exists')
+    def exists(self, name):
+        return self.fs.exists(name)
+
     def url(self, name):
         return self.fs.url(name)
 
+    async def aurl(self, name):
+        # no I/O, thread hop would cost more than the call
+        return self.url(name)
+
     def path(self, name):
         return self.fs.path(name)
 
+    @instrument('local.delete')
     def delete(self, name):
+        self.stat_cache.pop(name)
         try:
             os.remove(posixpath.join(settings.MEDIA_ROOT, name))
+        except FileNotFoundError as fnfe:
+            logger.debug('File "%s" does not exist', fnfe.filename)
         except OSError as ose:
-            print(f'File "{ose.filename}" does not exist')
+            logger.warning('Failed to delete file "%s": %s', ose.filename, ose.strerror)
+        for precompressed_name in self.precompressed_names(name):
+            self._remove(precompressed_name)
+
+    def _remove(self, name):
+        self.stat_cache.pop(name)
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            return None
+        except (OSError, SuspiciousOperation) as error:
+            return str(error)
+        for precompressed_name in self.precompressed_names(name):
+            self._remove(precompressed_name)
+        return None
+
+    @instrument('local.delete_many')
+    def delete_many(self, names):
+        """
+            Removes files in parallel ('delete_workers' config, 8 by default).
+            Missing files count as removed.
+            ::returns
+                dict {name: error} of files failed to be removed
+        """
+        with ThreadPoolExecutor(max_workers=self.sets.get('delete_workers', 8)) as executor:
+            errors = list(executor.map(self._remove, names))
+        return {name: error for name, error in zip(names, errors) if error}
 
     def download(self, name):
         file = open(self.path(name), 'rb')
@@ -98,64 +297,232 @@ class SaveLocal(Storage):
     def retrieve(self, name):
         return self.download(name)
 
+    @instrument('local.validators')
+    def validators(self, name):
+        """
+            ::returns
+                (ETag, Last-Modified timestamp) from cached file stat, None if file is missing
+        """
+        validators = self.stat_cache.get(name)
+        if validators is None:
+            try:
+                stat = os.stat(self.path(name))
+            except OSError:
+                return None
+            validators = ('"%x-%x"' % (stat.st_mtime_ns, stat.st_size), int(stat.st_mtime))
+            self.stat_cache.set(name, validators)
+        return validators
+
 
 @deconstructible
-class SaveS3(Storage):
+class SaveS3(AsyncDriver, Storage):
     def __init__(self, configs):
         self.sets = configs
         self.bucket_name = self.sets['bucket']
         self.name_uuid_len = self.sets.get('name_uuid_len', None)
+        self.name_strategy = self.sets.get('name_strategy', 'uuid_prefix' if self.name_uuid_len else 'ulid')
         self.location = self.sets.get('location', lambda name: name)
         self.privat = self.sets.get('privat', None)
         if self.privat == '' or not isinstance(self.privat, str):
             self.privat = None
         self.public = self.sets.get('public', 'Public')
-        self.s3_resource = boto3.resource('s3')
-        self.s3_bucket = self.s3_resource.Bucket(self.bucket_name)
+        self.s3_client = get_s3_client(self.sets)
+        self.url_expires = self.sets.get('url_expires', 3600)
+        self.url_cache = PresignedUrlCache(expires=self.url_expires,
+                                           max_size=self.sets.get('url_cache_size', 1024),
+                                           margin=self.sets.get('url_cache_margin', 300),
+                                           backend=self.sets.get('url_cache_backend', None))
+        self.compression = CompressionPolicy(self.sets, default_codec='gzip')
+        self.checksum = self.sets.get('checksum')
+        if self.checksum:
+            if self.checksum not in S3_CHECKSUMS:
+                raise ImproperlyConfigured("Unknown 'checksum' '%s', use one of: %s"
+                                           % (self.checksum, ', '.join(S3_CHECKSUMS)))
+            check_digest(self.checksum)
+        self.transfer_config = TransferConfig(
+            multipart_threshold=self.sets.get('multipart_threshold', 8 * MB),
+            multipart_chunksize=self.sets.get('multipart_chunksize', 8 * MB),
+            max_concurrency=self.sets.get('max_concurrency', 4),
+        )
+        self.stat_cache = TTLCache(ttl=self.sets.get('stat_cache_ttl', 60),
+                                   max_size=self.sets.get('stat_cache_size', 1024))
 
     def get_available_name(self, name, max_length=None):
-        start_name = name
         name = DriverUtils.clean_name(name)
-        name = DriverUtils.create_file_name(name, self.name_uuid_len)
+        if self.name_strategy in ('ulid', 'uuid'):
+            return self.get_storing_name(DriverUtils.create_unique_file_name(name, self.name_strategy))
+        name_uuid_len = self.name_uuid_len or 6
+        while True:
+            storing_name = self.get_storing_name(DriverUtils.create_file_name(name, name_uuid_len))
+            if not self.exists(storing_name):
+                return storing_name
+            name_uuid_len += 1
+
+    def get_storing_name(self, name):
         try:
             name = DriverUtils.safe_join(self.location(name))
         except ValueError:
             raise SuspiciousOperation("Attempted access to '%s' denied." %
                                       name)
-        while self.exists(name):
-            self.get_available_name(start_name)
         if self.privat:
             name = posixpath.join(self.privat, name)
         else:
             name = posixpath.join(self.public, name)
         return name
 
+    @instrument('s3.exists')
     def exists(self, name):
         try:
-            self.s3_resource.meta.client.head_object(Bucket=self.bucket_name, Key=name)
+            self.s3_client.head_object(Bucket=self.bucket_name, Key=name)
             return True
         except ClientError:
             return False
 
-    def _save(self, name, content):
-        obj = self.s3_bucket.Object(name)
-        content.seek(0, os.SEEK_SET)
-        content = DriverUtils.compress_content(content)
+    def read_into(self, name, file):
+        """Writes content of the object into `file`, compressed objects are decompressed."""
+        response = self.s3_client.get_object(Bucket=self.bucket_name, Key=name)
+        codec = get_codec_by_encoding(response.get('ContentEncoding'))
+        if codec is None:
+            shutil.copyfileobj(response['Body'], file, MB)
+        else:
+            decompress_into(response['Body'], file, codec)
+
+    @instrument('s3.open')
+    def _open(self, name, mode='rb'):
+        """Downloads the object into a spooled temporary file."""
+        file = tempfile.SpooledTemporaryFile(max_size=self.transfer_config.multipart_chunksize)
+        self.read_into(name, file)
+        file.seek(0)
+        return File(file, name)
+
+    def object_params(self, name):
+        """Metadata every stored object gets: ContentType, ContentDisposition and public-read ACL without 'privat'."""
         params = dict()
-        params['ContentEncoding'] = 'gzip'
-        params['ContentType'] = guess_type(name)[0]
+        content_type = guess_type(name)[0]
+        if content_type:
+            params['ContentType'] = content_type
         params['ContentDisposition'] = 'inline'
         if not self.privat:
             params['ACL'] = 'public-read'
-        obj.upload_fileobj(content, ExtraArgs=params)
+        return params
+
+    def stored_as_is(self, name, size):
+        """Object is sent in one PutObject without compression, so a digest of the content checks it."""
+        return (size <= self.transfer_config.multipart_threshold
+                and self.compression.codec_for(guess_type(name)[0], size) is None)
+
+    def upload_digests(self, name, size):
+        """Digests of the content _save() sends with the object, GenericFile.save computes them in one pass."""
+        if self.checksum and self.stored_as_is(name, size):
+            return (self.checksum,)
+        return ()
+
+    @instrument('s3.save', size=content_size)
+    def _save(self, name, content):
+        """
+            With 'checksum' config S3 verifies what it got: an object sent in one request carries
+            the digest of the content (Content-MD5 or x-amz-checksum-*), reused if GenericFile.save
+            has computed it; compressed and multipart uploads get checksums of their parts.
+        """
+        content.seek(0, os.SEEK_END)
+        size = content.tell()
+        content.seek(0, os.SEEK_SET)
+        params = self.object_params(name)
+        header, algorithm = S3_CHECKSUMS[self.checksum] if self.checksum else (None, None)
+        if header and self.stored_as_is(name, size):
+            params[header] = content_digests(content, (self.checksum,)).base64(self.checksum)
+            self.s3_client.put_object(Bucket=self.bucket_name, Key=name, Body=content, **params)
+            return name
+        codec = self.compression.codec_for(params.get('ContentType'), size)
+        if codec is not None:
+            content = DriverUtils.compress_stream(content, chunk_size=self.transfer_config.multipart_chunksize,
+                                                  compresslevel=self.compression.level, codec=codec.name)
+            params['ContentEncoding'] = codec.encoding
+        if algorithm:
+            params['ChecksumAlgorithm'] = algorithm
+        self.s3_client.upload_fileobj(content, self.bucket_name, name, ExtraArgs=params, Config=self.transfer_config)
         return name
 
+    @instrument('s3.presign_post')
+    def presign_post(self, name, max_size, expires):
+        """
+            Presigned POST of a browser form uploading at most `max_size` bytes into `name`.
+            ::returns
+                {'url': <form action>, 'fields': <form fields to send before the file>}
+        """
+        fields = {POST_FIELDS[key]: value for key, value in self.object_params(name).items()}
+        conditions = [{key: value} for key, value in fields.items()]
+        conditions.append(['content-length-range', 0, max_size])
+        post = self.s3_client.generate_presigned_post(self.bucket_name, name, Fields=fields,
+                                                      Conditions=conditions, ExpiresIn=expires)
+        return {'url': post['url'], 'fields': post['fields']}
+
+    @instrument('s3.create_multipart')
+    def create_multipart(self, name):
+        """::returns UploadId of a new multipart upload into `name`"""
+        response = self.s3_client.create_multipart_upload(Bucket=self.bucket_name, Key=name, **self.object_params(name))
+        return response['UploadId']
+
+    @instrument('s3.presign_parts')
+    def presign_parts(self, name, upload_id, parts, expires):
+        """Presigned PUT urls of part numbers 1..`parts`, signing needs no requests."""
+        return [
+            self.s3_client.generate_presigned_url(
+                'upload_part', ExpiresIn=expires,
+                Params={'Bucket': self.bucket_name, 'Key': name, 'UploadId': upload_id, 'PartNumber': part_number}
+            ) for part_number in range(1, parts + 1)
+        ]
+
+    @instrument('s3.complete_multipart')
+    def complete_multipart(self, name, upload_id, parts):
+        """
+            Assembles the object from uploaded `parts` [(part number, ETag)].
+            Raises ClientError for unknown upload or parts.
+        """
+        self.s3_client.complete_multipart_upload(
+            Bucket=self.bucket_name, Key=name, UploadId=upload_id,
+            MultipartUpload={'Parts': [{'PartNumber': number, 'ETag': etag} for number, etag in sorted(parts)]}
+        )
+
+    @instrument('s3.abort_multipart')
+    def abort_multipart(self, name, upload_id):
+        """Drops uploaded parts of an unfinished multipart upload, unknown (finished) uploads are ignored."""
+        try:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=name, UploadId=upload_id)
+        except ClientError:
+            pass
+
+    @instrument('s3.size')
+    def size(self, name):
+        """::returns size of the stored object, None if it is missing"""
+        try:
+            return self.s3_client.head_object(Bucket=self.bucket_name, Key=name)['ContentLength']
+        except ClientError:
+            return None
+
+    @instrument('s3.presign')
+    def presign(self, name, disposition=None):
+        params = dict()
+        params['Bucket'] = self.bucket_name
+        params['Key'] = name
+        if disposition:
+            params['ResponseContentDisposition'] = disposition
+        return self.url_cache.get_or_sign(
+            (self.bucket_name, name, disposition),
+            lambda: self.s3_client.generate_presigned_url('get_object', Params=params, ExpiresIn=self.url_expires),
+            valid_until=lambda: get_credentials_expiry(self.sets)
+        )
+
+    @instrument('s3.url')
     def url(self, name):
         name = DriverUtils.safe_join(name)
+        return self.url_cache.get_or_sign((self.bucket_name, name, 'url'), lambda: self._unsigned_url(name))
+
+    def _unsigned_url(self, name):
         params = dict()
-        params['Bucket'] = self.s3_bucket.name
+        params['Bucket'] = self.bucket_name
         params['Key'] = name
-        url = self.s3_bucket.meta.client.generate_presigned_url('get_object', Params=params)
+        url = self.s3_client.generate_presigned_url('get_object', Params=params)
         split_url = urlsplit(url)
         qs = parse_qsl(split_url.query, keep_blank_values=True)
         blacklist = {
@@ -168,42 +535,86 @@ class SaveS3(Storage):
         split_url = split_url._replace(query="&".join(joined_qs))
         return split_url.geturl()
 
+    @instrument('s3.delete')
     def delete(self, name):
-        self.s3_resource.Object(self.bucket_name, name).delete()
+        self.stat_cache.pop(name)
+        self.s3_client.delete_object(Bucket=self.bucket_name, Key=name)
+
+    @instrument('s3.delete_many')
+    def delete_many(self, names):
+        """
+            Removes objects with delete_objects, up to 1000 keys per request.
+            ::returns
+                dict {name: error} of objects failed to be removed
+        """
+        failed = {}
+        for start in range(0, len(names), 1000):
+            chunk = names[start:start + 1000]
+            for name in chunk:
+                self.stat_cache.pop(name)
+            try:
+                response = self.s3_client.delete_objects(
+                    Bucket=self.bucket_name,
+                    Delete={'Objects': [{'Key': name} for name in chunk], 'Quiet': True}
+                )
+            except ClientError as error:
+                failed.update((name, str(error)) for name in chunk)
+                continue
+            for error in response.get('Errors', []):
+                failed[error['Key']] = error.get('Message') or error.get('Code')
+        return failed
 
     def download(self, name):
-        params = dict()
-        params['Bucket'] = self.s3_bucket.name
-        params['Key'] = name
-        params['ResponseContentDisposition'] = 'attach'
-        return self.s3_bucket.meta.client.generate_presigned_url('get_object', Params=params)
+        return self.presign(name, 'attach')
 
     def retrieve(self, name):
-        params = dict()
-        params['Bucket'] = self.s3_bucket.name
-        params['Key'] = name
-        return self.s3_bucket.meta.client.generate_presigned_url('get_object', Params=params)
+        return self.presign(name)
+
+    @instrument('s3.validators')
+    def validators(self, name):
+        """
+            ::returns
+                (ETag, Last-Modified timestamp) from cached object metadata,
+                None if object is missing or 'conditional' config is off
+        """
+        if not self.sets.get('conditional', False):
+            return None
+        validators = self.stat_cache.get(name)
+        if validators is None:
+            try:
+                head = self.s3_client.head_object(Bucket=self.bucket_name, Key=name)
+            except ClientError:
+                return None
+            validators = (head['ETag'], calendar.timegm(head['LastModified'].utctimetuple()))
+            self.stat_cache.set(name, validators)
+        return validators
 
 
 @deconstructible
-class TusStorage(Storage):
+class TusStorage(AsyncDriver, Storage):
 
     def __init__(self, configs):
         self.sets = configs
         self.name_uuid_len = self.sets.get('name_uuid_len', 5)
-        self.my_client = client.TusClient(url=self.sets['url'],
-                                          headers=self.sets.get('headers', {}))
-
-        self.uploader = None
+        self.my_client = get_tus_client(self.sets['url'], self.sets.get('headers', {}))
 
         self.rename_tries = self.sets.get('rename_tries', 5)
         self.storing_file = self.sets.get('storing_file', 'tus_url_storage')
+        self.url_storage = get_url_storage(self.storing_file) if self.storing_file else None
 
-        self.opt_conf = dict(chunk_size=self.sets.get('chunk_size', 500),
+        chunk_size = self.sets.get('chunk_size')
+        self.opt_conf = dict(min_chunk_size=chunk_size or self.sets.get('min_chunk_size', 256 * 1024),
+                             max_chunk_size=chunk_size or self.sets.get('max_chunk_size', 32 * MB),
+                             chunk_seconds=self.sets.get('chunk_seconds', 1.0),
                              retries=self.sets.get('retries', 5),
                              retry_delay=self.sets.get('retry_delay', 10),
                              upload_checksum=self.sets.get('upload_checksum', True)
                              )
+        self.parallel_uploads = self.sets.get('parallel_uploads', 4)
+        self.parallel_threshold = self.sets.get('parallel_threshold', 64 * MB)
+        self._concatenation = None
+        self._active_keys = set()
+        self._active_keys_lock = threading.Lock()
 
     def url(self, name):
         return name
@@ -212,61 +623,371 @@ class TusStorage(Storage):
         name = DriverUtils.create_file_name(name, self.name_uuid_len)
         return name
 
-    def save(self, name, content, max_length=None):
-        metadata = {'filename': name}
-        if self.storing_file:
-            storing = FileStorage(self.storing_file)
-            store_url = True
-        else:
-            storing = None
-            store_url = False
+    def upload_digests(self, name, size):
+        """sha256 is the key of the stored upload url with 'storing_file'."""
+        return ('sha256',) if self.url_storage else ()
 
+    def supports_concatenation(self):
+        if self._concatenation is None:
+            try:
+                self._concatenation = 'concatenation' in get_server_extensions(self.my_client)
+            except TusCommunicationError:
+                return False
+        return self._concatenation
+
+    def new_uploader(self, stream, key=None, metadata=None, creation_headers=None):
+        """
+            Uploader of its own for every upload (part), so concurrent saves are safe.
+            Continues the upload stored under `key` if server still has it.
+        """
+        url = self.url_storage.get_item(key) if key else None
+        if url:
+            try:
+                return AdaptiveUploader(file_stream=stream, url=url, client=self.my_client,
+                                        metadata=metadata, **self.opt_conf)
+            except TusCommunicationError:
+                # upload expired on server, start over
+                self.url_storage.remove_item(key)
+        return AdaptiveUploader(file_stream=stream, client=self.my_client, metadata=metadata,
+                                creation_headers=creation_headers, **self.opt_conf)
+
+    def create_renaming(self, create, name, metadata):
+        """Calls create(), while server answers 409 metadata 'filename' is replaced with a new one."""
         rename_tries = self.rename_tries
-
+        name_uuid_len = self.name_uuid_len
         while True:
             try:
-                rename_tries -= 1
-                self.uploader = self.my_client.uploader(file_stream=content,
-                                                        metadata=metadata,
-                                                        store_url=store_url,
-                                                        url_storage=storing,
-                                                        **self.opt_conf)
-                break
+                return create()
             except TusCommunicationError as tus_comm:
-                if tus_comm.status_code == 409:
-                    if rename_tries <= 0:
-                        self.name_uuid_len += 1
-                        rename_tries = self.rename_tries
-                    metadata['filename'] = self.get_available_name(name)
+                if tus_comm.status_code != 409 or 'filename' not in metadata:
+                    raise
+                rename_tries -= 1
+                if rename_tries <= 0:
+                    name_uuid_len += 1
+                    rename_tries = self.rename_tries
+                metadata['filename'] = DriverUtils.create_file_name(name, name_uuid_len)
+
+    def upload(self, uploader, name, key=None):
+        """::returns upload url"""
+        if not uploader.url:
+            uploader.set_url(self.create_renaming(uploader.create_url, name, uploader.metadata))
+            uploader.offset = 0
+            if key:
+                self.url_storage.set_item(key, uploader.url)
+                if 'filename' in uploader.metadata:
+                    self.url_storage.set_item(key + ':name', uploader.metadata['filename'])
+        uploader.upload()
+        return uploader.url
+
+    def save_single(self, name, content, key=None):
+        metadata = {'filename': name}
+        self.upload(self.new_uploader(content, key, metadata), name, key)
+        return metadata['filename'], [key, key + ':name'] if key else []
+
+    def save_parallel(self, name, content, size, key=None):
+        """
+            Uploads 'parallel_uploads' parts of content as partial uploads at once,
+            then concatenates them into the final upload.
+        """
+        part_size = -(-size // self.parallel_uploads)
+        lock = threading.Lock()
+        parts = [StreamPart(content, start, min(part_size, size - start), lock)
+                 for start in range(0, size, part_size)]
+        part_keys = [key and '%s:part:%d/%d' % (key, index, len(parts)) for index in range(len(parts))]
+
+        def upload_part(part, part_key):
+            uploader = self.new_uploader(part, part_key, creation_headers={'Upload-Concat': 'partial'})
+            return self.upload(uploader, name, part_key)
+
+        with ThreadPoolExecutor(max_workers=len(parts)) as executor:
+            futures = [executor.submit(upload_part, part, part_key) for part, part_key in zip(parts, part_keys)]
+        part_urls = [future.result() for future in futures]
+
+        metadata = {'filename': name}
+
+        def create_final():
+            response = create_final_upload(self.my_client, part_urls, metadata)
+            if not 200 <= response.status_code < 300:
+                raise TusCommunicationError(None, response.status_code, response.content)
+            return response
 
+        self.create_renaming(create_final, name, metadata)
+        return metadata['filename'], part_keys + [key + ':name'] if key else []
+
+    @instrument('tus.save', size=content_size)
+    def save(self, name, content, max_length=None):
+        """
+            Files from 'parallel_threshold' are uploaded in 'parallel_uploads' parts at once,
+            if server supports concatenation extension.
+            With 'storing_file' an interrupted upload is continued by the next save of the same content.
+            ::returns
+                name of the uploaded file
+            Raises TusCommunicationError or TusUploadFailed if upload fails.
+        """
+        content.seek(0, os.SEEK_END)
+        size = content.tell()
+        content.seek(0)
+
+        key = None
+        if self.url_storage:
+            # digest of the whole content, tusclient fingerprint hashes only its first 64KB
+            digests = content_digests(content, ('sha256',))
+            key = 'media_sdk:size:%d--sha256:%s' % (digests.size, digests.hex('sha256'))
+            with self._active_keys_lock:
+                if key in self._active_keys:
+                    # same content is being uploaded by another thread, do not share its upload
+                    key = None
+                else:
+                    self._active_keys.add(key)
         try:
-            self.uploader.upload()
-        except TusUploadFailed as tus_upl:
-            pass
-        else:
-            if self.uploader.store_url:
-                self.uploader.url_storage.remove_item(
-                    self.uploader.fingerprinter.get_fingerprint(
-                        self.uploader.get_file_stream()
-                    )
-                )
-            return metadata['filename']
+            if key:
+                name = self.url_storage.get_item(key + ':name') or name
+            if self.parallel_uploads > 1 and size >= self.parallel_threshold and self.supports_concatenation():
+                name, stored_keys = self.save_parallel(name, content, size, key)
+            else:
+                name, stored_keys = self.save_single(name, content, key)
+            for stored_key in stored_keys:
+                self.url_storage.remove_item(stored_key)
+        finally:
+            if key:
+                with self._active_keys_lock:
+                    self._active_keys.discard(key)
+        return name
 
     def delete(self, name):
         pass
 
+    def delete_many(self, names):
+        return {}
+
+
+def write_content(content, file, chunk_size=MB):
+    content.seek(0)
+    while True:
+        chunk = content.read(chunk_size)
+        if not chunk:
+            break
+        file.write(chunk if isinstance(chunk, bytes) else force_bytes(chunk))
+
+
+@deconstructible
+class CachedStorage(AsyncDriver, Storage):
+    """
+        Driver of 'backend' option ({'driver': 's3', 'configs': {...}}) keeping copies
+        of its files on local disk, cached files are read without a request to the backend.
+        'write_mode' 'through' saves to the backend, then caches;
+        'back' caches and uploads to the backend in 'write_back_workers' threads.
+    """
+
+    def __init__(self, configs):
+        self.sets = configs
+        backend = self.sets['backend']
+        if backend['driver'] not in CACHEABLE_DRIVERS:
+            raise ImproperlyConfigured("'cached' driver can wrap only: %s" % ', '.join(CACHEABLE_DRIVERS))
+        self.backend = SaveDrivers[backend['driver']].value(backend.get('configs', {}))
+        self.write_mode = self.sets.get('write_mode', 'through')
+        if self.write_mode not in ('through', 'back'):
+            raise ImproperlyConfigured("'write_mode' must be 'through' or 'back'")
+        location = self.sets.get('cache_location') or os.path.join(
+            tempfile.gettempdir(), 'media_sdk_cache', backend['driver'], self.backend.sets.get('bucket', '')
+        )
+        self.cache = DiskCache(location, self.sets.get('cache_max_size', 1024 * MB))
+        self.write_back_retries = self.sets.get('write_back_retries', 3)
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._executor = None
+        self.resume_write_backs()
+
+    def get_available_name(self, name, max_length=None):
+        return self.backend.get_available_name(name, max_length=max_length)
+
+    def generate_filename(self, filename):
+        return self.backend.generate_filename(filename)
+
+    def upload_digests(self, name, size):
+        """Backend digests of 'through' saves, 'back' ones are uploaded later from the cached copy."""
+        if self.write_mode == 'through' and hasattr(self.backend, 'upload_digests'):
+            return self.backend.upload_digests(name, size)
+        return ()
+
+    @instrument('cached.fill')
+    def read_into(self, name, file):
+        """Writes content of the backend file into `file`."""
+        if hasattr(self.backend, 'read_into'):
+            self.backend.read_into(name, file)
+        else:
+            with self.backend.open(name) as source:
+                shutil.copyfileobj(source, file, MB)
+
+    def open_cached(self, name, fill=True):
+        """
+            ::returns
+                cached copy opened for reading, filled from the backend on miss if `fill`;
+                None on miss or if the file is bigger than the whole cache
+        """
+        file = self.cache.open(name)
+        if file is None and fill and self.cache.get_or_fill(name, partial(self.read_into, name)):
+            file = self.cache.open(name)
+        return file
+
+    @instrument('cached.open')
+    def _open(self, name, mode='rb'):
+        file = self.open_cached(name)
+        if file is None:
+            return self.backend._open(name, mode)
+        return File(file, name)
+
+    def path(self, name):
+        """Path of the cached copy, filled on miss."""
+        return self.cache.get_or_fill(name, partial(self.read_into, name)) or self.backend.path(name)
+
+    @instrument('cached.save', size=content_size)
+    def _save(self, name, content):
+        if self.write_mode == 'back':
+            return self.save_back(name, content)
+        name = self.backend._save(name, content)
+        try:
+            self.cache.fill(name, partial(write_content, content), size=getattr(content, 'size', None))
+        except OSError:
+            logger.exception('Failed to cache "%s"', name)
+        return name
+
+    def get_executor(self):
+        with self._pending_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.sets.get('write_back_workers', 4),
+                                                    thread_name_prefix='media-write-back')
+            return self._executor
+
+    def save_back(self, name, content):
+        """Caches content, pinned until write_back() stores it in the backend."""
+        path = self.cache.fill(name, partial(write_content, content), pin=True,
+                               size=getattr(content, 'size', None))
+        if path is None:
+            return self.backend._save(name, content)
+        self.queue_write_back(name, path)
+        return name
+
+    def queue_write_back(self, name, path, resumed=False):
+        executor = self.get_executor()
+        with self._pending_lock:
+            self._pending[name] = executor.submit(self.write_back, name, path, resumed)
+
+    def resume_write_backs(self):
+        """
+            Queues write-backs of files a previous process pinned but did not store in the backend
+            (it died or all its tries failed). Processes sharing the cache directory may upload
+            such a file twice, the backend gets the same content under the same name.
+        """
+        for name in self.cache.pinned():
+            logger.info('Resuming write-back of "%s"', name)
+            self.queue_write_back(name, self.cache.path(name), resumed=True)
+
+    @instrument('cached.write_back')
+    def write_back(self, name, path, resumed=False):
+        """
+            Uploads the cached file, retried 'write_back_retries' times (3 by default).
+            If all tries fail, the cached copy stays pinned and keeps being served,
+            the next process using the cache tries again.
+            A `resumed` file already in the backend was stored before the previous process died.
+        """
+        try:
+            if resumed and self.backend.exists(name):
+                self.cache.unpin(name)
+                return
+            for attempt in range(self.write_back_retries + 1):
+                try:
+                    with open(path, 'rb') as file:
+                        self.backend._save(name, File(file, name))
+                except Exception:
+                    if attempt == self.write_back_retries:
+                        logger.exception('Failed to write "%s" back, its cached copy is kept', name)
+                        raise
+                    time.sleep(2 ** attempt)
+                else:
+                    self.cache.unpin(name)
+                    return
+        finally:
+            with self._pending_lock:
+                self._pending.pop(name, None)
+
+    def wait_pending(self, name):
+        with self._pending_lock:
+            future = self._pending.get(name)
+        if future is not None:
+            try:
+                future.result()
+            except Exception:
+                # already logged by write_back
+                pass
+
+    def flush(self):
+        """Waits for all pending write-backs."""
+        with self._pending_lock:
+            names = list(self._pending)
+        for name in names:
+            self.wait_pending(name)
+
+    @instrument('cached.exists')
+    def exists(self, name):
+        return name in self.cache or self.backend.exists(name)
+
+    def url(self, name):
+        return self.backend.url(name)
+
+    @instrument('cached.delete')
+    def delete(self, name):
+        self.wait_pending(name)
+        self.cache.discard(name)
+        self.backend.delete(name)
+
+    @instrument('cached.delete_many')
+    def delete_many(self, names):
+        """::returns dict {name: error} of backend files failed to be removed"""
+        for name in names:
+            self.wait_pending(name)
+            self.cache.discard(name)
+        return self.backend.delete_many(names)
+
+    def download(self, name):
+        return self.backend.download(name)
+
+    def retrieve(self, name):
+        return self.backend.retrieve(name)
+
+    def validators(self, name):
+        return self.backend.validators(name)
+
 
 class SaveDrivers(Enum):
     local = SaveLocal
     s3 = SaveS3
     tus = TusStorage
+    cached = CachedStorage
+
 
+class CustomStorage(LazyObject):
+    """
+        Driver of the tag, built on first use, so defining GenericFileFields
+        (importing models) sets up no clients.
+    """
 
-class CustomStorage:
-    def __new__(cls, tag):
-        option = settings.STORAGE_OPTIONS.get(tag)
+    def __init__(self, tag):
+        self.__dict__['_tag'] = tag
+        super(CustomStorage, self).__init__()
+
+    def _setup(self):
+        option = settings.STORAGE_OPTIONS.get(self._tag)
         if not option:
             option = {'driver': 'local',
                       'configs': {}
                       }
-        return SaveDrivers[option['driver']].value(option['configs'])
+        self._wrapped = SaveDrivers[option['driver']].value(option['configs'])
+
+    def __copy__(self):
+        return type(self)(self._tag)
+
+    def __deepcopy__(self, memo):
+        result = type(self)(self._tag)
+        memo[id(self)] = result
+        return result
@@ -0,0 +1,156 @@
+import io
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from mimetypes import guess_type
+from typing import List, Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import Storage
+
+from ..instrumentation import instrument
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+MEDIA_RENDITION_WORKERS = 2
+MEDIA_RENDITION_CACHE_TTL = 3600
+
+RENDITION_EXTENSIONS = {
+    'WEBP': '.webp',
+    'AVIF': '.avif',
+    'JPEG': '.jpg',
+    'PNG': '.png',
+    'GIF': '.gif',
+}
+
+# names of renditions known to be stored, saves exists() (HEAD for S3) per request
+_stored_renditions = TTLCache(ttl=MEDIA_RENDITION_CACHE_TTL, max_size=10000)
+# renditions of images Pillow failed to decode, not rendered again on every request
+_failed_renditions = TTLCache(ttl=MEDIA_RENDITION_CACHE_TTL, max_size=10000)
+_generation_locks = [threading.Lock() for _ in range(64)]
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class UnrenderableImage(Exception):
+    """Original can not be decoded: truncated or corrupted image, or a decompression bomb."""
+
+
+def get_renditions(storage) -> dict:
+    """
+        'renditions' config of the tag:
+            {<variant>: {'size': (<width>, <height>), 'format': 'WEBP', 'quality': 80, 'crop': False}}
+    """
+    return storage.sets.get('renditions') or {}
+
+
+def rendition_name(name: str, variant: str, spec: dict) -> str:
+    """Rendition is stored next to the original: <dir>/renditions/<variant>/<name><format extension>."""
+    dir_name, file_name = posixpath.split(name)
+    root, ext = posixpath.splitext(file_name)
+    ext = RENDITION_EXTENSIONS.get(str(spec.get('format', '')).upper(), ext)
+    return posixpath.join(dir_name, 'renditions', variant, root + ext)
+
+
+def can_store_renditions(storage) -> bool:
+    """Driver reads stored files back and stores files under given names (local, S3, 'cached'; not tus)."""
+    driver_class = storage.__class__
+    return all(getattr(driver_class, method, None) not in (None, getattr(Storage, method, None))
+               for method in ('_open', '_save', 'exists'))
+
+
+def rendition_names(storage, name: str) -> List[str]:
+    if not can_store_renditions(storage):
+        return []
+    return [rendition_name(name, variant, spec) for variant, spec in get_renditions(storage).items()]
+
+
+@instrument('rendition', size=lambda args, kwargs, result: len(result))
+def render(file, spec: dict) -> bytes:
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        raise ImproperlyConfigured("Image renditions require Pillow, install it with 'pip install Pillow'")
+
+    try:
+        with Image.open(file) as image:
+            image_format = str(spec.get('format') or image.format).upper()
+            image = ImageOps.exif_transpose(image)
+            size = tuple(spec['size'])
+            if spec.get('crop', False):
+                image = ImageOps.fit(image, size)
+            else:
+                image.thumbnail(size)
+            if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            buffer = io.BytesIO()
+            image.save(buffer, format=image_format, quality=spec.get('quality', 80))
+    except (Image.DecompressionBombError, OSError) as error:
+        # UnidentifiedImageError and truncated data are OSErrors too
+        raise UnrenderableImage(str(error)) from error
+    return buffer.getvalue()
+
+
+def generate_rendition(storage, name: str, variant: str, spec: Optional[dict] = None) -> str:
+    """
+        Stores `variant` of the stored image `name` unless it is stored already.
+        Rendition always has the name from rendition_name(), so rendition_names() finds it on delete.
+        Raises UnrenderableImage if the original can not be decoded.
+        ::returns
+            stored name of the rendition
+    """
+    spec = spec or get_renditions(storage)[variant]
+    stored_name = rendition_name(name, variant, spec)
+    key = (id(storage), stored_name)
+    if _stored_renditions.get(key):
+        return stored_name
+    if _failed_renditions.get(key):
+        raise UnrenderableImage('"%s" could not be decoded recently' % name)
+    with _generation_locks[hash(key) % len(_generation_locks)]:
+        if not storage.exists(stored_name):
+            try:
+                with storage.open(name) as original:
+                    content = render(original, spec)
+            except UnrenderableImage:
+                _failed_renditions.set(key, True)
+                raise
+            saved_name = storage._save(stored_name, ContentFile(content, name=stored_name))
+            if saved_name != stored_name:
+                # another process stored the rendition meanwhile and local driver picked another name,
+                # the copy would never be served nor deleted
+                storage.delete(saved_name)
+        _stored_renditions.set(key, True)
+    return stored_name
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'MEDIA_RENDITION_WORKERS', MEDIA_RENDITION_WORKERS),
+                thread_name_prefix='media-renditions'
+            )
+        return _executor
+
+
+def generate_renditions(storage, name: str):
+    content_type = guess_type(name)[0]
+    if not content_type or not content_type.startswith('image/') or not can_store_renditions(storage):
+        return
+    for variant, spec in get_renditions(storage).items():
+        try:
+            generate_rendition(storage, name, variant, spec)
+        except UnrenderableImage as error:
+            logger.warning('Can not generate "%s" rendition of "%s": %s', variant, name, error)
+        except Exception:
+            logger.exception('Failed to generate "%s" rendition of "%s"', variant, name)
+
+
+def schedule_renditions(storage, name: str):
+    """Generates all renditions of just stored image `name` in the worker pool (MEDIA_RENDITION_WORKERS)."""
+    get_executor().submit(generate_renditions, storage, name)
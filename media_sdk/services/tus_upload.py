@@ -0,0 +1,136 @@
+import base64
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from tusclient.request import catch_requests_error
+from tusclient.storage.filestorage import FileStorage
+from tusclient.uploader import Uploader
+
+_url_storages = {}
+_url_storages_lock = threading.Lock()
+
+
+class LockedUrlStorage(FileStorage):
+    """TinyDB url storage is not thread-safe, every call holds the lock of the file."""
+
+    def __init__(self, fp):
+        super(LockedUrlStorage, self).__init__(fp)
+        self._lock = threading.Lock()
+
+    def get_item(self, key: str):
+        with self._lock:
+            return super(LockedUrlStorage, self).get_item(key)
+
+    def set_item(self, key: str, url: str):
+        with self._lock:
+            super(LockedUrlStorage, self).set_item(key, url)
+
+    def remove_item(self, key: str):
+        with self._lock:
+            super(LockedUrlStorage, self).remove_item(key)
+
+
+def get_url_storage(fp: str) -> LockedUrlStorage:
+    """One url storage per file, shared by all TusStorage drivers."""
+    with _url_storages_lock:
+        url_storage = _url_storages.get(fp)
+        if url_storage is None:
+            url_storage = LockedUrlStorage(fp)
+            _url_storages[fp] = url_storage
+        return url_storage
+
+
+class StreamPart:
+    """
+        Read-only window [start, start + length) of a shared seekable stream.
+        Reads of all parts hold one lock, so parts may be uploaded from different threads.
+    """
+
+    def __init__(self, stream, start: int, length: int, lock: threading.Lock):
+        self.stream = stream
+        self.start = start
+        self.length = length
+        self.lock = lock
+        self.position = 0
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_END:
+            offset += self.length
+        elif whence == os.SEEK_CUR:
+            offset += self.position
+        self.position = max(0, min(offset, self.length))
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def read(self, size=-1):
+        remaining = self.length - self.position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        if size <= 0:
+            return b''
+        with self.lock:
+            self.stream.seek(self.start + self.position)
+            data = self.stream.read(size)
+        self.position += len(data)
+        return data
+
+
+class AdaptiveUploader(Uploader):
+    """
+        Uploader changing its chunk size between `min_chunk_size` and `max_chunk_size`:
+        doubled while a PATCH takes less than half of `chunk_seconds`,
+        halved when it takes more than twice as long.
+        `creation_headers` are added to the creation (POST) request.
+    """
+
+    def __init__(self, *args, min_chunk_size: int = 256 * 1024, max_chunk_size: int = 32 * 1024 * 1024,
+                 chunk_seconds: float = 1.0, creation_headers: Optional[Dict[str, str]] = None, **kwargs):
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max(max_chunk_size, min_chunk_size)
+        self.chunk_seconds = chunk_seconds
+        self.creation_headers = creation_headers or {}
+        kwargs.setdefault('chunk_size', min_chunk_size)
+        super(AdaptiveUploader, self).__init__(*args, **kwargs)
+
+    def get_url_creation_headers(self):
+        headers = super(AdaptiveUploader, self).get_url_creation_headers()
+        headers.update(self.creation_headers)
+        return headers
+
+    def upload_chunk(self):
+        started = time.monotonic()
+        super(AdaptiveUploader, self).upload_chunk()
+        if not self.chunk_seconds:
+            return
+        elapsed = time.monotonic() - started
+        if elapsed < self.chunk_seconds / 2:
+            self.chunk_size = min(self.chunk_size * 2, self.max_chunk_size)
+        elif elapsed > self.chunk_seconds * 2:
+            self.chunk_size = max(self.chunk_size // 2, self.min_chunk_size)
+
+
+def encode_metadata(metadata: dict) -> str:
+    return ','.join('{} {}'.format(key, base64.b64encode(str(value).encode('utf-8')).decode('ascii'))
+                    for key, value in metadata.items())
+
+
+@catch_requests_error
+def get_server_extensions(client) -> set:
+    """Extensions from "Tus-Extension" header of OPTIONS response."""
+    response = requests.options(client.url, headers=dict(Uploader.DEFAULT_HEADERS, **client.headers),
+                                cert=client.client_cert)
+    return {extension.strip() for extension in response.headers.get('Tus-Extension', '').split(',') if extension}
+
+
+@catch_requests_error
+def create_final_upload(client, part_urls, metadata: dict) -> requests.Response:
+    """Concatenates finished partial uploads into one upload (tus concatenation extension)."""
+    headers = dict(Uploader.DEFAULT_HEADERS, **client.headers)
+    headers['Upload-Concat'] = 'final;' + ' '.join(part_urls)
+    headers['Upload-Metadata'] = encode_metadata(metadata)
+    return requests.post(client.url, headers=headers, cert=client.client_cert)
@@ -0,0 +1,87 @@
+import hashlib
+import threading
+import time
+from typing import Callable, Optional, Tuple
+
+from django.core.cache import caches
+
+from .cache import TTLCache
+
+
+class PresignedUrlCache:
+    """
+        In-process LRU cache for signed urls.
+        Entries are dropped `margin` seconds before the signature expires (or the temporary
+        credentials it was made with), so a returned url is always valid for at least `margin` more seconds.
+        With `backend` (Django cache alias) signed urls are shared between workers.
+    """
+
+    def __init__(self, expires: int = 3600, max_size: int = 1024, margin: int = 300,
+                 backend: Optional[str] = None):
+        self.expires = expires
+        self.margin = min(margin, expires)
+        self.backend = backend
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._entries = TTLCache(ttl=self.expires - self.margin, max_size=max_size)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(key: Tuple) -> str:
+        return 'media_sdk:presign:' + hashlib.md5(repr(key).encode()).hexdigest()
+
+    def get_or_sign(self, key: Tuple, sign: Callable[[], str],
+                    valid_until: Optional[Callable[[], Optional[float]]] = None) -> str:
+        """
+            ::params
+                key - (bucket, object key, disposition)
+                sign - callable returning freshly signed url, called on miss
+                valid_until - callable returning timestamp the signing credentials expire at or None,
+                    called after signing
+            ::returns
+                url valid for at least `margin` seconds
+        """
+        url = self._entries.get(key)
+        if url is not None:
+            with self._lock:
+                self.hits += 1
+            return url
+
+        if self.backend:
+            shared = caches[self.backend].get(self.make_key(key))
+            if shared is not None:
+                url, expires_at = shared
+                valid_for = expires_at - self.margin - time.time()
+                if valid_for > 0:
+                    with self._lock:
+                        self.shared_hits += 1
+                    self._entries.set(key, url, ttl=valid_for)
+                    return url
+
+        url = sign()
+        now = time.time()
+        expires_at = now + self.expires
+        credentials_expire_at = valid_until() if valid_until is not None else None
+        if credentials_expire_at is not None:
+            expires_at = min(expires_at, credentials_expire_at)
+        valid_for = expires_at - self.margin - now
+        with self._lock:
+            self.misses += 1
+        if valid_for <= 0:
+            return url
+        if self.backend:
+            caches[self.backend].set(self.make_key(key), (url, expires_at), timeout=valid_for)
+        self._entries.set(key, url, ttl=valid_for)
+        return url
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+        }
@@ -1,90 +1,399 @@
-from typing import Optional, Text, Tuple, Type, Union
+import json
+import logging
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Text, Tuple, Type, Union
 from urllib.parse import urljoin
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.db.models import Model
-from django.http import JsonResponse
+from django.core.signals import setting_changed
+from django.db.models import Model, QuerySet
+from django.dispatch import receiver
+from django.http import JsonResponse, QueryDict
 from django.utils.module_loading import import_string
 
-from .fields import GenericFileField
+from .fields import GenericFile, GenericFileField
+from .instrumentation import measure
+from .services.renditions import UnrenderableImage, can_store_renditions, generate_rendition, get_renditions
+
+logger = logging.getLogger(__name__)
+
+MEDIA_URL_MAX_LIMIT = 1000
+MEDIA_URL_STREAM_CHUNK = 2000
+MEDIA_URL_BATCH_LIMIT = 1000
+
+MEDIA_LIST_MODES = ('urls', 'count', 'ranges')
 
 
 def make_media_url(origin: Text, model: Text, ff_tag: Text, pk: int) -> Text:
     return urljoin(origin, f'{model}/{ff_tag}/{pk}/')
 
 
-def get_model_info(path_model_name: Optional[str] = None) -> Union[None, Type[Model]]:
-    if not path_model_name:
-        try:
-            models = settings.DOWNLOADS.items()
-        except AttributeError:
+@lru_cache(maxsize=None)
+def load_model(model_path: str) -> Type[Model]:
+    return import_string(model_path)
+
+
+@lru_cache(maxsize=None)
+def get_media_registry() -> Dict[str, Tuple[Type[Model], List[GenericFileField]]]:
+    """
+        DOWNLOADS models with their GenericFileFields, built once:
+        on app load if 'media_sdk' is in INSTALLED_APPS, on first use otherwise.
+    """
+    registry = {}
+    for path_model_name, model_path in getattr(settings, 'DOWNLOADS', {}).items():
+        model = load_model(model_path)
+        registry[path_model_name] = (model, model.get_generic_file_fields())
+    return registry
+
+
+@receiver(setting_changed)
+def clear_media_registry(setting, **kwargs):
+    if setting == 'DOWNLOADS':
+        get_media_registry.cache_clear()
+
+
+def get_list_mode(query: QueryDict) -> str:
+    """
+        Reads "mode" listing param: 'urls' (default), 'count' or 'ranges'.
+        Raises ValueError for unknown mode.
+    """
+    mode = query.get('mode') or 'urls'
+    if mode not in MEDIA_LIST_MODES:
+        raise ValueError('unknown mode')
+    return mode
+
+
+def get_page_params(query: QueryDict) -> Tuple[Optional[int], Optional[int], bool]:
+    """
+        Reads "limit", "after" and "stream" listing params.
+        Raises ValueError for non integer or negative values.
+    """
+    limit = query.get('limit')
+    after = query.get('after')
+    limit = int(limit) if limit else None
+    after = int(after) if after else None
+    if limit is not None:
+        if limit <= 0:
+            raise ValueError('limit must be positive')
+        limit = min(limit, getattr(settings, 'MEDIA_URL_MAX_LIMIT', MEDIA_URL_MAX_LIMIT))
+    stream = query.get('stream', '').lower() in ('1', 'true', 'yes')
+    return limit, after, stream
+
+
+def get_page_pks(model: Type[Model], limit: Optional[int] = None,
+                 after: Optional[int] = None) -> Tuple[List[int], Optional[int]]:
+    """
+        Keyset pagination on primary key.
+        ::returns
+            (pks of the page, cursor for the next page or None)
+    """
+    queryset = model.objects.order_by('pk')
+    if after is not None:
+        queryset = queryset.filter(pk__gt=after)
+    queryset = queryset.values_list('pk', flat=True)
+    if limit is None:
+        return list(queryset), None
+    pks = list(queryset[:limit + 1])
+    if len(pks) > limit:
+        return pks[:limit], pks[limit - 1]
+    return pks, None
+
+
+def get_media_models(path_model_name: Optional[str] = None) -> Optional[List[Tuple[str, Type[Model]]]]:
+    registry = get_media_registry()
+    if path_model_name:
+        if path_model_name not in registry:
             return None
-        return models
-    try:
-        model = import_string(settings.DOWNLOADS[path_model_name])
-    except (AttributeError, KeyError):
+        return [(path_model_name, registry[path_model_name][0])]
+    if not registry:
         return None
-    return model
+    return [(name, model) for name, (model, _) in registry.items()]
+
+
+def get_model_file_fields(model: Type[Model], ff_tag: Optional[Text] = None) -> List[GenericFileField]:
+    file_fields = model.get_generic_file_fields()
+    if ff_tag is None:
+        return file_fields
+    return [file_field for file_field in file_fields if file_field.tag == ff_tag]
+
+
+def get_pk_ranges(pks: List[int]) -> List[List[int]]:
+    """Sorted pks as [first, last] ranges of consecutive values."""
+    ranges = []
+    for pk in pks:
+        if ranges and pk == ranges[-1][1] + 1:
+            ranges[-1][1] = pk
+        else:
+            ranges.append([pk, pk])
+    return ranges
 
 
-def get_all_media(origin: Text) -> Tuple[dict, int]:
-    models = get_model_info()
-    if not models:
+def collect_model_media(origin: Text, path_model_name: Text, model: Type[Model],
+                        file_fields: List[GenericFileField], limit: Optional[int] = None,
+                        after: Optional[int] = None, mode: str = 'urls') -> dict:
+    """
+        Reads pks once per model and reuses them for every field.
+        'count' and 'ranges' modes answer an url template per field ("{pk}" placeholder)
+        with amount of rows or [first, last] pk ranges instead of one url per row.
+    """
+    model_response_dict = {}
+    if mode != 'urls':
+        for file_field in file_fields:
+            model_response_dict[file_field.tag + '_field'] = make_media_url(
+                origin, path_model_name, file_field.tag, '{pk}'
+            )
+    if mode == 'count':
+        queryset = model.objects.all() if after is None else model.objects.filter(pk__gt=after)
+        model_response_dict['count'] = queryset.count()
+        return model_response_dict
+
+    pks, next_after = get_page_pks(model, limit, after)
+    if mode == 'ranges':
+        model_response_dict['ranges'] = get_pk_ranges(pks)
+    else:
+        for file_field in file_fields:
+            model_response_dict[file_field.tag + '_field'] = [
+                make_media_url(origin, path_model_name, file_field.tag, pk) for pk in pks
+            ]
+    if limit is not None:
+        model_response_dict['next'] = next_after
+    return model_response_dict
+
+
+def get_all_media(origin: Text, limit: Optional[int] = None, after: Optional[int] = None,
+                  mode: str = 'urls') -> Tuple[dict, int]:
+    registry = get_media_registry()
+    if not registry:
         return {'status': 'Nothing found'}, 404
     response_dict = {}
-    for path_model_name, model_path in models:
-        model = import_string(model_path)
-        instances = model.objects.all()
-        model_response_dict = response_dict[path_model_name+'_model'] = {}
-        model_file_fields = model().get_generic_file_fields()
-        for file_field in model_file_fields:
-            urls = model_response_dict[file_field.tag+'_field'] = []
-            for instance in instances:
-                urls.append(make_media_url(origin, path_model_name, file_field.tag, instance.id))
+    for path_model_name, (model, file_fields) in registry.items():
+        response_dict[path_model_name + '_model'] = collect_model_media(
+            origin, path_model_name, model, file_fields, limit, after, mode
+        )
     return response_dict, 200
 
 
-def get_model_media(origin: Text, path_model_name: Text) -> Tuple[dict, int]:
-    model = get_model_info(path_model_name)
+def get_model_media(origin: Text, path_model_name: Text, limit: Optional[int] = None,
+                    after: Optional[int] = None, mode: str = 'urls') -> Tuple[dict, int]:
+    model, file_fields = get_media_registry().get(path_model_name, (None, None))
     if not model:
         return {'status': 'Nothing found'}, 404
-    response_dict = {}
-    instances = model.objects.all()
-    model_response_dict = response_dict[path_model_name + '_model'] = {}
-    for file_field in model().get_generic_file_fields():
-        urls = model_response_dict[file_field.tag + '_field'] = []
-        for instance in instances:
-            urls.append(make_media_url(origin, path_model_name, file_field.tag, instance.id))
+    response_dict = {
+        path_model_name + '_model': collect_model_media(
+            origin, path_model_name, model, file_fields, limit, after, mode
+        )
+    }
     return response_dict, 200
 
 
-def get_model_field_media(origin: Text, path_model_name: Text, ff_tag: Text) -> Tuple[dict, int]:
-    model = get_model_info(path_model_name)
+def get_model_field_media(origin: Text, path_model_name: Text, ff_tag: Text, limit: Optional[int] = None,
+                          after: Optional[int] = None, mode: str = 'urls') -> Tuple[dict, int]:
+    model, file_fields = get_media_registry().get(path_model_name, (None, None))
     if not model:
         return {'status': 'Nothing found'}, 404
-    response_dict = {}
-    instances = model.objects.all()
-    model_response_dict = response_dict[path_model_name + '_model'] = {}
-    if model().get_generic_file_field_by_tag(ff_tag) is None:
+    file_fields = [file_field for file_field in file_fields if file_field.tag == ff_tag]
+    if not file_fields:
         return {'status': 'Nothing found'}, 404
-    urls = model_response_dict[ff_tag + '_field'] = []
-    for instance in instances:
-        urls.append(make_media_url(origin, path_model_name, ff_tag, instance.id))
+    response_dict = {
+        path_model_name + '_model': collect_model_media(
+            origin, path_model_name, model, file_fields, limit, after, mode
+        )
+    }
     return response_dict, 200
 
 
+def stream_media(origin: Text, models: List[Tuple[str, Type[Model]]], ff_tag: Optional[Text] = None,
+                 limit: Optional[int] = None, after: Optional[int] = None) -> Iterator[str]:
+    """
+        Yields the same json as get_*_media functions, but never holds more
+        than MEDIA_URL_STREAM_CHUNK urls in memory.
+        Pks are read once per model and reused for every field, as in collect_model_media.
+    """
+    chunk_size = getattr(settings, 'MEDIA_URL_STREAM_CHUNK', MEDIA_URL_STREAM_CHUNK)
+    yield '{'
+    for model_index, (path_model_name, model) in enumerate(models):
+        yield '%s%s: {' % (', ' if model_index else '', json.dumps(path_model_name + '_model'))
+        file_fields = get_model_file_fields(model, ff_tag)
+        pks, next_after = get_page_pks(model, limit, after)
+        for field_index, file_field in enumerate(file_fields):
+            yield '%s%s: [' % (', ' if field_index else '', json.dumps(file_field.tag + '_field'))
+            for start in range(0, len(pks), chunk_size):
+                yield (', ' if start else '') + ', '.join(
+                    json.dumps(make_media_url(origin, path_model_name, file_field.tag, pk))
+                    for pk in pks[start:start + chunk_size]
+                )
+            yield ']'
+        if limit is not None:
+            yield '%s"next": %s' % (', ' if file_fields else '', json.dumps(next_after))
+        yield '}'
+    yield '}'
+
+
+def get_model_field(model_name: Text, ff_tag: Text) -> Union[str, Tuple[Type[Model], GenericFileField]]:
+    """
+        ::returns
+            (model, field) or error status
+    """
+    try:
+        model = load_model(settings.DOWNLOADS[model_name])
+    except (ImportError, KeyError):
+        return 'No such model'
+    field = model.get_generic_file_fields_by_tag().get(ff_tag)
+    if field is None:
+        return 'No such field'
+    return model, field
+
+
+def get_batch_items(body: bytes) -> List[Tuple[str, str, int]]:
+    """
+        Reads {"items": [{"model": <name>, "tag": <field tag>, "pk": <pk>}, ...]} body.
+        Raises ValueError for malformed body or more than MEDIA_URL_BATCH_LIMIT items.
+    """
+    try:
+        items = json.loads(body or b'{}')['items']
+        if len(items) > getattr(settings, 'MEDIA_URL_BATCH_LIMIT', MEDIA_URL_BATCH_LIMIT):
+            raise ValueError('too many items')
+        return [(str(item['model']), str(item['tag']), int(item['pk'])) for item in items]
+    except (KeyError, TypeError) as error:
+        raise ValueError(error)
+
+
+def get_upload_params(body: bytes) -> Tuple[str, int]:
+    """
+        Reads {"filename": <name>, "size": <bytes>} body of direct upload request.
+        Raises ValueError for malformed body.
+    """
+    try:
+        params = json.loads(body or b'{}')
+        filename, size = str(params['filename']), int(params['size'])
+    except (KeyError, TypeError) as error:
+        raise ValueError(error)
+    if not filename or size < 0:
+        raise ValueError('wrong filename or size')
+    return filename, size
+
+
+def get_completion_params(body: bytes) -> Tuple[str, List[Tuple[int, str]]]:
+    """
+        Reads {"token": <token>, "parts": [{"part_number": <int>, "etag": <ETag>}, ...]} body
+        of direct upload completion, "parts" only for multipart uploads.
+        Raises ValueError for malformed body.
+    """
+    try:
+        params = json.loads(body or b'{}')
+        parts = [(int(part['part_number']), str(part['etag'])) for part in params.get('parts') or []]
+        return str(params['token']), parts
+    except (AttributeError, KeyError, TypeError) as error:
+        raise ValueError(error)
+
+
+def get_batch_field_files(items: List[Tuple[str, str, int]]) -> Dict[Tuple[str, str, int], Union[str, GenericFile]]:
+    """
+        Loads files of all (model name, field tag, pk) items, one in_bulk query per model.
+        ::returns
+            {item: file or error status}
+    """
+    result = {}
+    requested = {}
+    for item in items:
+        model_name, ff_tag, pk = item
+        model_field = get_model_field(model_name, ff_tag)
+        if isinstance(model_field, str):
+            result[item] = model_field
+            continue
+        model, field = model_field
+        fields, pks = requested.setdefault(model, (set(), set()))
+        fields.add(field.attname)
+        pks.add(pk)
+
+    with measure('orm'):
+        instances = {
+            model: model.objects.only(*fields).in_bulk(list(pks))
+            for model, (fields, pks) in requested.items()
+        }
+    for item in items:
+        if item in result:
+            continue
+        model_name, ff_tag, pk = item
+        model, field = get_model_field(model_name, ff_tag)
+        instance = instances[model].get(pk)
+        if instance is None:
+            result[item] = 'No such pk'
+            continue
+        result[item] = getattr(instance, field.attname) or 'No such field'
+    return result
+
+
+def get_variant_file(file_field: GenericFile, variant: Optional[Text] = None) -> Union[JsonResponse, GenericFile]:
+    """
+        Rendition `variant` of the file from 'renditions' config of its tag, generated on first request.
+        Without `variant`, on drivers that can not store renditions (tus) or for images Pillow
+        can not decode (truncated, decompression bombs) the file itself.
+    """
+    if not variant or not can_store_renditions(file_field.storage):
+        return file_field
+    spec = get_renditions(file_field.storage).get(variant)
+    if spec is None:
+        return JsonResponse({'status': 'No such variant'}, status=400)
+    try:
+        name = generate_rendition(file_field.storage, file_field.name, variant, spec)
+    except UnrenderableImage as error:
+        logger.warning('Serving original of "%s" instead of "%s" rendition: %s', file_field.name, variant, error)
+        return file_field
+    except (OSError, ValueError):
+        return JsonResponse({'status': 'Variant is not available'}, status=400)
+    return file_field.__class__(file_field.instance, file_field.field, name)
+
+
 def get_field_field(model_name: Text, ff_tag: Text, pk: int) -> Union[JsonResponse, GenericFileField]:
+    """
+        Loads only the file column of the instance, one narrow SELECT per call.
+    """
+    model_field = get_model_field(model_name, ff_tag)
+    if isinstance(model_field, str):
+        return JsonResponse({'status': model_field}, status=400)
+    model, field = model_field
     try:
-        model = import_string(settings.DOWNLOADS[model_name])
-    except ImportError:
-        return JsonResponse({'status': 'No such model'}, status=400)
+        with measure('orm'):
+            instance = model.objects.only(field.attname).get(pk=pk)
+    except model.DoesNotExist:
+        return JsonResponse({'status': 'No such pk'}, status=400)
+    return getattr(instance, field.attname) or JsonResponse({'status': 'No such field'}, status=400)
+
+
+async def aget_field_field(model_name: Text, ff_tag: Text, pk: int) -> Union[JsonResponse, GenericFileField]:
+    """
+        get_field_field for async views.
+        Uses async ORM (Django 4.1+), on older versions the query runs in a thread.
+    """
+    if not hasattr(QuerySet, 'aget'):
+        return await sync_to_async(get_field_field)(model_name, ff_tag, pk)
+    model_field = get_model_field(model_name, ff_tag)
+    if isinstance(model_field, str):
+        return JsonResponse({'status': model_field}, status=400)
+    model, field = model_field
     try:
-        instance = model.objects.get(id=pk)
+        with measure('orm'):
+            instance = await model.objects.only(field.attname).aget(pk=pk)
     except model.DoesNotExist:
         return JsonResponse({'status': 'No such pk'}, status=400)
+    return getattr(instance, field.attname) or JsonResponse({'status': 'No such field'}, status=400)
 
-    file_field = instance.get_generic_file_field_by_tag(ff_tag)
-    if not file_field:
-        return JsonResponse({'status': 'No such field'}, status=400)
-    return file_field
 
+def get_upload_instance(model_name: Text, ff_tag: Text, pk: int) -> Union[JsonResponse, Tuple[Model, GenericFileField]]:
+    """
+        Instance to attach directly uploaded file to, only its file column is loaded.
+        ::returns
+            (instance, field) or error response
+    """
+    model_field = get_model_field(model_name, ff_tag)
+    if isinstance(model_field, str):
+        return JsonResponse({'status': model_field}, status=400)
+    model, field = model_field
+    try:
+        with measure('orm'):
+            instance = model.objects.only(field.attname).get(pk=pk)
+    except model.DoesNotExist:
+        return JsonResponse({'status': 'No such pk'}, status=400)
+    return instance, field
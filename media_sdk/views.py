@@ -1,95 +1,309 @@
-import re
-from mimetypes import guess_type
+from functools import wraps
+from typing import Optional
 from urllib.parse import urljoin
 
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
 from django.core.handlers.wsgi import WSGIRequest
-from django.http import FileResponse, JsonResponse, StreamingHttpResponse
-from django.shortcuts import redirect
+from django.http import (HttpResponse, HttpResponseNotAllowed, JsonResponse,
+                         StreamingHttpResponse)
+from django.http.response import HttpResponseBase
 from django.urls import reverse
-from django.views.decorators.http import require_GET
+from django.utils.log import log_response
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
 
-from .utils import (get_all_media, get_field_field, get_model_field_media,
-                    get_model_media)
+from .instrumentation import aserver_timing, server_timing
+from .responses import (ASYNC_STREAMING, aiter_chunks, amedia_file_response,
+                        media_file_response)
+from .services.direct_upload import (DirectUploadError, finish_direct_upload,
+                                     has_upload_permission,
+                                     start_direct_upload)
+from .utils import (aget_field_field, get_all_media, get_batch_field_files,
+                    get_batch_items, get_completion_params, get_field_field,
+                    get_list_mode, get_media_models, get_model_field_media,
+                    get_model_file_fields, get_model_media, get_page_params,
+                    get_upload_instance, get_upload_params, get_variant_file,
+                    stream_media)
 
 
-@require_GET
-def retrieve_all_media_urls(request: WSGIRequest) -> JsonResponse:
-    response, status = get_all_media(request.get_raw_uri())
+def async_require_http_methods(request_method_list):
+    """require_http_methods for coroutine views, decorators of Django < 5.0 hide them behind a sync function."""
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            if request.method not in request_method_list:
+                response = HttpResponseNotAllowed(request_method_list)
+                log_response('Method Not Allowed (%s): %s', request.method, request.path,
+                             response=response, request=request)
+                return response
+            return await view(request, *args, **kwargs)
+        return inner
+    return decorator
+
+
+async_require_GET = async_require_http_methods(['GET'])
+async_require_POST = async_require_http_methods(['POST'])
+
+
+def media_urls_response(request: WSGIRequest, model_name: Optional[str] = None,
+                        ff_tag: Optional[str] = None) -> HttpResponseBase:
+    try:
+        limit, after, stream = get_page_params(request.GET)
+    except ValueError:
+        return JsonResponse({'status': 'Wrong pagination params'}, status=400)
+    try:
+        mode = get_list_mode(request.GET)
+    except ValueError:
+        return JsonResponse({'status': 'Wrong mode'}, status=400)
+    origin = request.build_absolute_uri()
+    if stream and mode == 'urls':
+        models = get_media_models(model_name)
+        if not models or (ff_tag and not get_model_file_fields(models[0][1], ff_tag)):
+            return JsonResponse({'status': 'Nothing found'}, status=404)
+        return StreamingHttpResponse(stream_media(origin, models, ff_tag, limit, after),
+                                     content_type='application/json')
+    if ff_tag:
+        response, status = get_model_field_media(origin, model_name, ff_tag, limit, after, mode)
+    elif model_name:
+        response, status = get_model_media(origin, model_name, limit, after, mode)
+    else:
+        response, status = get_all_media(origin, limit, after, mode)
     return JsonResponse(response, status=status)
 
 
 @require_GET
-def retrieve_model_media_urls(request: WSGIRequest, model_name: str) -> JsonResponse:
-    response, status = get_model_media(request.get_raw_uri(), model_name)
-    return JsonResponse(response, status=status)
+@server_timing
+def retrieve_all_media_urls(request: WSGIRequest) -> HttpResponseBase:
+    return media_urls_response(request)
 
 
 @require_GET
-def retrieve_model_field_media_urls(request: WSGIRequest, model_name: str, ff_tag: str) -> JsonResponse:
-    response, status = get_model_field_media(request.get_raw_uri(), model_name, ff_tag)
-    return JsonResponse(response, status=status)
+@server_timing
+def retrieve_model_media_urls(request: WSGIRequest, model_name: str) -> HttpResponseBase:
+    return media_urls_response(request, model_name)
 
 
 @require_GET
+@server_timing
+def retrieve_model_field_media_urls(request: WSGIRequest, model_name: str, ff_tag: str) -> HttpResponseBase:
+    return media_urls_response(request, model_name, ff_tag)
+
+
+@require_GET
+@server_timing
 def retrieve_specific_media_url(request: WSGIRequest, model_name: str, ff_tag: str, pk: int) -> JsonResponse:
     file_field = get_field_field(model_name, ff_tag, pk)
     if isinstance(file_field, JsonResponse):
         return file_field
-    raw_uri = request.get_raw_uri()
+    raw_uri = request.build_absolute_uri()
     url = file_field.url
     rest_url = reverse(retrieve_media_file, kwargs=dict(model_name=model_name, ff_tag=ff_tag, pk=pk))
     response = {"media_url": urljoin(raw_uri, url), "rest_url": urljoin(raw_uri, rest_url)}
     return JsonResponse(response, status=200)
 
 
+def media_urls_batch_response(request, retrieve_view) -> JsonResponse:
+    try:
+        items = get_batch_items(request.body)
+    except ValueError:
+        return JsonResponse({'status': 'Wrong items'}, status=400)
+    raw_uri = request.build_absolute_uri()
+    response = {}
+    for (model_name, ff_tag, pk), file_field in get_batch_field_files(items).items():
+        if isinstance(file_field, str):
+            response[f'{model_name}/{ff_tag}/{pk}'] = {'status': file_field}
+            continue
+        rest_url = reverse(retrieve_view, kwargs=dict(model_name=model_name, ff_tag=ff_tag, pk=pk))
+        response[f'{model_name}/{ff_tag}/{pk}'] = {
+            "media_url": urljoin(raw_uri, file_field.url), "rest_url": urljoin(raw_uri, rest_url)
+        }
+    return JsonResponse(response, status=200)
+
+
+@csrf_exempt
+@require_POST
+@server_timing
+def retrieve_media_urls_batch(request: WSGIRequest) -> JsonResponse:
+    """
+        Urls of many files at once, body: {"items": [{"model": <name>, "tag": <field tag>, "pk": <pk>}, ...]}.
+        POST only because the list does not fit a query string. CSRF exempt: nothing is written or generated
+        (no renditions, no uploads), the answer is what retrieve_specific_media_url gives to GET requests,
+        which CSRF middleware does not check either. Keep it read only.
+    """
+    return media_urls_batch_response(request, retrieve_media_file)
+
+
 @require_GET
+@server_timing
 def retrieve_media_file(request: WSGIRequest, model_name: str, ff_tag: str, pk: int):
     file_field = get_field_field(model_name, ff_tag, pk)
     if isinstance(file_field, JsonResponse):
         return file_field
-    storage = file_field.storage
-    if storage.__class__.__name__ == 'SaveLocal':
-        file, filename = storage.retrieve(file_field.name)
-        return FileResponse(file, filename=filename, content_type=guess_type(filename)[0])
-    elif storage.__class__.__name__ == 'SaveS3':
-        file_url = storage.retrieve(file_field.name)
-        return redirect(file_url)
-    else:
-        return JsonResponse({'status': 'Retrieving not allowed'}, status=401)
+    file_field = get_variant_file(file_field, request.GET.get('variant'))
+    if isinstance(file_field, JsonResponse):
+        return file_field
+    return media_file_response(request, file_field)
 
 
 @require_GET
+@server_timing
 def download_media_file(request: WSGIRequest, model_name: str, ff_tag: str, pk: int):
     file_field = get_field_field(model_name, ff_tag, pk)
     if isinstance(file_field, JsonResponse):
         return file_field
-    storage = file_field.storage
-    if storage.__class__.__name__ == 'SaveLocal':
-        file, filename = storage.download(file_field.name)
-        return FileResponse(file, filename=filename, content_type=guess_type(filename)[0], as_attachment=True)
-    elif storage.__class__.__name__ == 'SaveS3':
-        file_url = storage.download(file_field.name)
-        return redirect(file_url)
-    else:
-        return JsonResponse({'status': 'Retrieving not allowed'}, status=401)
+    file_field = get_variant_file(file_field, request.GET.get('variant'))
+    if isinstance(file_field, JsonResponse):
+        return file_field
+    return media_file_response(request, file_field, as_attachment=True)
 
 
-@require_GET
-def download_stream(request: WSGIRequest):
-    fs = open('MEDIA/crisis.avi', 'rb')
-    content_type = 'application/octet-stream'
-    range_header = request.META.get('HTTP_RANGE', None)
-    if range_header:
-        range_match = re.compile(r'bytes\s*=\s*(\d+)\s*-\s*(\d*)', re.I).match(range_header)
-        first_byte, last_byte = range_match.groups()
-        first_byte = int(first_byte) if first_byte else 0
-        last_byte = int(last_byte)
-        length = last_byte - first_byte + 1
-        fs.seek(first_byte, 0)
-        resp = StreamingHttpResponse(
-            iter(fs.read(length-1)), status=206, content_type=content_type)
-        resp['Content-Range'] = 'bytes %s-%s' % (first_byte, last_byte)
-    else:
-        resp = StreamingHttpResponse(fs, content_type=content_type)
-    resp['Accept-Ranges'] = 'bytes'
-    return resp
+def direct_upload_response(request: WSGIRequest, model_name: str, ff_tag: str, pk: int) -> JsonResponse:
+    instance_field = get_upload_instance(model_name, ff_tag, pk)
+    if isinstance(instance_field, JsonResponse):
+        return instance_field
+    instance, field = instance_field
+    if not has_upload_permission(request, instance, field):
+        return JsonResponse({'status': 'Forbidden'}, status=403)
+    try:
+        filename, size = get_upload_params(request.body)
+    except ValueError:
+        return JsonResponse({'status': 'Wrong upload params'}, status=400)
+    try:
+        response = start_direct_upload(instance, field, filename, size)
+    except DirectUploadError as error:
+        return JsonResponse({'status': str(error)}, status=400)
+    return JsonResponse(response, status=200)
+
+
+def complete_upload_response(request: WSGIRequest, model_name: str, ff_tag: str, pk: int,
+                             retrieve_view) -> JsonResponse:
+    instance_field = get_upload_instance(model_name, ff_tag, pk)
+    if isinstance(instance_field, JsonResponse):
+        return instance_field
+    instance, field = instance_field
+    if not has_upload_permission(request, instance, field):
+        return JsonResponse({'status': 'Forbidden'}, status=403)
+    try:
+        token, parts = get_completion_params(request.body)
+    except ValueError:
+        return JsonResponse({'status': 'Wrong completion params'}, status=400)
+    try:
+        finish_direct_upload(instance, field, token, parts)
+    except DirectUploadError as error:
+        return JsonResponse({'status': str(error)}, status=400)
+    raw_uri = request.build_absolute_uri()
+    rest_url = reverse(retrieve_view, kwargs=dict(model_name=model_name, ff_tag=ff_tag, pk=pk))
+    file_field = getattr(instance, field.attname)
+    response = {"media_url": urljoin(raw_uri, file_field.url), "rest_url": urljoin(raw_uri, rest_url)}
+    return JsonResponse(response, status=200)
+
+
+@require_POST
+@server_timing
+def start_media_upload(request: WSGIRequest, model_name: str, ff_tag: str, pk: int) -> JsonResponse:
+    """
+        Signs upload of a file straight to the bucket of the tag ('direct_upload' config),
+        body: {"filename": <name>, "size": <bytes>}.
+    """
+    return direct_upload_response(request, model_name, ff_tag, pk)
+
+
+@require_POST
+@server_timing
+def complete_media_upload(request: WSGIRequest, model_name: str, ff_tag: str, pk: int) -> JsonResponse:
+    """
+        Attaches uploaded file to the row, body: {"token": <token>, "parts": [{"part_number": 1, "etag": ...}, ...]}.
+    """
+    return complete_upload_response(request, model_name, ff_tag, pk, retrieve_media_file)
+
+
+async def amedia_urls_response(request: ASGIRequest, model_name: Optional[str] = None,
+                               ff_tag: Optional[str] = None) -> HttpResponseBase:
+    response = await sync_to_async(media_urls_response)(request, model_name, ff_tag)
+    if not response.streaming:
+        return response
+    if ASYNC_STREAMING:
+        response.streaming_content = aiter_chunks(response.streaming_content, thread_sensitive=True)
+        return response
+    # ASGI handler of Django < 4.2 iterates the body in the event loop, where ORM queries are not allowed
+    content = await sync_to_async(b''.join)(response.streaming_content)
+    return HttpResponse(content, content_type=response['Content-Type'])
+
+
+@async_require_GET
+@aserver_timing
+async def aretrieve_all_media_urls(request: ASGIRequest) -> HttpResponseBase:
+    return await amedia_urls_response(request)
+
+
+@async_require_GET
+@aserver_timing
+async def aretrieve_model_media_urls(request: ASGIRequest, model_name: str) -> HttpResponseBase:
+    return await amedia_urls_response(request, model_name)
+
+
+@async_require_GET
+@aserver_timing
+async def aretrieve_model_field_media_urls(request: ASGIRequest, model_name: str, ff_tag: str) -> HttpResponseBase:
+    return await amedia_urls_response(request, model_name, ff_tag)
+
+
+@async_require_GET
+@aserver_timing
+async def aretrieve_specific_media_url(request: ASGIRequest, model_name: str, ff_tag: str, pk: int) -> JsonResponse:
+    file_field = await aget_field_field(model_name, ff_tag, pk)
+    if isinstance(file_field, JsonResponse):
+        return file_field
+    raw_uri = request.build_absolute_uri()
+    url = await file_field.storage.aurl(file_field.name)
+    rest_url = reverse(aretrieve_media_file, kwargs=dict(model_name=model_name, ff_tag=ff_tag, pk=pk))
+    response = {"media_url": urljoin(raw_uri, url), "rest_url": urljoin(raw_uri, rest_url)}
+    return JsonResponse(response, status=200)
+
+
+@async_require_GET
+@aserver_timing
+async def aretrieve_media_file(request: ASGIRequest, model_name: str, ff_tag: str, pk: int):
+    file_field = await aget_field_field(model_name, ff_tag, pk)
+    if isinstance(file_field, JsonResponse):
+        return file_field
+    file_field = await sync_to_async(get_variant_file, thread_sensitive=False)(file_field, request.GET.get('variant'))
+    if isinstance(file_field, JsonResponse):
+        return file_field
+    return await amedia_file_response(request, file_field)
+
+
+@async_require_GET
+@aserver_timing
+async def adownload_media_file(request: ASGIRequest, model_name: str, ff_tag: str, pk: int):
+    file_field = await aget_field_field(model_name, ff_tag, pk)
+    if isinstance(file_field, JsonResponse):
+        return file_field
+    file_field = await sync_to_async(get_variant_file, thread_sensitive=False)(file_field, request.GET.get('variant'))
+    if isinstance(file_field, JsonResponse):
+        return file_field
+    return await amedia_file_response(request, file_field, as_attachment=True)
+
+
+@async_require_POST
+@aserver_timing
+async def aretrieve_media_urls_batch(request: ASGIRequest) -> JsonResponse:
+    """Async retrieve_media_urls_batch, CSRF exempt for the same reason."""
+    return await sync_to_async(media_urls_batch_response)(request, aretrieve_media_file)
+
+
+# what csrf_exempt does, its wrapper of Django < 5.0 is not a coroutine function
+aretrieve_media_urls_batch.csrf_exempt = True
+
+
+@async_require_POST
+@aserver_timing
+async def astart_media_upload(request: ASGIRequest, model_name: str, ff_tag: str, pk: int) -> JsonResponse:
+    return await sync_to_async(direct_upload_response)(request, model_name, ff_tag, pk)
+
+
+@async_require_POST
+@aserver_timing
+async def acomplete_media_upload(request: ASGIRequest, model_name: str, ff_tag: str, pk: int) -> JsonResponse:
+    return await sync_to_async(complete_upload_response)(request, model_name, ff_tag, pk, aretrieve_media_file)
@@ -4,7 +4,14 @@ setup(
     name='django_sdk_media',
     install_requires=[
         'Django>=3.0',
-        'boto3==1.16.60',
-        'tuspy==0.2.4 '
-    ]
+        'boto3>=1.26',
+        'botocore>=1.29',
+        'tuspy>=1.0,<2',
+    ],
+    extras_require={
+        'renditions': ['Pillow'],
+        'brotli': ['Brotli'],
+        'zstd': ['zstandard'],
+        'crc32c': ['crc32c'],
+    }
 )
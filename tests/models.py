@@ -0,0 +1,15 @@
+from django.db import models
+
+from media_sdk import GenericFileField, Media
+
+
+class Item(Media):
+    title = models.CharField(max_length=20, default='')
+    file = GenericFileField(tag='local', null=True, blank=True)
+    blob = GenericFileField(tag='dedup', null=True, blank=True)
+    upload = GenericFileField(tag='direct', null=True, blank=True)
+    private_upload = GenericFileField(tag='direct_private', null=True, blank=True)
+    attachment = models.FileField(upload_to='attachments', null=True, blank=True)
+
+    class Meta:
+        app_label = 'tests'
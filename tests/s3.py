@@ -0,0 +1,31 @@
+import os
+from unittest import mock, skipIf
+
+try:
+    from moto import mock_aws
+except ImportError:  # moto < 5 or not installed
+    mock_aws = None
+
+from media_sdk.services import clients
+
+BUCKET = 'media-sdk-tests'
+
+
+@skipIf(mock_aws is None, "S3 tests require moto 5, install it with 'pip install moto'")
+class S3TestMixin:
+    """Runs every test against a fresh moto S3 with the tests bucket, clients are built inside the mock."""
+
+    def setUp(self):
+        super(S3TestMixin, self).setUp()
+        environ = mock.patch.dict(os.environ, {'AWS_ACCESS_KEY_ID': 'testing', 'AWS_SECRET_ACCESS_KEY': 'testing',
+                                               'AWS_DEFAULT_REGION': 'us-east-1'})
+        environ.start()
+        self.addCleanup(environ.stop)
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        cached_clients = mock.patch.dict(clients._clients, clear=True)
+        cached_clients.start()
+        self.addCleanup(cached_clients.stop)
+        self.s3_client = clients.get_s3_client({'region_name': 'us-east-1'})
+        self.s3_client.create_bucket(Bucket=BUCKET)
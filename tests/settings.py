@@ -0,0 +1,51 @@
+"""
+    Settings of the test project: in-memory SQLite and a temporary MEDIA_ROOT.
+    Run the tests with "python runtests.py".
+"""
+import tempfile
+
+SECRET_KEY = 'tests'
+INSTALLED_APPS = ['django.contrib.contenttypes', 'media_sdk', 'tests']
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+}
+MEDIA_ROOT = tempfile.mkdtemp(prefix='media_sdk_tests_')
+MEDIA_URL = '/media/'
+ROOT_URLCONF = 'media_sdk.urls'
+USE_TZ = True
+DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+
+STORAGE_OPTIONS = {
+    'local': {
+        'driver': 'local',
+        'configs': {},
+    },
+    'dedup': {
+        'driver': 'local',
+        'configs': {'dedup': True},
+    },
+    # S3 tags are used with moto only
+    'direct': {
+        'driver': 's3',
+        'configs': {
+            'bucket': 'media-sdk-tests',
+            'region_name': 'us-east-1',
+            'direct_upload': True,
+            'upload_max_size': 8 * 1024 * 1024,
+            'multipart_threshold': 5 * 1024 * 1024,
+            'multipart_chunksize': 5 * 1024 * 1024,
+        },
+    },
+    'direct_private': {
+        'driver': 's3',
+        'configs': {
+            'bucket': 'media-sdk-tests',
+            'region_name': 'us-east-1',
+            'privat': 'Private',
+            'direct_upload': True,
+        },
+    },
+}
@@ -0,0 +1,108 @@
+import asyncio
+import json
+
+from django.core.files.base import ContentFile
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from media_sdk import views
+from media_sdk.responses import ASYNC_STREAMING
+from media_sdk.services.media_storage import SaveLocal
+
+from .models import Item
+
+CONTENT = b'0123456789' * 1000
+
+
+async def read_content(response):
+    if not response.streaming:
+        return response.content
+    if getattr(response, 'is_async', False):
+        return b''.join([chunk async for chunk in response.streaming_content])
+    return b''.join(response.streaming_content)
+
+
+class AsyncDriverTests(SimpleTestCase):
+    async def test_local_driver(self):
+        storage = SaveLocal({})
+        name = await storage.asave('async.txt', ContentFile(b'async'))
+        self.addCleanup(storage.delete, name)
+
+        self.assertTrue(await storage.aexists(name))
+        self.assertEqual(await storage.aurl(name), storage.url(name))
+        validators = await storage.avalidators(name)
+        self.assertEqual(validators, storage.validators(name))
+        await storage.adelete(name)
+        self.assertFalse(await storage.aexists(name))
+
+    async def test_calls_run_concurrently(self):
+        storage = SaveLocal({})
+        names = await asyncio.gather(*[storage.asave('async.txt', ContentFile(b'x')) for _ in range(4)])
+        for name in names:
+            self.addCleanup(storage.delete, name)
+        self.assertEqual(len(set(names)), 4)
+
+    def test_views_are_coroutines(self):
+        for name in ('aretrieve_all_media_urls', 'aretrieve_model_media_urls', 'aretrieve_model_field_media_urls',
+                     'aretrieve_specific_media_url', 'aretrieve_media_file', 'adownload_media_file',
+                     'aretrieve_media_urls_batch', 'astart_media_upload', 'acomplete_media_upload'):
+            self.assertTrue(asyncio.iscoroutinefunction(getattr(views, name)), name)
+        self.assertTrue(views.aretrieve_media_urls_batch.csrf_exempt)
+
+
+@override_settings(DOWNLOADS={'item': 'tests.models.Item'}, ROOT_URLCONF='media_sdk.async_urls')
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        self.client = AsyncClient()
+        self.item = Item()
+        self.item.file.save('a.txt', ContentFile(CONTENT))
+        self.item.save()
+        self.addCleanup(self.item.file.storage.delete, self.item.file.name)
+
+    async def test_retrieve_and_download(self):
+        response = await self.client.get(f'/retrieve/item/local/{self.item.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(await read_content(response), CONTENT)
+        if ASYNC_STREAMING:
+            self.assertTrue(response.is_async)
+
+        response = await self.client.get(f'/download/item/local/{self.item.pk}/')
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertEqual(await read_content(response), CONTENT)
+
+    async def test_range(self):
+        # headers of AsyncClient differ between Django versions, async views take any request
+        request = RequestFactory().get(f'/retrieve/item/local/{self.item.pk}/', HTTP_RANGE='bytes=10-19')
+        response = await views.aretrieve_media_file(request, 'item', 'local', self.item.pk)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(await read_content(response), CONTENT[10:20])
+
+    async def test_errors(self):
+        response = await self.client.get(f'/retrieve/item/local/{self.item.pk + 1}/')
+        self.assertEqual((response.status_code, json.loads(response.content)), (400, {'status': 'No such pk'}))
+        response = await self.client.get(f'/retrieve/item/dedup/{self.item.pk}/')
+        self.assertEqual(json.loads(response.content), {'status': 'No such field'})
+        response = await self.client.get(f'/retrieve/item/local/{self.item.pk}/?variant=thumb')
+        self.assertEqual(json.loads(response.content), {'status': 'No such variant'})
+        response = await self.client.post(f'/retrieve/item/local/{self.item.pk}/')
+        self.assertEqual(response.status_code, 405)
+
+    async def test_specific_url(self):
+        response = await self.client.get(f'/media-url/item/local/{self.item.pk}/')
+        self.assertEqual(json.loads(response.content), {
+            'media_url': 'http://testserver/media/' + self.item.file.name,
+            'rest_url': f'http://testserver/retrieve/item/local/{self.item.pk}/',
+        })
+
+    async def test_listing(self):
+        # query strings are in the path, AsyncClient of Django < 4.0 drops `data` of GET requests
+        plain = json.loads(await read_content(await self.client.get('/media-url/item/?limit=5')))
+        streamed = await self.client.get('/media-url/item/?limit=5&stream=1')
+        self.assertEqual(json.loads(await read_content(streamed)), plain)
+        self.assertEqual(len(plain['item_model']['local_field']), 1)
+        self.assertTrue(plain['item_model']['local_field'][0].endswith(f'item/local/{self.item.pk}/'))
+
+    async def test_batch(self):
+        body = json.dumps({'items': [{'model': 'item', 'tag': 'local', 'pk': self.item.pk}]})
+        response = await self.client.post('/media-url-batch/', body, content_type='application/json')
+        self.assertEqual(json.loads(response.content)[f'item/local/{self.item.pk}']['rest_url'],
+                         f'http://testserver/retrieve/item/local/{self.item.pk}/')
@@ -0,0 +1,59 @@
+import json
+
+from django.core.files.base import ContentFile
+from django.test import Client, TestCase, override_settings
+
+from .models import Item
+
+
+@override_settings(DOWNLOADS={'item': 'tests.models.Item', 'batch': 'tests.models.Item'},
+                   MIDDLEWARE=['django.middleware.csrf.CsrfViewMiddleware'])
+class MediaUrlsBatchTests(TestCase):
+    def setUp(self):
+        self.client = Client(enforce_csrf_checks=True)
+        self.item = Item()
+        self.item.file.save('a.txt', ContentFile(b'a'))
+        self.item.save()
+        self.addCleanup(self.item.file.storage.delete, self.item.file.name)
+
+    def post(self, body):
+        return self.client.post('/media-url-batch/', body, content_type='application/json')
+
+    def test_urls_without_csrf_token(self):
+        pk = self.item.pk
+        response = self.post(json.dumps({'items': [
+            {'model': 'item', 'tag': 'local', 'pk': pk},
+            {'model': 'item', 'tag': 'dedup', 'pk': pk},
+            {'model': 'item', 'tag': 'local', 'pk': pk + 1},
+            {'model': 'item', 'tag': 'missing', 'pk': pk},
+            {'model': 'missing', 'tag': 'local', 'pk': pk},
+        ]}))
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body[f'item/local/{pk}'], {
+            'media_url': 'http://testserver/media/' + self.item.file.name,
+            'rest_url': f'http://testserver/retrieve/item/local/{pk}/',
+        })
+        self.assertEqual(body[f'item/dedup/{pk}'], {'status': 'No such field'})
+        self.assertEqual(body[f'item/local/{pk + 1}'], {'status': 'No such pk'})
+        self.assertEqual(body[f'item/missing/{pk}'], {'status': 'No such field'})
+        self.assertEqual(body[f'missing/local/{pk}'], {'status': 'No such model'})
+
+    def test_wrong_items(self):
+        for body in ('zz', '{}', '{"items": [{"model": "item"}]}', '{"items": [{"model": "item", "tag": "local"}]}'):
+            response = self.post(body)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'status': 'Wrong items'})
+        with override_settings(MEDIA_URL_BATCH_LIMIT=1):
+            items = [{'model': 'item', 'tag': 'local', 'pk': self.item.pk}] * 2
+            self.assertEqual(self.post(json.dumps({'items': items})).status_code, 400)
+
+    def test_only_post(self):
+        self.assertEqual(self.client.get('/media-url-batch/').status_code, 405)
+
+    def test_model_named_batch_is_listed(self):
+        response = self.client.get('/media-url/batch/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('batch_model', response.json())
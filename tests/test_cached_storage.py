@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase
+
+from media_sdk.services.disk_cache import FILL_PREFIX, DiskCache
+from media_sdk.services.media_storage import CachedStorage, SaveLocal
+
+
+class CacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp(prefix='media_sdk_cache_')
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+
+    def leftovers(self):
+        return [name for _, _, files in os.walk(self.location) for name in files if name.startswith(FILL_PREFIX)]
+
+
+class DiskCacheTests(CacheTestCase):
+    def test_too_big_file_is_not_written(self):
+        cache = DiskCache(self.location, max_size=10)
+        write = mock.Mock()
+
+        self.assertIsNone(cache.fill('big.txt', write, size=11))
+        write.assert_not_called()
+
+    def test_fill_stops_once_limit_is_passed(self):
+        cache = DiskCache(self.location, max_size=10)
+        written = []
+
+        def write(file):
+            for _ in range(100):
+                file.write(b'12345')
+                written.append(5)
+
+        self.assertIsNone(cache.fill('big.txt', write))
+        self.assertEqual(sum(written), 10)
+        self.assertNotIn('big.txt', cache)
+        self.assertEqual(self.leftovers(), [])
+
+    def test_least_recently_used_is_evicted(self):
+        cache = DiskCache(self.location, max_size=10)
+        cache.fill('a.txt', lambda file: file.write(b'aaaa'))
+        cache.fill('b.txt', lambda file: file.write(b'bbbb'))
+        cache.get('a.txt')
+        cache.fill('c.txt', lambda file: file.write(b'cccc'))
+
+        self.assertIn('a.txt', cache)
+        self.assertNotIn('b.txt', cache)
+        self.assertEqual(cache.size, 8)
+
+    def test_pins_survive_restart(self):
+        cache = DiskCache(self.location, max_size=10)
+        cache.fill('dir/pinned.txt', lambda file: file.write(b'pppppp'), pin=True)
+        cache.fill('other.txt', lambda file: file.write(b'oo'))
+
+        restarted = DiskCache(self.location, max_size=5)
+        self.assertEqual(restarted.pinned(), ['dir/pinned.txt'])
+        self.assertIn('dir/pinned.txt', restarted)
+        self.assertNotIn('other.txt', restarted)
+
+        restarted.unpin('dir/pinned.txt')
+        self.assertEqual(DiskCache(self.location, max_size=10).pinned(), [])
+
+
+class CachedStorageWriteBackTests(CacheTestCase):
+    def storage(self):
+        return CachedStorage({'backend': {'driver': 'local', 'configs': {}}, 'write_mode': 'back',
+                              'write_back_retries': 0, 'cache_location': self.location})
+
+    def test_failed_write_back_is_resumed_after_restart(self):
+        name = 'write-back/resumed.txt'
+        with mock.patch.object(SaveLocal, '_save', side_effect=OSError('backend is down')):
+            storage = self.storage()
+            with self.assertLogs('media_sdk.services.media_storage', 'ERROR'):
+                self.assertEqual(storage._save(name, ContentFile(b'only copy', name=name)), name)
+                storage.flush()
+        self.assertEqual(storage.cache.pinned(), [name])
+        self.assertFalse(storage.backend.exists(name))
+
+        restarted = self.storage()
+        restarted.flush()
+        self.addCleanup(restarted.backend.delete, name)
+        self.assertEqual(restarted.cache.pinned(), [])
+        with restarted.backend.open(name) as file:
+            self.assertEqual(file.read(), b'only copy')
+
+    def test_already_stored_file_is_only_unpinned(self):
+        name = 'write-back/stored.txt'
+        storage = self.storage()
+        storage.cache.fill(name, lambda file: file.write(b'stored'), pin=True)
+        storage.backend._save(name, ContentFile(b'stored'))
+        self.addCleanup(storage.backend.delete, name)
+
+        with mock.patch.object(SaveLocal, '_save') as save:
+            restarted = self.storage()
+            restarted.flush()
+        save.assert_not_called()
+        self.assertEqual(restarted.cache.pinned(), [])
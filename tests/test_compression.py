@@ -0,0 +1,123 @@
+import io
+import os
+from unittest import skipIf
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase
+
+from media_sdk.services.compression import (CODECS, CompressedStream, CompressionPolicy, decompress_into,
+                                            parse_accept_encoding)
+from media_sdk.services.media_storage import SaveLocal
+
+
+def installed(codec_name):
+    try:
+        CODECS[codec_name].check()
+    except ImproperlyConfigured:
+        return False
+    return True
+
+
+CONTENT = b''.join(b'line %d of a compressible text file\n' % index for index in range(5000))
+
+
+class CompressionPolicyTests(SimpleTestCase):
+    def test_precompressed_none_is_rejected(self):
+        for precompressed in (['none'], ['gzip', 'none'], {'none': None}, ['lzma']):
+            with self.assertRaises(ImproperlyConfigured):
+                CompressionPolicy({'precompressed': precompressed})
+
+    def test_levels(self):
+        policy = CompressionPolicy({'compression': 'gzip', 'gzip_level': 4, 'precompressed': {'gzip': 6}})
+        self.assertEqual(policy.level, 4)
+        self.assertEqual([(codec.name, level) for codec, level in policy.precompressed], [('gzip', 6)])
+        self.assertIsNone(CompressionPolicy({'compression': 'none'}).codec)
+
+    def test_types(self):
+        policy = CompressionPolicy({'compression': 'gzip', 'compression_min_size': 10})
+        self.assertIsNotNone(policy.codec_for('text/plain', 10))
+        self.assertIsNone(policy.codec_for('text/plain', 9))
+        self.assertIsNone(policy.codec_for('image/png', 10))
+        policy = CompressionPolicy({'compression': 'gzip', 'compression_types': ['text/*']})
+        self.assertIsNotNone(policy.codec_for('text/csv'))
+        self.assertIsNone(policy.codec_for('application/json'))
+        self.assertIsNone(policy.codec_for(None))
+
+    def test_parse_accept_encoding(self):
+        self.assertEqual(parse_accept_encoding('br;q=1.0, GZIP;q=0.8, *;q=0'), {'br': 1.0, 'gzip': 0.8, '*': 0.0})
+        self.assertEqual(parse_accept_encoding('gzip;q=x, , zstd'), {'gzip': 0.0, 'zstd': 1.0})
+
+
+class CompressedStreamTests(SimpleTestCase):
+    def round_trip(self, codec_name):
+        codec = CODECS[codec_name]
+        stream = CompressedStream(io.BytesIO(CONTENT), codec, chunk_size=1000)
+        compressed = bytearray()
+        # odd read sizes cross the chunk boundaries
+        while True:
+            data = stream.read(777)
+            if not data:
+                break
+            compressed += data
+        self.assertEqual(stream.size, len(CONTENT))
+        self.assertLess(len(compressed), len(CONTENT))
+        decompressed = io.BytesIO()
+        decompress_into(io.BytesIO(bytes(compressed)), decompressed, codec, chunk_size=100)
+        self.assertEqual(decompressed.getvalue(), CONTENT)
+
+    def test_gzip(self):
+        self.round_trip('gzip')
+
+    @skipIf(not installed('br'), 'Brotli is not installed')
+    def test_br(self):
+        self.round_trip('br')
+
+    @skipIf(not installed('zstd'), 'zstandard is not installed')
+    def test_zstd(self):
+        self.round_trip('zstd')
+
+    def test_read_all_and_text_content(self):
+        stream = CompressedStream(io.StringIO(CONTENT.decode()), CODECS['gzip'])
+        decompressed = io.BytesIO()
+        decompress_into(io.BytesIO(stream.read()), decompressed, CODECS['gzip'])
+        self.assertEqual(decompressed.getvalue(), CONTENT)
+
+
+class NegotiationTests(SimpleTestCase):
+    def storage(self, precompressed, name='text.txt', content=CONTENT):
+        storage = SaveLocal({'precompressed': precompressed})
+        name = storage.save(name, ContentFile(content))
+        self.addCleanup(storage.delete, name)
+        return storage, name
+
+    def test_gzip(self):
+        storage, name = self.storage(['gzip'])
+        self.assertTrue(os.path.exists(storage.path(name) + '.gz'))
+        self.assertEqual(storage.select_encoding(name, 'gzip, deflate'), 'gzip')
+        self.assertEqual(storage.select_encoding(name, '*'), 'gzip')
+        self.assertIsNone(storage.select_encoding(name, 'gzip;q=0, deflate'))
+        self.assertIsNone(storage.select_encoding(name, 'identity'))
+        self.assertIsNone(storage.select_encoding(name, ''))
+
+    def test_incompressible_copy_is_dropped(self):
+        storage, name = self.storage(['gzip'], content=os.urandom(4096))
+        self.assertFalse(os.path.exists(storage.path(name) + '.gz'))
+        self.assertIsNone(storage.select_encoding(name, 'gzip'))
+
+    def test_skipped_types(self):
+        storage, name = self.storage(['gzip'], name='image.png')
+        self.assertIsNone(storage.select_encoding(name, 'gzip'))
+
+    @skipIf(not installed('br') or not installed('zstd'), 'Brotli or zstandard is not installed')
+    def test_server_preference_order(self):
+        storage, name = self.storage(['br', 'zstd', 'gzip'])
+        self.assertEqual(storage.select_encoding(name, 'gzip, zstd, br'), 'br')
+        self.assertEqual(storage.select_encoding(name, 'gzip, zstd'), 'zstd')
+        self.assertEqual(storage.select_encoding(name, 'br;q=0, gzip'), 'gzip')
+        self.assertEqual(storage.precompressed_name(name, 'zstd'), name + '.zst')
+        for extension in ('.br', '.zst', '.gz'):
+            with open(storage.path(name) + extension, 'rb') as file, io.BytesIO() as decompressed:
+                codec = {'.br': CODECS['br'], '.zst': CODECS['zstd'], '.gz': CODECS['gzip']}[extension]
+                decompress_into(file, decompressed, codec)
+                self.assertEqual(decompressed.getvalue(), CONTENT)
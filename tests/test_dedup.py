@@ -0,0 +1,59 @@
+from django.core.files.base import ContentFile
+from django.test import TestCase, TransactionTestCase
+
+from media_sdk.models import StoredBlob
+from media_sdk.services.media_service import save_bulk
+
+from .models import Item
+
+
+class DedupTests(TestCase):
+    def save_blob(self, item, content):
+        item.blob.save('blob.txt', ContentFile(content))
+        item.save()
+        return item
+
+    def test_resaving_equal_content_keeps_one_reference(self):
+        item = self.save_blob(Item(), b'same')
+        name = item.blob.name
+        self.save_blob(item, b'same')
+        self.save_blob(Item.objects.get(pk=item.pk), b'same')
+
+        self.assertEqual(item.blob.name, name)
+        self.assertEqual(StoredBlob.objects.get(tag='dedup', name=name).references, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            item.delete()
+        self.assertFalse(StoredBlob.objects.filter(tag='dedup', name=name).exists())
+        self.assertFalse(item.blob.storage.exists(name))
+
+    def test_shared_file_survives_resave_and_delete_of_one_row(self):
+        first = self.save_blob(Item(), b'shared')
+        second = self.save_blob(Item(), b'shared')
+        name = first.blob.name
+        self.assertEqual(second.blob.name, name)
+        self.save_blob(second, b'shared')
+        self.assertEqual(StoredBlob.objects.get(tag='dedup', name=name).references, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertEqual(StoredBlob.objects.get(tag='dedup', name=name).references, 1)
+        self.assertTrue(first.blob.storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertFalse(first.blob.storage.exists(name))
+
+
+class DedupBulkTests(TransactionTestCase):
+    """Uploads run in pool threads with their own connections, rows must be committed."""
+
+    def test_bulk_resave_keeps_one_reference(self):
+        item = Item()
+        item.blob.save('blob.txt', ContentFile(b'bulk'))
+        item.save()
+        name = item.blob.name
+        results = save_bulk(Item, [{'instance': item, 'fields_data': {'dedup': {'name': 'blob.txt',
+                                                                                 'content': ContentFile(b'bulk')}}}])
+
+        self.assertIsNone(results[0]['error'])
+        self.assertEqual(item.blob.name, name)
+        self.assertEqual(StoredBlob.objects.get(tag='dedup', name=name).references, 1)
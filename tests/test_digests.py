@@ -0,0 +1,165 @@
+import base64
+import hashlib
+import io
+import os
+import tempfile
+import zlib
+from unittest import mock, skipIf
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, TransactionTestCase
+
+from media_sdk.services import content_digest
+from media_sdk.services.content_digest import DIGESTS, check_digest, compute_digests, content_digests
+from media_sdk.services.media_storage import SaveS3
+
+from .models import Item
+from .s3 import BUCKET, S3TestMixin
+
+CONTENT = os.urandom(3 * 1024 * 1024 + 123)
+ALGORITHMS = ('md5', 'sha1', 'sha256', 'crc32')
+
+
+def installed(algorithm):
+    try:
+        check_digest(algorithm)
+    except ImproperlyConfigured:
+        return False
+    return True
+
+
+def expected_digests(content):
+    return {
+        'md5': hashlib.md5(content).digest(),
+        'sha1': hashlib.sha1(content).digest(),
+        'sha256': hashlib.sha256(content).digest(),
+        'crc32': zlib.crc32(content).to_bytes(4, 'big'),
+    }
+
+
+class ComputeDigestsTests(SimpleTestCase):
+    def disk_file(self, content):
+        fd, path = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'wb') as file:
+            file.write(content)
+        file = open(path, 'rb')
+        self.addCleanup(file.close)
+        return file
+
+    def assertDigests(self, content, expected=CONTENT):
+        digests = compute_digests(content, ALGORITHMS, chunk_size=64 * 1024)
+        self.assertEqual(digests.digests, expected_digests(expected))
+        self.assertEqual(digests.size, len(expected))
+        self.assertEqual(content.tell(), 0)
+
+    def test_disk_file(self):
+        file = self.disk_file(CONTENT)
+        file.read(10)
+        self.assertDigests(File(file))
+        # the mapping is closed, the file can be closed as well
+        file.close()
+
+    def test_empty_disk_file(self):
+        self.assertDigests(File(self.disk_file(b'')), b'')
+
+    def test_bytes_io(self):
+        buffer = io.BytesIO(CONTENT)
+        self.assertDigests(ContentFile(CONTENT))
+        self.assertDigests(buffer)
+        # no view of the buffer is left, it can be resized
+        buffer.write(b'more')
+
+    def test_other_binary_stream(self):
+        self.assertDigests(File(io.BufferedReader(io.BytesIO(CONTENT))))
+
+    def test_text(self):
+        self.assertDigests(ContentFile('text ' * 1000), b'text ' * 1000)
+
+    def test_forms(self):
+        digests = compute_digests(ContentFile(b'abc'), ('md5', 'crc32'))
+        self.assertEqual(digests.hex('md5'), hashlib.md5(b'abc').hexdigest())
+        self.assertEqual(digests.base64('md5'), base64.b64encode(hashlib.md5(b'abc').digest()).decode())
+        self.assertEqual(digests.hex('crc32'), '%08x' % zlib.crc32(b'abc'))
+        self.assertIn('md5', digests)
+        self.assertNotIn('sha1', digests)
+
+    @skipIf(not installed('crc32c'), 'crc32c is not installed')
+    def test_crc32c(self):
+        # check value of CRC-32C
+        self.assertEqual(compute_digests(ContentFile(b'123456789'), ('crc32c',)).hex('crc32c'), 'e3069283')
+
+    def test_unknown_algorithm(self):
+        with self.assertRaises(ImproperlyConfigured):
+            check_digest('sha3')
+        self.assertEqual(sorted(DIGESTS), ['crc32', 'crc32c', 'md5', 'sha1', 'sha256'])
+
+    def test_content_is_read_once(self):
+        content = ContentFile(CONTENT)
+        with mock.patch.object(content_digest, 'iter_views', wraps=content_digest.iter_views) as iter_views:
+            content_digests(content, ('sha256', 'md5'))
+            self.assertEqual(content_digests(content, ('md5',)).hex('md5'), hashlib.md5(CONTENT).hexdigest())
+            self.assertEqual(iter_views.call_count, 1)
+            # a new algorithm reads the content for it only, known digests are kept
+            digests = content_digests(content, ('sha256', 'crc32'))
+        self.assertEqual(iter_views.call_count, 2)
+        self.assertEqual(sorted(digests.digests), ['crc32', 'md5', 'sha256'])
+
+
+class DedupSaveDigestTests(TransactionTestCase):
+    def test_save_hashes_once(self):
+        item = Item()
+        with mock.patch.object(content_digest, 'iter_views', wraps=content_digest.iter_views) as iter_views:
+            item.blob.save('blob.bin', io.BytesIO(CONTENT))
+        self.addCleanup(item.blob.storage.delete, item.blob.name)
+        self.assertEqual(iter_views.call_count, 1)
+
+
+class S3ChecksumTests(S3TestMixin, SimpleTestCase):
+    def storage(self, checksum, **configs):
+        return SaveS3(dict({'bucket': BUCKET, 'region_name': 'us-east-1', 'checksum': checksum,
+                            'multipart_threshold': 5 * 1024 * 1024, 'multipart_chunksize': 5 * 1024 * 1024},
+                           **configs))
+
+    def test_unknown_checksum(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.storage('sha512')
+
+    def test_digest_sent_with_object(self):
+        for checksum, header in (('sha256', 'ChecksumSHA256'), ('crc32', 'ChecksumCRC32'), ('md5', 'ContentMD5')):
+            storage = self.storage(checksum)
+            content = File(io.BytesIO(CONTENT), 'image.png')
+            with mock.patch.object(storage.s3_client, 'put_object', wraps=storage.s3_client.put_object) as put_object:
+                name = storage.save('image.png', content)
+            self.assertEqual(put_object.call_args.kwargs[header],
+                             base64.b64encode(expected_digests(CONTENT)[checksum]).decode())
+            self.assertEqual(self.s3_client.get_object(Bucket=BUCKET, Key=name)['Body'].read(), CONTENT)
+
+    def test_digests_of_save_are_reused(self):
+        storage = self.storage('sha1')
+        content = File(io.BytesIO(CONTENT), 'image.png')
+        algorithms = ['sha256'] + list(storage.upload_digests('image.png', content.size))
+        self.assertEqual(algorithms, ['sha256', 'sha1'])
+        with mock.patch.object(content_digest, 'iter_views', wraps=content_digest.iter_views) as iter_views:
+            content_digests(content, algorithms)
+            storage.save('image.png', content)
+        self.assertEqual(iter_views.call_count, 1)
+
+    def test_compressed_and_multipart_uploads_use_part_checksums(self):
+        for name, configs in (('text.txt', {}), ('image.png', {'multipart_threshold': 1024 * 1024})):
+            storage = self.storage('sha256', **configs)
+            self.assertEqual(storage.upload_digests(name, len(CONTENT)), ())
+            upload_fileobj = storage.s3_client.upload_fileobj
+            with mock.patch.object(storage.s3_client, 'upload_fileobj', wraps=upload_fileobj) as upload:
+                stored_name = storage.save(name, ContentFile(CONTENT))
+            self.assertEqual(upload.call_args.kwargs['ExtraArgs']['ChecksumAlgorithm'], 'SHA256')
+            self.s3_client.head_object(Bucket=BUCKET, Key=stored_name)
+
+    def test_no_checksum(self):
+        storage = self.storage(None)
+        self.assertEqual(storage.upload_digests('image.png', 10), ())
+        with mock.patch.object(content_digest, 'iter_views') as iter_views:
+            storage.save('image.png', ContentFile(b'png'))
+        iter_views.assert_not_called()
@@ -0,0 +1,102 @@
+from django.test import TestCase
+
+from media_sdk.services.direct_upload import (DirectUploadError, finish_direct_upload,
+                                              start_direct_upload)
+
+from .models import Item
+from .s3 import BUCKET, S3TestMixin
+
+MB = 1024 * 1024
+
+
+class DirectUploadTests(S3TestMixin, TestCase):
+    def setUp(self):
+        super(DirectUploadTests, self).setUp()
+        self.item = Item.objects.create()
+        self.field = Item._meta.get_field('upload')
+
+    def put(self, name, size):
+        self.s3_client.put_object(Bucket=BUCKET, Key=name, Body=b'x' * size)
+
+    def upload_parts(self, upload, sizes):
+        parts = []
+        for number, size in enumerate(sizes, 1):
+            response = self.s3_client.upload_part(Bucket=BUCKET, Key=upload['name'], UploadId=self.upload_id(upload),
+                                                  PartNumber=number, Body=b'x' * size)
+            parts.append((number, response['ETag']))
+        return parts
+
+    def upload_id(self, upload):
+        uploads = self.s3_client.list_multipart_uploads(Bucket=BUCKET).get('Uploads', [])
+        return next(item['UploadId'] for item in uploads if item['Key'] == upload['name'])
+
+    def multipart_uploads(self):
+        return self.s3_client.list_multipart_uploads(Bucket=BUCKET).get('Uploads', [])
+
+    def test_small_file_gets_post_form(self):
+        upload = start_direct_upload(self.item, self.field, 'small.txt', 1024)
+
+        self.assertIn('post', upload)
+        self.assertNotIn('parts', upload)
+        self.assertEqual(upload['post']['fields']['key'], upload['name'])
+        self.assertEqual(self.multipart_uploads(), [])
+
+    def test_big_file_gets_part_urls(self):
+        upload = start_direct_upload(self.item, self.field, 'big.bin', 7 * MB)
+
+        self.assertNotIn('post', upload)
+        self.assertEqual(upload['part_size'], 5 * MB)
+        self.assertEqual([part['part_number'] for part in upload['parts']], [1, 2])
+        self.assertEqual(len(self.multipart_uploads()), 1)
+
+    def test_too_big_file_is_refused(self):
+        with self.assertRaisesMessage(DirectUploadError, 'File is too big'):
+            start_direct_upload(self.item, self.field, 'huge.bin', 9 * MB)
+
+    def test_post_upload_is_stored_and_retried_finish_succeeds(self):
+        upload = start_direct_upload(self.item, self.field, 'small.txt', 10)
+        self.put(upload['name'], 10)
+
+        self.assertEqual(finish_direct_upload(self.item, self.field, upload['token']), upload['name'])
+        self.assertEqual(Item.objects.get(pk=self.item.pk).upload.name, upload['name'])
+        self.assertEqual(finish_direct_upload(self.item, self.field, upload['token']), upload['name'])
+
+    def test_retried_multipart_finish_succeeds(self):
+        upload = start_direct_upload(self.item, self.field, 'big.bin', 6 * MB)
+        parts = self.upload_parts(upload, [5 * MB, MB])
+        stale = Item.objects.get(pk=self.item.pk)
+
+        self.assertEqual(finish_direct_upload(self.item, self.field, upload['token'], parts), upload['name'])
+        # a stale instance does not know about the first finish, completing again fails on S3
+        self.assertEqual(finish_direct_upload(stale, self.field, upload['token'], parts), upload['name'])
+        self.assertEqual(Item.objects.get(pk=self.item.pk).upload.name, upload['name'])
+
+    def test_token_of_another_row_or_tag_is_refused(self):
+        upload = start_direct_upload(self.item, self.field, 'small.txt', 10)
+        self.put(upload['name'], 10)
+        other = Item.objects.create()
+
+        with self.assertRaisesMessage(DirectUploadError, 'Wrong token'):
+            finish_direct_upload(other, self.field, upload['token'])
+        with self.assertRaisesMessage(DirectUploadError, 'Wrong token'):
+            finish_direct_upload(self.item, Item._meta.get_field('private_upload'), upload['token'])
+        with self.assertRaisesMessage(DirectUploadError, 'Wrong token'):
+            finish_direct_upload(self.item, self.field, upload['token'] + 'x')
+        self.assertFalse(Item.objects.get(pk=self.item.pk).upload)
+
+    def test_oversize_upload_is_deleted(self):
+        upload = start_direct_upload(self.item, self.field, 'small.txt', 10)
+        self.put(upload['name'], 8 * MB + 1)
+
+        with self.assertRaisesMessage(DirectUploadError, 'File is too big'):
+            finish_direct_upload(self.item, self.field, upload['token'])
+        self.assertNotIn('Contents', self.s3_client.list_objects_v2(Bucket=BUCKET))
+        self.assertFalse(Item.objects.get(pk=self.item.pk).upload)
+
+    def test_incomplete_multipart_upload_is_aborted(self):
+        upload = start_direct_upload(self.item, self.field, 'big.bin', 6 * MB)
+        parts = self.upload_parts(upload, [5 * MB])
+
+        with self.assertRaisesMessage(DirectUploadError, 'Upload is not complete'):
+            finish_direct_upload(self.item, self.field, upload['token'], parts + [(2, '"missing"')])
+        self.assertEqual(self.multipart_uploads(), [])
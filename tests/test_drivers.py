@@ -0,0 +1,101 @@
+import copy
+import threading
+from unittest import mock
+
+import boto3
+from django.test import SimpleTestCase, override_settings
+from django.utils.functional import empty
+
+from media_sdk import GenericFileField
+from media_sdk.services import clients
+from media_sdk.services.media_storage import CustomStorage, SaveLocal, SaveS3, TusStorage
+
+TUS_CONFIGS = {'url': 'http://tus.invalid/files/', 'headers': {'Authorization': 'x'}, 'storing_file': None}
+
+
+class LazyDriverTests(SimpleTestCase):
+    def test_driver_is_built_on_first_use(self):
+        field = GenericFileField(tag='local')
+        self.assertIsInstance(field.storage, CustomStorage)
+        self.assertIs(field.storage._wrapped, empty)
+
+        self.assertEqual(field.storage.sets, {})
+        self.assertIsInstance(field.storage._wrapped, SaveLocal)
+
+    @override_settings(STORAGE_OPTIONS={'s3': {'driver': 's3', 'configs': {'bucket': 'b'}}})
+    def test_defining_fields_creates_no_clients(self):
+        with mock.patch.object(clients, 'get_s3_client') as get_s3_client:
+            field = GenericFileField(tag='s3')
+            copy.deepcopy(field)
+            field.deconstruct()
+        get_s3_client.assert_not_called()
+
+    def test_unknown_tag_falls_back_to_local(self):
+        storage = CustomStorage('not configured')
+        storage.exists('missing.txt')
+        self.assertIsInstance(storage._wrapped, SaveLocal)
+
+    def test_copies_stay_lazy(self):
+        storage = CustomStorage('local')
+        for copied in (copy.copy(storage), copy.deepcopy(storage)):
+            self.assertIsNot(copied, storage)
+            self.assertIs(copied._wrapped, empty)
+            self.assertEqual(copied._tag, 'local')
+
+    def test_deconstruct_keeps_tag_only(self):
+        _, path, args, kwargs = GenericFileField(tag='local', null=True).deconstruct()
+        self.assertEqual(path, 'media_sdk.fields.GenericFileField')
+        self.assertEqual(kwargs['tag'], 'local')
+        self.assertNotIn('storage', kwargs)
+
+
+class SharedClientTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(clients._clients, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.dict(clients._sessions, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_s3_client_per_region_endpoint_and_pool(self):
+        configs = {'region_name': 'eu-west-1'}
+        s3_client = clients.get_s3_client(configs)
+
+        self.assertIs(clients.get_s3_client(dict(configs, bucket='other')), s3_client)
+        self.assertIsNot(clients.get_s3_client({'region_name': 'us-east-1'}), s3_client)
+        self.assertIsNot(clients.get_s3_client(dict(configs, endpoint_url='http://minio.invalid')), s3_client)
+        pooled = clients.get_s3_client(dict(configs, max_pool_connections=50))
+        self.assertIsNot(pooled, s3_client)
+        self.assertEqual(pooled.meta.config.max_pool_connections, 50)
+        self.assertEqual(s3_client.meta.config.max_pool_connections, 10)
+
+    def test_drivers_share_s3_client(self):
+        first = SaveS3({'bucket': 'first', 'region_name': 'eu-west-1'})
+        second = SaveS3({'bucket': 'second', 'region_name': 'eu-west-1'})
+        self.assertIs(first.s3_client, second.s3_client)
+
+    def test_concurrent_first_use_creates_one_client(self):
+        barrier = threading.Barrier(8)
+        results = []
+
+        def get_client():
+            barrier.wait()
+            results.append(clients.get_s3_client({'region_name': 'eu-west-1'}))
+
+        with mock.patch.object(boto3.session, 'Session', wraps=boto3.session.Session) as session:
+            threads = [threading.Thread(target=get_client) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(session.call_count, 1)
+        self.assertEqual(len({id(s3_client) for s3_client in results}), 1)
+
+    def test_drivers_share_tus_client(self):
+        first = TusStorage(dict(TUS_CONFIGS))
+        second = TusStorage(dict(TUS_CONFIGS, chunk_size=1024))
+        other = TusStorage(dict(TUS_CONFIGS, headers={'Authorization': 'y'}))
+        self.assertIs(first.my_client, second.my_client)
+        self.assertIsNot(first.my_client, other.my_client)
+        self.assertEqual(other.my_client.headers, {'Authorization': 'y'})
@@ -0,0 +1,137 @@
+import re
+
+from django.core.files.base import ContentFile
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from media_sdk import instrumentation
+from media_sdk.instrumentation import (format_server_timing, instrument, is_enabled, measure, media_operation,
+                                       server_timing)
+from media_sdk.services.media_storage import SaveLocal
+from media_sdk.views import aretrieve_media_file, retrieve_media_file
+
+from .models import Item
+
+calls = []
+
+
+def collect(operation, duration, size, error):
+    calls.append((operation, duration, size, error))
+
+
+def failing_callback(operation, duration, size, error):
+    raise RuntimeError('broken callback')
+
+
+@instrument('test.operation', size=lambda args, kwargs, result: len(result))
+def operation(value):
+    if value is None:
+        raise ValueError('no value')
+    return value
+
+
+class InstrumentationTests(SimpleTestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_disabled_by_default(self):
+        self.assertFalse(is_enabled())
+        self.assertEqual(operation('abc'), 'abc')
+        with measure('test.block'):
+            pass
+        self.assertEqual(calls, [])
+
+    @override_settings(MEDIA_INSTRUMENTATION='tests.test_instrumentation.collect')
+    def test_callback(self):
+        self.assertTrue(is_enabled())
+        operation('abc')
+        with self.assertRaises(ValueError):
+            operation(None)
+        with measure('test.block'):
+            pass
+
+        self.assertEqual([(operation_name, size) for operation_name, _, size, _ in calls],
+                         [('test.operation', 3), ('test.operation', None), ('test.block', None)])
+        self.assertIsInstance(calls[1][3], ValueError)
+        self.assertTrue(all(duration >= 0 for _, duration, _, _ in calls))
+
+    @override_settings(MEDIA_INSTRUMENTATION='tests.test_instrumentation.collect')
+    def test_driver_operations(self):
+        storage = SaveLocal({})
+        name = storage.save('measured.txt', ContentFile(b'12345'))
+        storage.exists(name)
+        storage.delete(name)
+        self.assertEqual([(operation_name, size) for operation_name, _, size, _ in calls],
+                         [('local.save', 5), ('local.exists', None), ('local.delete', None)])
+
+    def test_callback_reloaded_on_setting_change(self):
+        with override_settings(MEDIA_INSTRUMENTATION=collect):
+            operation('a')
+        operation('b')
+        self.assertEqual(len(calls), 1)
+
+    @override_settings(MEDIA_INSTRUMENTATION=failing_callback)
+    def test_failing_callback_is_logged(self):
+        with self.assertLogs('media_sdk.instrumentation', 'ERROR'):
+            self.assertEqual(operation('abc'), 'abc')
+
+    def test_signal(self):
+        received = []
+
+        def receiver(sender, **kwargs):
+            received.append((sender, kwargs['size'], kwargs['error']))
+
+        media_operation.connect(receiver)
+        self.addCleanup(media_operation.disconnect, receiver)
+        self.assertTrue(is_enabled())
+        operation('ab')
+        self.assertEqual(received, [('test.operation', 2, None)])
+
+    def test_format_server_timing(self):
+        self.assertEqual(format_server_timing({'orm': 0.0012345, 'total': 0.5}), 'orm;dur=1.234, total;dur=500.000')
+
+
+@override_settings(DOWNLOADS={'item': 'tests.models.Item'})
+class ServerTimingTests(TestCase):
+    def setUp(self):
+        self.item = Item()
+        self.item.file.save('a.txt', ContentFile(b'a'))
+        self.item.save()
+        self.addCleanup(self.item.file.storage.delete, self.item.file.name)
+        self.request = RequestFactory().get('/')
+
+    def operations(self, response):
+        self.assertRegex(response['Server-Timing'], r'^(\S+;dur=\d+\.\d{3}(, |$))+$')
+        return re.findall(r'([^\s,;]+);dur=', response['Server-Timing'])
+
+    def test_off_by_default(self):
+        response = retrieve_media_file(self.request, 'item', 'local', self.item.pk)
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    @override_settings(MEDIA_SERVER_TIMING=True)
+    def test_view(self):
+        response = retrieve_media_file(self.request, 'item', 'local', self.item.pk)
+        operations = self.operations(response)
+        self.assertEqual(operations[0], 'orm')
+        self.assertEqual(operations[-1], 'total')
+        # timings of the request are not collected afterwards
+        self.assertIsNone(instrumentation._timings.get())
+        self.assertFalse(is_enabled())
+
+    @override_settings(MEDIA_SERVER_TIMING=True)
+    async def test_async_view(self):
+        response = await aretrieve_media_file(self.request, 'item', 'local', self.item.pk)
+        self.assertEqual(self.operations(response)[-1], 'total')
+
+    @override_settings(MEDIA_SERVER_TIMING=True)
+    def test_repeated_operations_are_summed_per_view(self):
+        @server_timing
+        def view(request):
+            operation('a')
+            operation('b')
+            response = retrieve_media_file(request, 'item', 'local', self.item.pk)
+            response['X-Inner'] = response['Server-Timing']
+            return response
+
+        response = view(self.request)
+        self.assertEqual(self.operations(response).count('test.operation'), 1)
+        self.assertNotIn('test.operation', response['X-Inner'])
@@ -0,0 +1,101 @@
+import json
+
+from django.test import RequestFactory, TestCase, override_settings
+
+from media_sdk.utils import get_page_params
+from media_sdk.views import retrieve_model_field_media_urls, retrieve_model_media_urls
+
+from .models import Item
+
+FIELD_KEYS = ['local_field', 'dedup_field', 'direct_field', 'direct_private_field']
+
+
+@override_settings(DOWNLOADS={'item': 'tests.models.Item'})
+class MediaListingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Item.objects.bulk_create([Item(title=str(index)) for index in range(7)])
+        # a gap in the pks must not shift pages
+        Item.objects.filter(title='3').delete()
+        cls.pks = list(Item.objects.order_by('pk').values_list('pk', flat=True))
+
+    def get(self, view, *args, **params):
+        request = RequestFactory().get('/media-url/', params)
+        response = view(request, *args)
+        if response.streaming:
+            return response, json.loads(b''.join(response.streaming_content))
+        return response, json.loads(response.content)
+
+    def pks_of(self, urls):
+        return [int(url.rstrip('/').rsplit('/', 1)[1]) for url in urls]
+
+    def test_page_params(self):
+        self.assertEqual(get_page_params({'limit': '2', 'after': '5', 'stream': 'yes'}), (2, 5, True))
+        self.assertEqual(get_page_params({}), (None, None, False))
+        with override_settings(MEDIA_URL_MAX_LIMIT=3):
+            self.assertEqual(get_page_params({'limit': '10'})[0], 3)
+
+    def test_malformed_cursor(self):
+        for params in ({'after': 'abc'}, {'limit': '0'}, {'limit': '-1'}, {'limit': '1.5'}):
+            for stream in ('', '1'):
+                response, body = self.get(retrieve_model_media_urls, 'item', stream=stream, **params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(body, {'status': 'Wrong pagination params'})
+
+    def test_pages_cover_all_rows_once(self):
+        for stream in ('', '1'):
+            seen, after = [], None
+            while True:
+                params = {'limit': '2', 'stream': stream}
+                if after is not None:
+                    params['after'] = after
+                response, body = self.get(retrieve_model_field_media_urls, 'item', 'local', **params)
+                self.assertEqual(response.status_code, 200)
+                page = body['item_model']
+                seen.extend(self.pks_of(page['local_field']))
+                after = page['next']
+                if after is None:
+                    break
+                # the cursor is the last pk of the page, so the next page starts right after it
+                self.assertEqual(after, seen[-1])
+            self.assertEqual(seen, self.pks)
+
+    def test_last_page(self):
+        # a page that ends exactly on the last row has no next cursor
+        for stream in ('', '1'):
+            _, body = self.get(retrieve_model_media_urls, 'item', limit=len(self.pks), stream=stream)
+            self.assertIsNone(body['item_model']['next'])
+            _, body = self.get(retrieve_model_media_urls, 'item', after=self.pks[-1], limit=2, stream=stream)
+            self.assertEqual(body['item_model']['local_field'], [])
+            self.assertIsNone(body['item_model']['next'])
+
+    def test_cursor_between_rows(self):
+        # a cursor pointing into a gap behaves like the previous existing pk
+        missing = self.pks[2] + 1
+        _, body = self.get(retrieve_model_field_media_urls, 'item', 'local', after=missing, limit=1)
+        self.assertEqual(self.pks_of(body['item_model']['local_field']), [self.pks[3]])
+
+    def test_stream_matches_plain_response(self):
+        for params in ({}, {'limit': '3'}, {'limit': '3', 'after': str(self.pks[1])}):
+            _, plain = self.get(retrieve_model_media_urls, 'item', **params)
+            for chunk in (1, 2, 1000):
+                with override_settings(MEDIA_URL_STREAM_CHUNK=chunk):
+                    response, streamed = self.get(retrieve_model_media_urls, 'item', stream='1', **params)
+                self.assertEqual(response['Content-Type'], 'application/json')
+                self.assertEqual(streamed, plain)
+        self.assertEqual(sorted(k for k in plain['item_model'] if k != 'next'), sorted(FIELD_KEYS))
+
+    def test_stream_reads_pks_once_per_model(self):
+        request = RequestFactory().get('/media-url/', {'stream': '1', 'limit': '3'})
+        response = retrieve_model_media_urls(request, 'item')
+        with self.assertNumQueries(1):
+            body = json.loads(b''.join(response.streaming_content))
+        for key in FIELD_KEYS:
+            self.assertEqual(self.pks_of(body['item_model'][key]), self.pks[:3])
+
+    def test_stream_unknown_model_or_field(self):
+        response, body = self.get(retrieve_model_media_urls, 'missing', stream='1')
+        self.assertEqual(response.status_code, 404)
+        response, body = self.get(retrieve_model_field_media_urls, 'item', 'missing', stream='1')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(body, {'status': 'Nothing found'})
@@ -0,0 +1,22 @@
+import os
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from .models import Item
+
+
+class SaveLocalDeleteTests(SimpleTestCase):
+    def setUp(self):
+        self.storage = Item._meta.get_field('file').storage
+
+    def test_missing_file_is_ignored(self):
+        with self.assertLogs('media_sdk.services.media_storage', 'DEBUG') as logs:
+            self.storage.delete('missing.txt')
+        self.assertEqual([record.levelname for record in logs.records], ['DEBUG'])
+
+    def test_other_errors_are_logged_as_warning(self):
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, 'not_a_file'), exist_ok=True)
+        with self.assertLogs('media_sdk.services.media_storage', 'WARNING') as logs:
+            self.storage.delete('not_a_file')
+        self.assertIn('not_a_file', logs.output[0])
@@ -0,0 +1,129 @@
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.db import DatabaseError
+from django.test import TestCase, TransactionTestCase
+
+from media_sdk.models import StoredBlob
+from media_sdk.services.media_service import save_bulk, save_multy_files
+from media_sdk.services.media_storage import SaveLocal
+
+from .models import Item
+
+save_local = SaveLocal._save
+
+
+def failing_save(storage, name, content):
+    if 'fail' in name:
+        raise OSError('storage is down')
+    return save_local(storage, name, content)
+
+
+def file_data(name):
+    return {'name': name, 'content': ContentFile(name.encode())}
+
+
+class MediaServiceTestMixin:
+    def create_item(self, name='old.txt'):
+        item = Item()
+        item.file.save(name, ContentFile(b'old'))
+        item.save()
+        self.addCleanup(lambda: item.file.storage.delete(item.file.name))
+        return item
+
+    def exists(self, name):
+        return Item._meta.get_field('file').storage.exists(name)
+
+    def saved_names(self):
+        """Names every SaveLocal._save call stored."""
+        names = []
+
+        def save(storage, name, content):
+            names.append(failing_save(storage, name, content))
+            return names[-1]
+        return names, mock.patch.object(SaveLocal, '_save', save)
+
+
+class SaveBulkUploadFailureTests(MediaServiceTestMixin, TransactionTestCase):
+    """Uploads run in pool threads with their own connections (dedup lookups), rows must be committed."""
+
+    def test_failed_item_is_rolled_back_others_are_stored(self):
+        good = self.create_item()
+        bad = self.create_item()
+        good_old, bad_old = good.file.name, bad.file.name
+        names, patch = self.saved_names()
+
+        with patch:
+            results = save_bulk(Item, [
+                {'instance': good, 'fields_data': {'local': file_data('good.txt')}},
+                {'instance': bad, 'fields_data': {'local': file_data('fail.txt'), 'dedup': file_data('blob.txt')}},
+                {'fields_data': {'local': file_data('new.txt')}},
+            ])
+
+        self.assertEqual([result['error'] is None for result in results], [True, False, True])
+        self.assertIsInstance(results[1]['error'], OSError)
+        # the uploaded file of the failed item is removed with its dedup reference, its names are restored
+        blob_name = next(name for name in names if name.endswith('blob.txt'))
+        self.assertFalse(self.exists(blob_name))
+        self.assertFalse(StoredBlob.objects.exists())
+        self.assertEqual(bad.file.name, bad_old)
+        self.assertIsNone(bad.blob.name)
+        self.assertEqual(Item.objects.get(pk=bad.pk).file.name, bad_old)
+        self.assertTrue(self.exists(bad_old))
+        # others are stored, the replaced file is removed
+        self.assertEqual(Item.objects.get(pk=good.pk).file.name, good.file.name)
+        self.assertFalse(self.exists(good_old))
+        self.assertTrue(self.exists(good.file.name))
+        self.assertEqual(Item.objects.count(), 3)
+        for result in (results[0], results[2]):
+            self.addCleanup(result['instance'].file.storage.delete, result['instance'].file.name)
+
+
+class SaveBulkWriteFailureTests(MediaServiceTestMixin, TestCase):
+    def test_replaced_files_are_deleted_after_commit(self):
+        item = self.create_item()
+        old_name = item.file.name
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            results = save_bulk(Item, [{'instance': item, 'fields_data': {'local': file_data('b.txt')}}])
+        self.assertIsNone(results[0]['error'])
+        self.assertTrue(self.exists(old_name))
+        for callback in callbacks:
+            callback()
+        self.assertFalse(self.exists(old_name))
+
+    def test_failed_bulk_update_rolls_back_every_item(self):
+        first, second = self.create_item(), self.create_item()
+        old_names = [first.file.name, second.file.name]
+        names, patch = self.saved_names()
+
+        with patch, mock.patch('django.db.models.query.QuerySet.bulk_update', side_effect=DatabaseError('gone')):
+            with self.captureOnCommitCallbacks(execute=True):
+                results = save_bulk(Item, [
+                    {'instance': first, 'fields_data': {'local': file_data('a.txt')}},
+                    {'instance': second, 'fields_data': {'local': file_data('b.txt')}},
+                    {'fields_data': {'local': file_data('c.txt')}},
+                ])
+
+        self.assertTrue(all(isinstance(result['error'], DatabaseError) for result in results))
+        self.assertEqual(len(names), 3)
+        self.assertFalse(any(self.exists(name) for name in names))
+        self.assertEqual([first.file.name, second.file.name], old_names)
+        self.assertTrue(all(self.exists(name) for name in old_names))
+        self.assertIsNone(results[2]['instance'].pk)
+        self.assertEqual(Item.objects.count(), 2)
+
+
+class SaveMultyFilesTests(MediaServiceTestMixin, TransactionTestCase):
+    def test_failed_upload_restores_names_and_deletes_uploaded(self):
+        item = self.create_item()
+        old_name = item.file.name
+        names, patch = self.saved_names()
+
+        with patch, self.assertRaises(OSError):
+            save_multy_files(item, {'local': file_data('fail.txt'), 'dedup': file_data('blob.txt')})
+
+        self.assertEqual(item.file.name, old_name)
+        self.assertIsNone(item.blob.name)
+        self.assertFalse(any(self.exists(name) for name in names))
+        self.assertFalse(StoredBlob.objects.exists())
@@ -0,0 +1,50 @@
+from django.core.files.base import ContentFile
+from django.test import TestCase
+
+from .models import Item
+
+
+class MediaSaveTests(TestCase):
+    def create_item(self):
+        item = Item()
+        item.file.save('a.txt', ContentFile(b'a'))
+        item.save()
+        self.addCleanup(lambda: item.file.storage.delete(item.file.name))
+        return item
+
+    def test_replaced_file_is_deleted_after_commit(self):
+        item = self.create_item()
+        old_name = item.file.name
+
+        item.file.save('b.txt', ContentFile(b'b'))
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+        self.assertFalse(item.file.storage.exists(old_name))
+        self.assertTrue(item.file.storage.exists(item.file.name))
+
+    def test_update_fields_without_file_keeps_original_name(self):
+        item = self.create_item()
+        old_name = item.file.name
+
+        item.file.save('d.txt', ContentFile(b'd'))
+        item.title = 'renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save(update_fields=['title'])
+        self.assertEqual(Item.objects.get(pk=item.pk).file.name, old_name)
+        self.assertTrue(item.file.storage.exists(old_name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+        self.assertFalse(item.file.storage.exists(old_name))
+        self.assertEqual(Item.objects.get(pk=item.pk).file.name, item.file.name)
+
+    def test_update_fields_with_file(self):
+        item = self.create_item()
+        old_name = item.file.name
+
+        item.file.save('e.txt', ContentFile(b'e'))
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save(update_fields=['file'])
+        self.assertFalse(item.file.storage.exists(old_name))
+        with self.assertNumQueries(1):
+            item.save()
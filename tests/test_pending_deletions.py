@@ -0,0 +1,37 @@
+import os
+
+from django.conf import settings
+from django.test import TestCase
+from django.utils import timezone
+
+from media_sdk.models import PendingDeletion
+from media_sdk.services.media_cleaner import process_pending_deletions
+
+
+class ProcessPendingDeletionsTests(TestCase):
+    def create_file(self, name):
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        with open(path, 'wb') as file:
+            file.write(b'x')
+        self.addCleanup(lambda: os.path.exists(path) and os.remove(path))
+        return path
+
+    def test_removes_files_and_skips_claimed_ones(self):
+        free = self.create_file('pending-free.txt')
+        claimed = self.create_file('pending-claimed.txt')
+        PendingDeletion.objects.create(tag='local', name='pending-free.txt')
+        PendingDeletion.objects.create(tag='local', name='pending-claimed.txt', claimed_at=timezone.now())
+
+        self.assertEqual(process_pending_deletions()[:2], (1, 0))
+        self.assertFalse(os.path.exists(free))
+        self.assertTrue(os.path.exists(claimed))
+        self.assertEqual(list(PendingDeletion.objects.values_list('name', flat=True)), ['pending-claimed.txt'])
+
+    def test_failed_files_are_released_for_retry(self):
+        PendingDeletion.objects.create(tag='local', name='../outside.txt')
+
+        self.assertEqual(process_pending_deletions()[:2], (0, 1))
+        pending = PendingDeletion.objects.get()
+        self.assertEqual(pending.attempts, 1)
+        self.assertIsNone(pending.claimed_at)
+        self.assertTrue(pending.last_error)
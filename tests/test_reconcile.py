@@ -0,0 +1,46 @@
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from .models import Item
+
+
+class MediaReconcileTests(TestCase):
+    def create_file(self, name):
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(b'x')
+        self.addCleanup(lambda: os.path.exists(path) and os.remove(path))
+        return path
+
+    def reconcile(self, **options):
+        call_command('media_reconcile', min_age=0, stdout=io.StringIO(), stderr=io.StringIO(), **options)
+
+    def test_delete_of_local_files_requires_prefix(self):
+        orphan = self.create_file('orphan.txt')
+
+        with self.assertRaises(CommandError):
+            self.reconcile(delete=True)
+        self.assertTrue(os.path.exists(orphan))
+
+    def test_plain_file_field_files_survive(self):
+        item = Item(attachment='reconcile/plain.txt')
+        item.file.save('generic.txt', ContentFile(b'x'), upload_to='reconcile')
+        item.save()
+        self.addCleanup(item.file.storage.delete, item.file.name)
+        generic = os.path.join(settings.MEDIA_ROOT, item.file.name)
+        plain = self.create_file('reconcile/plain.txt')
+        orphan = self.create_file('reconcile/orphan.txt')
+
+        self.reconcile(delete=True, prefix='reconcile/')
+        self.assertTrue(os.path.exists(generic))
+        self.assertTrue(os.path.exists(plain))
+        self.assertFalse(os.path.exists(orphan))
+
+        self.reconcile(delete=True, prefix='reconcile/', strategy='set')
+        self.assertTrue(os.path.exists(plain))
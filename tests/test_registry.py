@@ -0,0 +1,95 @@
+import json
+from unittest import mock
+
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from media_sdk import utils
+from media_sdk.utils import get_media_registry, get_pk_ranges
+from media_sdk.views import retrieve_all_media_urls, retrieve_model_field_media_urls, retrieve_model_media_urls
+
+from .models import Item
+
+TAGS = ['local', 'dedup', 'direct', 'direct_private']
+
+
+class MediaRegistryTests(SimpleTestCase):
+    @override_settings(DOWNLOADS={'item': 'tests.models.Item'})
+    def test_models_with_generic_file_fields(self):
+        model, file_fields = get_media_registry()['item']
+        self.assertIs(model, Item)
+        # plain FileFields are not served
+        self.assertEqual([file_field.tag for file_field in file_fields], TAGS)
+
+    def test_built_once_and_cleared_on_downloads_change(self):
+        with override_settings(DOWNLOADS={'item': 'tests.models.Item'}):
+            with mock.patch.object(utils, 'load_model', wraps=utils.load_model) as load_model:
+                get_media_registry()
+                get_media_registry()
+            self.assertEqual(load_model.call_count, 1)
+            with override_settings(DOWNLOADS={'other': 'tests.models.Item'}):
+                self.assertEqual(list(get_media_registry()), ['other'])
+            self.assertEqual(list(get_media_registry()), ['item'])
+
+    def test_pk_ranges(self):
+        self.assertEqual(get_pk_ranges([]), [])
+        self.assertEqual(get_pk_ranges([1, 2, 3, 5, 7, 8]), [[1, 3], [5, 5], [7, 8]])
+
+
+@override_settings(DOWNLOADS={'item': 'tests.models.Item', 'copy': 'tests.models.Item'})
+class ListingModeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Item.objects.bulk_create([Item(title=str(index)) for index in range(6)])
+        Item.objects.filter(title__in=['2', '3']).delete()
+        cls.pks = list(Item.objects.order_by('pk').values_list('pk', flat=True))
+
+    def get(self, view, *args, **params):
+        response = view(RequestFactory().get('/media-url/', params), *args)
+        return response.status_code, json.loads(response.content)
+
+    def test_count(self):
+        with self.assertNumQueries(1):
+            status, body = self.get(retrieve_model_media_urls, 'item', mode='count')
+        self.assertEqual(status, 200)
+        page = body['item_model']
+        self.assertEqual(page['count'], 4)
+        self.assertEqual(page['local_field'], 'http://testserver/media-url/item/local/{pk}/')
+        self.assertEqual(sorted(page), sorted(['count'] + [tag + '_field' for tag in TAGS]))
+
+        _, body = self.get(retrieve_model_field_media_urls, 'item', 'dedup', mode='count', after=self.pks[1])
+        self.assertEqual(body['item_model'], {'dedup_field': 'http://testserver/media-url/item/dedup/{pk}/',
+                                              'count': 2})
+
+    def test_ranges(self):
+        first, second, third, fourth = self.pks
+        _, body = self.get(retrieve_model_field_media_urls, 'item', 'local', mode='ranges')
+        self.assertEqual(body['item_model']['ranges'], [[first, second], [third, fourth]])
+        self.assertNotIn('next', body['item_model'])
+
+        _, body = self.get(retrieve_model_field_media_urls, 'item', 'local', mode='ranges', limit=3)
+        self.assertEqual(body['item_model']['ranges'], [[first, second], [third, third]])
+        self.assertEqual(body['item_model']['next'], third)
+
+    def test_every_model_with_one_query_each(self):
+        with self.assertNumQueries(2):
+            status, body = self.get(retrieve_all_media_urls, mode='ranges', stream='1')
+        self.assertEqual(status, 200)
+        self.assertEqual(sorted(body), ['copy_model', 'item_model'])
+        self.assertEqual(body['copy_model']['ranges'], body['item_model']['ranges'])
+
+    def test_urls_read_pks_once(self):
+        with self.assertNumQueries(1):
+            _, body = self.get(retrieve_model_media_urls, 'item')
+        for tag in TAGS:
+            self.assertEqual(len(body['item_model'][tag + '_field']), len(self.pks))
+
+    def test_wrong_mode(self):
+        self.assertEqual(self.get(retrieve_model_media_urls, 'item', mode='all'), (400, {'status': 'Wrong mode'}))
+
+    def test_nothing_found(self):
+        self.assertEqual(self.get(retrieve_model_media_urls, 'missing', mode='count'),
+                         (404, {'status': 'Nothing found'}))
+        self.assertEqual(self.get(retrieve_model_field_media_urls, 'item', 'missing', mode='count'),
+                         (404, {'status': 'Nothing found'}))
+        with override_settings(DOWNLOADS={}):
+            self.assertEqual(self.get(retrieve_all_media_urls, mode='count'), (404, {'status': 'Nothing found'}))
@@ -0,0 +1,106 @@
+import io
+import os
+from unittest import mock, skipIf
+
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase
+
+from media_sdk.services import renditions
+from media_sdk.services.cache import TTLCache
+from media_sdk.services.media_storage import SaveLocal, TusStorage
+from media_sdk.services.renditions import can_store_renditions, generate_rendition, rendition_names
+from media_sdk.utils import get_variant_file
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from .models import Item
+
+RENDITIONS = {'thumb': {'size': (20, 20), 'format': 'WEBP'}}
+
+
+class RenditionsTests(SimpleTestCase):
+    def test_tus_tag_serves_original(self):
+        file_field = Item().file
+        file_field.name = 'image.png'
+        file_field.storage = TusStorage({'url': 'http://tus.invalid/files/', 'storing_file': None,
+                                         'renditions': RENDITIONS})
+
+        self.assertFalse(can_store_renditions(file_field.storage))
+        self.assertIs(get_variant_file(file_field, 'thumb'), file_field)
+        self.assertEqual(rendition_names(file_field.storage, 'image.png'), [])
+
+    def test_local_tag_has_renditions(self):
+        storage = SaveLocal({'renditions': RENDITIONS})
+
+        self.assertTrue(can_store_renditions(storage))
+        self.assertEqual(rendition_names(storage, 'dir/image.png'), ['dir/renditions/thumb/image.webp'])
+
+
+@skipIf(Image is None, 'Pillow is not installed')
+class RenditionGenerationTests(SimpleTestCase):
+    def setUp(self):
+        for cache_name in ('_stored_renditions', '_failed_renditions'):
+            patcher = mock.patch.object(renditions, cache_name, TTLCache(ttl=60))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.storage = SaveLocal({'renditions': RENDITIONS})
+
+    def save_image(self, content=None):
+        if content is None:
+            buffer = io.BytesIO()
+            Image.new('RGB', (64, 48), 'red').save(buffer, format='PNG')
+            content = buffer.getvalue()
+        name = self.storage.save('image.png', ContentFile(content))
+        self.addCleanup(self.storage.delete, name)
+        for stored_name in rendition_names(self.storage, name):
+            self.addCleanup(self.storage.delete, stored_name)
+        file_field = Item().file
+        file_field.name = name
+        file_field.storage = self.storage
+        return file_field
+
+    def test_rendition_has_deterministic_name(self):
+        file_field = self.save_image()
+        variant = get_variant_file(file_field, 'thumb')
+
+        self.assertEqual([variant.name], rendition_names(self.storage, file_field.name))
+        with self.storage.open(variant.name) as file, Image.open(file) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (20, 15)))
+
+    def test_concurrently_stored_rendition_is_kept(self):
+        file_field = self.save_image()
+        stored_name = rendition_names(self.storage, file_field.name)[0]
+        self.storage._save(stored_name, ContentFile(b'stored by another process'))
+        rendition_dir = os.path.dirname(self.storage.path(stored_name))
+
+        # exists() answered before the other process stored the file
+        with mock.patch.object(self.storage, 'exists', return_value=False):
+            name = generate_rendition(self.storage, file_field.name, 'thumb')
+
+        self.assertEqual(name, stored_name)
+        self.assertEqual(os.listdir(rendition_dir), [os.path.basename(stored_name)])
+
+    def test_truncated_image_serves_original(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 48), 'red').save(buffer, format='JPEG')
+        file_field = self.save_image(buffer.getvalue()[:200])
+
+        with mock.patch.object(renditions, 'render', wraps=renditions.render) as render:
+            with self.assertLogs('media_sdk.utils', 'WARNING'):
+                self.assertIs(get_variant_file(file_field, 'thumb'), file_field)
+            # failure is remembered, the image is not decoded on every request
+            with self.assertLogs('media_sdk.utils', 'WARNING'):
+                self.assertIs(get_variant_file(file_field, 'thumb'), file_field)
+        self.assertEqual(render.call_count, 1)
+        self.assertFalse(self.storage.exists(rendition_names(self.storage, file_field.name)[0]))
+
+    def test_decompression_bomb_serves_original(self):
+        file_field = self.save_image()
+
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 100):
+            with self.assertLogs('media_sdk.utils', 'WARNING') as logs:
+                self.assertIs(get_variant_file(file_field, 'thumb'), file_field)
+        self.assertIn('decompression bomb', logs.output[0])
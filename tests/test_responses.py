@@ -0,0 +1,54 @@
+import os
+import tempfile
+
+from django.test import RequestFactory, SimpleTestCase
+
+from media_sdk.responses import parse_range_header, ranged_file_response
+
+
+class ParseRangeHeaderTests(SimpleTestCase):
+    def test_absent_or_malformed(self):
+        self.assertIsNone(parse_range_header(None, 10))
+        self.assertIsNone(parse_range_header('items=0-1', 10))
+        self.assertIsNone(parse_range_header('bytes=5-2', 10))
+        self.assertIsNone(parse_range_header('bytes=-', 10))
+
+    def test_ranges(self):
+        self.assertEqual(parse_range_header('bytes=0-4', 10), [(0, 4)])
+        self.assertEqual(parse_range_header('bytes=5-', 10), [(5, 9)])
+        self.assertEqual(parse_range_header('bytes=-3', 10), [(7, 9)])
+        self.assertEqual(parse_range_header('bytes=-30', 10), [(0, 9)])
+        self.assertEqual(parse_range_header('bytes=8-20', 10), [(8, 9)])
+        self.assertEqual(parse_range_header('bytes=0-1,4-5', 10), [(0, 1), (4, 5)])
+
+    def test_unsatisfiable(self):
+        self.assertEqual(parse_range_header('bytes=10-', 10), [])
+        self.assertEqual(parse_range_header('bytes=-0', 10), [])
+
+    def test_empty_file(self):
+        self.assertEqual(parse_range_header('bytes=-5', 0), [])
+        self.assertEqual(parse_range_header('bytes=0-', 0), [])
+        self.assertEqual(parse_range_header('bytes=0-0,-1', 0), [])
+
+
+class RangedFileResponseTests(SimpleTestCase):
+    def response(self, content, header):
+        fd, path = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'wb') as file:
+            file.write(content)
+        request = RequestFactory().get('/', HTTP_RANGE=header)
+        response = ranged_file_response(request, open(path, 'rb'), 'file.txt')
+        self.addCleanup(response.close)
+        return response
+
+    def test_partial_content(self):
+        response = self.response(b'0123456789', 'bytes=-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 5-9/10')
+        self.assertEqual(b''.join(response.streaming_content), b'56789')
+
+    def test_empty_file_is_unsatisfiable(self):
+        response = self.response(b'', 'bytes=-5')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */0')
@@ -0,0 +1,118 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase
+from tusclient.exceptions import TusCommunicationError
+from tusclient.uploader import Uploader
+
+from benchmarks.tus_stub import TusStubHandler, start_tus_stub
+from media_sdk.services.media_storage import TusStorage
+
+KB = 1024
+
+
+def make_content(size: int, seed: bytes = b'') -> bytes:
+    block = hashlib.sha256(seed + str(size).encode()).digest()
+    return (block * (size // len(block) + 1))[:size]
+
+
+class TusStorageTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super(TusStorageTests, cls).setUpClass()
+        cls.server = start_tus_stub()
+        cls.url = 'http://127.0.0.1:%d/files/' % cls.server.server_port
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super(TusStorageTests, cls).tearDownClass()
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='media_sdk_tus_')
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def storage(self, **configs):
+        configs = dict({'url': self.url, 'storing_file': None, 'retries': 0, 'chunk_seconds': 0,
+                        'min_chunk_size': 64 * KB, 'max_chunk_size': 64 * KB}, **configs)
+        return TusStorage(configs)
+
+    def stored(self):
+        with TusStubHandler.lock:
+            return {upload_id: bytes(upload['data']) for upload_id, upload in TusStubHandler.uploads.items()}
+
+    def test_small_save(self):
+        content = make_content(100 * KB)
+        before = self.stored()
+
+        name = self.storage().save('small.bin', ContentFile(content))
+        self.assertTrue(name.endswith('small.bin'))
+        created = {key: data for key, data in self.stored().items() if key not in before}
+        self.assertEqual(list(created.values()), [content])
+
+    def test_parallel_save_concatenates_parts(self):
+        content = make_content(3 * KB * KB)
+        before = self.stored()
+
+        self.storage(parallel_uploads=4, parallel_threshold=KB * KB).save('big.bin', ContentFile(content))
+        created = [data for key, data in self.stored().items() if key not in before]
+        # 4 partial uploads and the final one
+        self.assertEqual(len(created), 5)
+        self.assertIn(content, created)
+        self.assertEqual(b''.join(sorted((data for data in created if data != content),
+                                         key=content.index)), content)
+
+    def test_concurrent_saves(self):
+        storage = self.storage()
+        contents = [make_content(150 * KB, seed=bytes([index])) for index in range(8)]
+        before = self.stored()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            names = list(executor.map(lambda data: storage.save('c.bin', ContentFile(data)), contents))
+        self.assertEqual(len(names), 8)
+        created = [data for key, data in self.stored().items() if key not in before]
+        self.assertCountEqual(created, contents)
+
+    def test_failing_endpoint_raises(self):
+        server = start_tus_stub()
+        url = 'http://127.0.0.1:%d/files/' % server.server_port
+        server.shutdown()
+        server.server_close()
+
+        with self.assertRaises(TusCommunicationError):
+            self.storage(url=url).save('failed.bin', ContentFile(b'data'))
+
+    def test_interrupted_upload_is_resumed(self):
+        storing_file = os.path.join(self.directory, 'urls.json')
+        content = make_content(320 * KB)
+        upload_chunk = Uploader.upload_chunk
+        calls = []
+
+        def counted_upload_chunk(uploader):
+            calls.append(uploader.offset)
+            return upload_chunk(uploader)
+
+        def failing_upload_chunk(uploader):
+            if len(calls) == 2:
+                raise TusCommunicationError('connection lost')
+            return counted_upload_chunk(uploader)
+
+        before = self.stored()
+        with mock.patch.object(Uploader, 'upload_chunk', failing_upload_chunk):
+            with self.assertRaises(TusCommunicationError):
+                self.storage(storing_file=storing_file).save('resumed.bin', ContentFile(content))
+        calls.clear()
+        with mock.patch.object(Uploader, 'upload_chunk', counted_upload_chunk):
+            name = self.storage(storing_file=storing_file).save('other.bin', ContentFile(content))
+
+        # the second save continued the same upload from 128KB under the first name
+        self.assertEqual(calls[0], 128 * KB)
+        self.assertTrue(name.endswith('resumed.bin'))
+        created = [data for key, data in self.stored().items() if key not in before]
+        self.assertEqual(created, [content])
@@ -0,0 +1,161 @@
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from botocore.credentials import Credentials, RefreshableCredentials
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from media_sdk.services import clients
+from media_sdk.services.cache import TTLCache
+from media_sdk.services.url_cache import PresignedUrlCache
+
+
+class Clock:
+    """Drives both time.time and time.monotonic of the cache modules."""
+
+    def __init__(self, test):
+        self.now = 1000000.0
+        for target in ('media_sdk.services.cache.time', 'media_sdk.services.url_cache.time'):
+            patcher = mock.patch(target)
+            module_time = patcher.start()
+            module_time.time.side_effect = lambda: self.now
+            module_time.monotonic.side_effect = lambda: self.now
+            test.addCleanup(patcher.stop)
+
+    def tick(self, seconds):
+        self.now += seconds
+
+
+class TTLCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = Clock(self)
+
+    def test_expiry(self):
+        ttl_cache = TTLCache(ttl=10)
+        ttl_cache.set('a', 1)
+        ttl_cache.set('b', 2, ttl=30)
+        self.clock.tick(9)
+        self.assertEqual(ttl_cache.get('a'), 1)
+        self.clock.tick(1)
+        self.assertIsNone(ttl_cache.get('a'))
+        self.assertEqual(ttl_cache.get('b'), 2)
+        self.assertEqual(len(ttl_cache), 1)
+
+    def test_lru_eviction(self):
+        ttl_cache = TTLCache(ttl=10, max_size=2)
+        ttl_cache.set('a', 1)
+        ttl_cache.set('b', 2)
+        # reading 'a' makes 'b' the least recently used entry
+        ttl_cache.get('a')
+        ttl_cache.set('c', 3)
+        self.assertEqual(ttl_cache.get('a'), 1)
+        self.assertIsNone(ttl_cache.get('b'))
+        self.assertEqual(ttl_cache.get('c'), 3)
+
+    def test_disabled(self):
+        ttl_cache = TTLCache(ttl=10, max_size=0)
+        ttl_cache.set('a', 1)
+        self.assertIsNone(ttl_cache.get('a'))
+        ttl_cache = TTLCache(ttl=10)
+        ttl_cache.set('a', 1, ttl=0)
+        self.assertIsNone(ttl_cache.get('a'))
+
+
+class PresignedUrlCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = Clock(self)
+        self.signed = 0
+
+    def sign(self):
+        self.signed += 1
+        return 'url-%d' % self.signed
+
+    def test_url_dropped_margin_before_expiry(self):
+        url_cache = PresignedUrlCache(expires=100, margin=20)
+        self.assertEqual(url_cache.get_or_sign(('b', 'k', None), self.sign), 'url-1')
+        self.clock.tick(79)
+        self.assertEqual(url_cache.get_or_sign(('b', 'k', None), self.sign), 'url-1')
+        self.clock.tick(1)
+        self.assertEqual(url_cache.get_or_sign(('b', 'k', None), self.sign), 'url-2')
+        self.assertEqual(url_cache.stats(), {'hits': 1, 'shared_hits': 0, 'misses': 2, 'size': 1})
+
+    def test_keys_are_separate(self):
+        url_cache = PresignedUrlCache(expires=100, margin=20)
+        first = url_cache.get_or_sign(('b', 'k', None), self.sign)
+        with_disposition = url_cache.get_or_sign(('b', 'k', 'attachment'), self.sign)
+        self.assertNotEqual(first, with_disposition)
+        self.assertEqual(url_cache.get_or_sign(('b', 'k', None), self.sign), first)
+
+    def test_lru_eviction(self):
+        url_cache = PresignedUrlCache(expires=100, margin=20, max_size=1)
+        url_cache.get_or_sign(('b', 'first', None), self.sign)
+        url_cache.get_or_sign(('b', 'second', None), self.sign)
+        self.assertEqual(url_cache.get_or_sign(('b', 'first', None), self.sign), 'url-3')
+
+    def test_capped_at_credentials_expiry(self):
+        url_cache = PresignedUrlCache(expires=3600, margin=300)
+        valid_until = lambda: self.clock.now + 400
+        url_cache.get_or_sign(('b', 'k', None), self.sign, valid_until)
+        self.clock.tick(99)
+        self.assertEqual(url_cache.get_or_sign(('b', 'k', None), self.sign, valid_until), 'url-1')
+        self.clock.tick(1)
+        self.assertEqual(url_cache.get_or_sign(('b', 'k', None), self.sign, valid_until), 'url-2')
+
+    def test_not_cached_when_credentials_expire_within_margin(self):
+        url_cache = PresignedUrlCache(expires=3600, margin=300)
+        valid_until = lambda: self.clock.now + 200
+        url_cache.get_or_sign(('b', 'k', None), self.sign, valid_until)
+        self.assertEqual(url_cache.get_or_sign(('b', 'k', None), self.sign, valid_until), 'url-2')
+        self.assertEqual(len(url_cache._entries), 0)
+
+    def test_shared_backend(self):
+        self.addCleanup(cache.clear)
+        cache.clear()
+        writer = PresignedUrlCache(expires=100, margin=20, backend='default')
+        reader = PresignedUrlCache(expires=100, margin=20, backend='default')
+        url = writer.get_or_sign(('b', 'k', None), self.sign)
+        self.assertEqual(reader.get_or_sign(('b', 'k', None), self.sign), url)
+        self.assertEqual(reader.stats()['shared_hits'], 1)
+        self.assertEqual(self.signed, 1)
+
+
+class CredentialsExpiryTests(SimpleTestCase):
+    configs = {'region_name': 'eu-west-1'}
+
+    def use_credentials(self, credentials):
+        session = mock.Mock()
+        session.get_credentials.return_value = credentials
+        patcher = mock.patch.dict(clients._sessions, {clients.get_s3_key(self.configs): session})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        logged = mock.patch.object(clients, '_unknown_expiry_logged', set())
+        logged.start()
+        self.addCleanup(logged.stop)
+
+    def refreshable(self, expiry_time):
+        return RefreshableCredentials('key', 'secret', 'token', expiry_time, refresh_using=dict, method='test')
+
+    def test_long_term_keys(self):
+        self.use_credentials(Credentials('key', 'secret'))
+        self.assertIsNone(clients.get_credentials_expiry(self.configs))
+
+    def test_no_client(self):
+        self.assertIsNone(clients.get_credentials_expiry({'region_name': 'nowhere-1'}))
+
+    def test_temporary_credentials(self):
+        expiry_time = datetime.now(timezone.utc) + timedelta(hours=1)
+        self.use_credentials(self.refreshable(expiry_time))
+        self.assertEqual(clients.get_credentials_expiry(self.configs), expiry_time.timestamp())
+
+    def test_unknown_expiry_falls_back_and_logs_once(self):
+        credentials = self.refreshable(datetime.now(timezone.utc))
+        del credentials._expiry_time
+        self.use_credentials(credentials)
+        with mock.patch.object(clients.time, 'time', return_value=1000.0):
+            with self.assertLogs('media_sdk.services.clients', 'WARNING') as logs:
+                self.assertEqual(clients.get_credentials_expiry(self.configs),
+                                 1000.0 + clients.CREDENTIALS_FALLBACK_TTL)
+            self.assertEqual(len(logs.records), 1)
+            with self.assertNoLogs('media_sdk.services.clients', 'WARNING'):
+                expiry = clients.get_credentials_expiry(dict(self.configs, credentials_fallback_ttl=60))
+        self.assertEqual(expiry, 1060.0)